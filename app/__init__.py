@@ -5,6 +5,7 @@ from flask import Flask
 from flask_bootstrap import Bootstrap
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 from app.config import Config, DATABASE_PATH
 
@@ -23,4 +24,13 @@ db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 lock_app = RLock()
 
+
+def _sqlite_on_connect(dbapi_connection, connection_record):
+    # the readers of the web tier do not wait for the job queue writers
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+
+with app.app_context():
+    event.listen(db.engine, "connect", _sqlite_on_connect)
+
 from app import views
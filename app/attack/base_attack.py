@@ -1,23 +1,27 @@
 import argparse
-import shutil
 import tempfile
 import time
 from collections import defaultdict
+from itertools import chain
 from pathlib import Path
-from typing import Union
+from typing import Union, Set, Optional, Dict, List, Tuple
 
 from tqdm import tqdm
 
-from app.attack.convert import split_by_essid
-from app.attack.hashcat_cmd import HashcatCmdCapture, HashcatCmdStdout
-from app.config import ESSID_TRIED
+from app.attack.hashcat_cmd import HashcatCmdCapture, HashcatCmdStdout, run_with_stdin, run_hashcat
+from app.attack.essid_tried import EssidTried
+from app.attack.pmk_table import PmkTable
+from app.attack.potfile import potfile_index, essid_of_outfile
+from app.config import ESSID_BATCH_SIZE, ESSID_BATCH_CANDIDATES
 from app.domain import Rule, WordList, Mask
 from app.logger import logger
-from app.utils import read_plain_key, subprocess_call, bssid_essid_from_22000, \
-    check_file_22000
+from app.utils import read_plain_key, check_file_22000, \
+    bssid_essid_of_line, group_22000_by_essid
 from app.word_magic import create_digits_wordlist, create_fast_wordlists
-from app.word_magic.essid import run_essid_attack
-from app.word_magic.wordlist import WordListDefault
+from app.word_magic.essid import run_essids_attack, essid_candidates
+from app.word_magic.estimate import count_essid_candidates
+from app.word_magic.rule_engine import apply_rules, read_words
+from app.word_magic.wordlist import WordListDefault, scan_wordlists
 
 
 def monitor_timer(func):
@@ -33,70 +37,123 @@ def monitor_timer(func):
     return wrapped
 
 
+def stages_of_keys(keys: Set[str], stages) -> Dict[str, Optional[str]]:
+    """
+    Attribute the keys to the first stage that generates them. The
+    candidates of each stage are re-generated at most once.
+
+    :param stages: (timer name, candidates factory) pairs
+    :return: a dict of key -> timer name or None
+    """
+    keys = set(keys)
+    found_by = dict.fromkeys(keys)
+    for timer_name, candidates_factory in stages:
+        if not keys:
+            break
+        keys_stage = keys.intersection(candidates_factory())
+        found_by.update(dict.fromkeys(keys_stage, timer_name))
+        keys -= keys_stage
+    return found_by
+
+
+def batch_essids(essids: List[Tuple[str, int]], max_candidates=ESSID_BATCH_CANDIDATES,
+                 max_size=ESSID_BATCH_SIZE) -> List[List[str]]:
+    """
+    Batch the ESSIDs, in order, while the candidates of a batch do not exceed
+    `max_candidates`. An ESSID with more candidates is batched alone.
+
+    :param essids: (ESSID, candidates count) pairs
+    """
+    batches = []
+    batch, batch_candidates = [], 0
+    for essid, count in essids:
+        if batch and (batch_candidates + count > max_candidates or len(batch) == max_size):
+            batches.append(batch)
+            batch, batch_candidates = [], 0
+        batch.append(essid)
+        batch_candidates += count
+    if batch:
+        batches.append(batch)
+    return batches
+
+
 def download_wordlists():
     for wlist in WordListDefault.list():
         wlist.download()
     create_digits_wordlist()
     create_fast_wordlists()
+    # persist the exact counts for the runtime estimation
+    scan_wordlists()
 
 
 class BaseAttack:
     timers = defaultdict(lambda: dict(count=0, elapsed=1e-6))
 
-    def __init__(self, file_22000: Union[str, Path], hashcat_args=(), fast=False, verbose=True):
+    def __init__(self, file_22000: Union[str, Path], hashcat_args=(), fast=False, verbose=True, fused=False):
         """
         :param file_22000: .22000 hashcat capture file path
         :param fast: ESSID+digits fast or long attack
         :param verbose: show (True) or hide (False) tqdm
+        :param fused: run all stages of `run_all` in a single hashcat process
         """
         check_file_22000(file_22000)
         self.file_22000 = Path(file_22000).absolute()
         self.hashcat_args = tuple(hashcat_args)
         self.fast = fast
         self.verbose = verbose
+        self.fused = fused
+        self.found_by = {}  # the stage that cracked each key in the fused mode
         self.key_file = self.file_22000.with_suffix('.key')
         self.session = self.file_22000.name
+        # hashcat runs are stopped once the lock, if any, is cancelled
+        self.lock = None
 
-    def new_cmd(self, hcap_file: Union[str, Path] = None):
+    def new_cmd(self, hcap_file: Union[str, Path] = None, outfile: Union[str, Path] = None, session: str = None):
         if hcap_file is None:
             hcap_file = self.file_22000
-        return HashcatCmdCapture(hcap_file=hcap_file, outfile=self.key_file, hashcat_args=self.hashcat_args,
-                                 session=self.session)
+        if outfile is None:
+            outfile = self.key_file
+        if session is None:
+            session = self.session
+        return HashcatCmdCapture(hcap_file=hcap_file, outfile=outfile, hashcat_args=self.hashcat_args,
+                                 session=session)
+
+    def essids_untried(self, essid_tried: EssidTried):
+        """
+        :return: (ESSID, hash lines of BSSID/ESSID pairs that have not been tried yet) pairs
+        """
+        essids_untried = []
+        for essid_hex, lines in group_22000_by_essid(self.file_22000).items():
+            tried = essid_tried.tried(map(bssid_essid_of_line, lines), fast=self.fast)
+            lines = [line for line in lines if bssid_essid_of_line(line) not in tried]
+            if lines:
+                essid = bytes.fromhex(essid_hex).decode('utf-8')
+                essids_untried.append((essid, lines))
+        return essids_untried
 
     def run_essid_attack(self):
         """
         Run ESSID + digits_append.txt combinator attack.
         Run ESSID + best64.rule attack.
+        The ESSIDs with few candidates are attacked in a single hashcat run,
+        see `batch_essids`.
         """
-        ESSID_TRIED.parent.mkdir(parents=True, exist_ok=True)
-        split_by_essid_dir = Path(tempfile.mkdtemp())
-
-        bssid_essid_tried = set()
-        if ESSID_TRIED.exists():
-            with open(ESSID_TRIED, 'r') as f:
-                bssid_essid_tried = set(f.read().splitlines())
-
-        bssid_essid_pairs = tuple(bssid_essid_from_22000(self.file_22000))
-        if len(bssid_essid_pairs) > 1:
-            split_by_essid(self.file_22000, to_folder=split_by_essid_dir)
-            files_split_by_essid = list(split_by_essid_dir.iterdir())
-        else:
-            files_split_by_essid = [self.file_22000]
-
-        for hcap_fpath_essid in tqdm(files_split_by_essid, desc="ESSID attack",
-                                     disable=not self.verbose):
-            bssid_essid = next(bssid_essid_from_22000(hcap_fpath_essid))
-            if bssid_essid in bssid_essid_tried:
-                continue
-            bssid, essid = bssid_essid.split(':')
-            essid = bytes.fromhex(essid).decode('utf-8')
-            hashcat_cmd = self.new_cmd(hcap_file=hcap_fpath_essid)
-            run_essid_attack(essid=essid, hashcat_cmd=hashcat_cmd,
-                             fast=self.fast)
-
-            with open(ESSID_TRIED, 'a') as f:
-                f.write(bssid_essid + '\n')
-        shutil.rmtree(split_by_essid_dir)
+        essid_tried = EssidTried()
+        essids_untried = dict(self.essids_untried(essid_tried))
+        # the counted candidates are cached and read again by the attack
+        counts = [(essid, count_essid_candidates(essid, fast=self.fast)) for essid in essids_untried]
+        batches = [[(essid, essids_untried[essid]) for essid in batch] for batch in batch_essids(counts)]
+        with tempfile.TemporaryDirectory() as batch_dir:
+            for batch_id, batch in enumerate(tqdm(batches, desc="ESSID attack",
+                                                  disable=not self.verbose)):
+                lines = [line for essid, essid_lines in batch for line in essid_lines]
+                hcap_fpath_batch = Path(batch_dir) / f"essid_batch_{batch_id}.22000"
+                hcap_fpath_batch.write_text('\n'.join(lines) + '\n')
+                hashcat_cmd = self.new_cmd(hcap_file=hcap_fpath_batch)
+                run_essids_attack(essids=[essid for essid, essid_lines in batch],
+                                  hashcat_cmd=hashcat_cmd, fast=self.fast, lock=self.lock)
+
+                essid_tried.add(map(bssid_essid_of_line, lines), fast=self.fast)
 
     @monitor_timer
     def run_digits8(self):
@@ -107,9 +164,11 @@ class BaseAttack:
         For more information refer to `digits/create_digits.py`
         """
         create_digits_wordlist()
+        if self.run_pmk_table(WordList.DIGITS_8):
+            return
         hashcat_cmd = self.new_cmd()
         hashcat_cmd.add_wordlists(WordList.DIGITS_8)
-        subprocess_call(hashcat_cmd.build())
+        run_hashcat(hashcat_cmd, lock=self.lock)
 
     @monitor_timer
     def run_top1k(self):
@@ -117,34 +176,161 @@ class BaseAttack:
         - Top1575-probable-v2.txt with best64 rules
         """
         create_fast_wordlists()
+        if self.run_pmk_table(WordList.TOP1K_RULE_BEST64):
+            return
         hashcat_cmd = self.new_cmd()
         hashcat_cmd.add_wordlists(WordList.TOP1K_RULE_BEST64)
-        subprocess_call(hashcat_cmd.build())
+        run_hashcat(hashcat_cmd, lock=self.lock)
 
     @monitor_timer
     def run_phone_mobile(self):
         # EXCLUDED
         hashcat_cmd = self.new_cmd()
         hashcat_cmd.set_mask(Mask.MOBILE_UA)
-        subprocess_call(hashcat_cmd.build())
+        run_hashcat(hashcat_cmd, lock=self.lock)
 
     @monitor_timer
     def run_keyboard_walk(self):
         hashcat_cmd = self.new_cmd()
         hashcat_cmd.add_wordlists(WordList.KEYBOARD_WALK)
-        subprocess_call(hashcat_cmd.build())
+        run_hashcat(hashcat_cmd, lock=self.lock)
+
+    @staticmethod
+    def names_candidates():
+        names = chain(read_words(WordList.NAMES_UA_RU.path),
+                      read_words(WordList.NAMES_RU_CYRILLIC.path))
+        return apply_rules(names, Rule.ESSID)
 
     @monitor_timer
     def run_names(self):
-        with tempfile.NamedTemporaryFile(mode='w') as f:
-            hashcat_stdout = HashcatCmdStdout(outfile=f.name)
-            hashcat_stdout.add_wordlists(WordList.NAMES_UA_RU,
-                                         WordList.NAMES_RU_CYRILLIC)
-            hashcat_stdout.add_rule(Rule(Rule.ESSID))
-            subprocess_call(hashcat_stdout.build())
-            hashcat_cmd = self.new_cmd()
-            hashcat_cmd.add_wordlists(f.name)
-            subprocess_call(hashcat_cmd.build())
+        hashcat_cmd = self.new_cmd()
+        run_with_stdin(hashcat_cmd, self.names_candidates(), lock=self.lock)
+
+    def run_fused(self):
+        """
+        Run the stages of `run_all` in a single hashcat process, which pays
+        for the device initialization and autotune only once. The
+        candidates of the stages are fed to stdin one stage after another.
+
+        Unlike `run_essid_attack`, the ESSID candidates are checked against
+        all hashes, which costs nothing for a single ESSID capture.
+        The cracked keys are attributed to the first stage that generates
+        them and stored in `found_by`.
+        """
+        create_digits_wordlist()
+        create_fast_wordlists()
+        essid_tried = EssidTried()
+        essids_untried = self.essids_untried(essid_tried)
+        essids = [essid for essid, lines in essids_untried]
+        fast = self.fast
+
+        # (timer name, candidates factory) of each stage in the order of `stages`
+        stages = [("run_top1k", lambda: read_words(WordList.TOP1K_RULE_BEST64.path)),
+                  ("run_digits8", lambda: read_words(WordList.DIGITS_8.path)),
+                  ("run_keyboard_walk", lambda: read_words(WordList.KEYBOARD_WALK.path)),
+                  ("run_essid_attack",
+                   lambda: chain.from_iterable(essid_candidates(essid, fast=fast) for essid in essids)),
+                  ("run_names", self.names_candidates)]
+        stages_elapsed = defaultdict(float)
+        last_stage_end = None
+
+        # the wordlists with PMK tables are attacked in the 22001 mode beforehand
+        pmk_stages = set()
+        for timer_name, wordlist in (("run_top1k", WordList.TOP1K_RULE_BEST64), ("run_digits8", WordList.DIGITS_8)):
+            keys_before = self.read_keys()
+            start = time.time()
+            if self.run_pmk_table(wordlist):
+                pmk_stages.add(timer_name)
+                stages_elapsed[timer_name] += time.time() - start
+                for key in self.read_keys() - keys_before:
+                    self.found_by[key] = timer_name
+        stages = [(timer_name, candidates_factory) for timer_name, candidates_factory in stages
+                  if timer_name not in pmk_stages]
+
+        def timed(timer_name, candidates):
+            # hashcat consumes the candidates as fast as it hashes them,
+            # therefore the feeding time of a stage is its hashing time
+            nonlocal last_stage_end
+            start = time.time()
+            yield from candidates
+            last_stage_end = time.time()
+            stages_elapsed[timer_name] += last_stage_end - start
+
+        keys_before = self.read_keys()
+        candidates = chain.from_iterable(timed(timer_name, candidates_factory())
+                                         for timer_name, candidates_factory in stages)
+        run_with_stdin(self.new_cmd(), candidates, lock=self.lock)
+        if last_stage_end is not None:
+            # hashcat is done with the candidates it has buffered
+            stages_elapsed[stages[-1][0]] += time.time() - last_stage_end
+        for timer_name, elapsed_sec in stages_elapsed.items():
+            timer = BaseAttack.timers[timer_name]
+            timer['count'] += 1
+            timer['elapsed'] += elapsed_sec
+
+        essid_tried.add((bssid_essid_of_line(line) for essid, lines in essids_untried for line in lines),
+                        fast=self.fast)
+        for key, stage in stages_of_keys(self.read_keys() - keys_before, stages).items():
+            self.found_by[key] = stage
+            logger.info(f"Key '{key}' is found by {stage}")
+
+    def pmk_table(self, wordlist: WordList) -> Optional[PmkTable]:
+        """
+        :return: the PMK table of the capture ESSID or None
+        """
+        essids = group_22000_by_essid(self.file_22000)
+        if len(essids) != 1:
+            # a table is precomputed for a single ESSID
+            return None
+        essid = bytes.fromhex(next(iter(essids))).decode('utf-8')
+        table = PmkTable(essid, wordlist.path)
+        if not table.is_valid():
+            return None
+        return table
+
+    def run_pmk_table(self, wordlist: WordList) -> bool:
+        """
+        Attack with the precomputed PMKs of a wordlist in the 22001 mode if
+        the capture ESSID has a PMK table.
+
+        :return: whether the table has been used
+        """
+        table = self.pmk_table(wordlist)
+        if table is None:
+            return False
+        pmk_key_file = self.key_file.with_suffix('.pmk')
+        hashcat_cmd = self.new_cmd(outfile=pmk_key_file)
+        hashcat_cmd.mode = '22001'
+        # the potfile would map the hashes to the PMKs instead of the keys
+        hashcat_cmd.hashcat_args = (*hashcat_cmd.hashcat_args, '--potfile-disable')
+        run_with_stdin(hashcat_cmd, table.iter_pmks_hex(), lock=self.lock)
+        if not pmk_key_file.exists():
+            return True
+        with open(pmk_key_file) as f:
+            lines = f.read().splitlines()
+        pmk_key_file.unlink()
+        with open(self.key_file, 'a', errors='surrogateescape') as f:
+            for line in lines:
+                mic, mac_ap, mac_sta, essid_pmk = line.split(':', maxsplit=3)
+                essid, pmk_hex = essid_pmk.rsplit(':', maxsplit=1)
+                key = table.password(pmk_hex)
+                if key is None:
+                    # the table has been updated during the run
+                    logger.warning(f"PMK {pmk_hex} is not in the table of '{table.essid}'")
+                    continue
+                f.write(f"{mic}:{mac_ap}:{mac_sta}:{essid}:{key}\n")
+                potfile_index.append(f"{mic}*{mac_ap}*{mac_sta}*{essid_of_outfile(essid).hex()}", key)
+        return True
+
+    def read_keys(self) -> Set[str]:
+        """
+        :return: the passwords in the key file
+        """
+        if not self.key_file.exists():
+            return set()
+        with open(self.key_file, errors='surrogateescape') as f:
+            # hash:mac_ap:mac_sta:essid:password; the password might have a ':'
+            return {line.split(':', maxsplit=4)[-1] for line in f.read().splitlines()}
 
     @monitor_timer
     def run_names_with_digits(self):
@@ -158,21 +344,30 @@ class BaseAttack:
                 for rule_names in ['', 'T0', 'u']:
                     hashcat_stdout = HashcatCmdStdout(outfile=f.name)
                     hashcat_stdout.add_wordlists(*wordlist_order, options=['-a1', f'--rule-{left}={rule_names}'])
-                    subprocess_call(hashcat_stdout.build())
+                    run_hashcat(hashcat_stdout, lock=self.lock)
                 wordlist_order = wordlist_order[::-1]
         hashcat_cmd = self.new_cmd()
         hashcat_cmd.add_wordlists(WordList.NAMES_UA_RU_WITH_DIGITS)
-        subprocess_call(hashcat_cmd.build())
+        run_hashcat(hashcat_cmd, lock=self.lock)
+
+    def stages(self):
+        """
+        :return: (name, attack) pairs in the order of `run_all`
+        """
+        if self.fused:
+            return [("fused", self.run_fused)]
+        return [("top1k", self.run_top1k),
+                ("digits8", self.run_digits8),
+                ("keyboard_walk", self.run_keyboard_walk),
+                ("essid", self.run_essid_attack),
+                ("names", self.run_names)]
 
     def run_all(self):
         """
         Run all attacks.
         """
-        self.run_top1k()
-        self.run_digits8()
-        self.run_keyboard_walk()
-        self.run_essid_attack()
-        self.run_names()
+        for name, attack in self.stages():
+            attack()
 
 
 def crack_22000():
@@ -184,10 +379,11 @@ def crack_22000():
     parser.add_argument('capture', help='path to .22000')
     parser.add_argument('--fast', help='Run ESSID+digits attack with fewer examples. Default: turned off', action='store_true')
     parser.add_argument('--extra', help='Run extra attacks (names UA)', action='store_true')
+    parser.add_argument('--fused', help='Run all attacks in a single hashcat process', action='store_true')
     args, hashcat_args = parser.parse_known_args()
     print(f"Hashcat args: {hashcat_args}, fast={args.fast}, extra={args.extra}")
     attack = BaseAttack(file_22000=args.capture, hashcat_args=hashcat_args,
-                        fast=args.fast)
+                        fast=args.fast, fused=args.fused)
     attack.run_all()
     if args.extra:
         print("Running extra run_names_with_digits attack")
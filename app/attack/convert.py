@@ -1,10 +1,15 @@
-import os
 from pathlib import Path
 import re
+import shutil
+import struct
+from typing import Dict, List
 
+from app.attack.pcap import iter_22000_lines
+from app.config import NATIVE_PCAP_CONVERTER
 from app.logger import logger
 from app.domain import InvalidFileError
-from app.utils import subprocess_call, check_file_22000, calculate_md5
+from app.utils import subprocess_call, check_file_22000, calculate_md5, Capture22000, Hash22000, \
+    bssid_essid_from_22000
 
 
 def convert_to_22000(capture_path):
@@ -19,7 +24,7 @@ def convert_to_22000(capture_path):
             raise FileNotFoundError(f"{cmd[0]} failed")
 
     if re.fullmatch("\.(p?cap|pcapng)", capture_path.suffix, flags=re.IGNORECASE):
-        convert_and_verify(['hcxpcapngtool', '-o', str(file_22000), str(capture_path)])
+        _convert_pcap(capture_path, file_22000)
         capture_path = file_22000
 
     # TODO: add support for 22001 (2501, 16801) modes
@@ -33,20 +38,102 @@ def convert_to_22000(capture_path):
     return file_22000
 
 
-def split_by_essid(file_22000, to_folder=None):
+def _convert_native(capture_path: Path) -> List[str]:
+    # compressed, malformed and unusual captures, including the captures
+    # with packets of an unsupported link type, are left to hcxpcapngtool
+    try:
+        return list(iter_22000_lines(capture_path))
+    except (InvalidFileError, struct.error) as error:
+        logger.debug(f"{capture_path}: {error}")
+        return []
+
+
+def _convert_pcap(capture_path: Path, file_22000: Path):
+    # the native extractor pairs the EAPOL messages more strictly than
+    # hcxpcapngtool, therefore the lines of hcxpcapngtool are merged in
+    # whenever it is installed
+    lines = _convert_native(capture_path) if NATIVE_PCAP_CONVERTER else []
+    if not lines or shutil.which('hcxpcapngtool') is not None:
+        file_hcx = file_22000.with_suffix('.hcx.22000')
+        subprocess_call(['hcxpcapngtool', '-o', str(file_hcx), str(capture_path)])
+        if file_hcx.exists():
+            lines.extend(file_hcx.read_text().splitlines())
+            file_hcx.unlink()
+        elif not lines:
+            raise FileNotFoundError("hcxpcapngtool failed")
+    with open(file_22000, 'w') as f:
+        f.writelines(f"{line}\n" for line in dict.fromkeys(filter(None, lines)))
+
+
+def split_by_essid(file_22000, to_folder=None, checksum: str = None) -> Dict[Path, List[Hash22000]]:
+    """
+    Split a 22000 file in files of a single ESSID, dropping the duplicate
+    hash lines.
+
+    :param checksum: the checksum of the uploaded capture that names the
+                     default folder; the 22000 file is hashed if not set
+    :return: a dict of the ESSID file -> its hashes
+    """
     file_22000 = Path(file_22000)
     check_file_22000(file_22000)
+    capture = Capture22000.read(file_22000)
     if to_folder is None:
-        checksum = calculate_md5(file_22000)
+        if checksum is None:
+            checksum = calculate_md5(file_22000)
         to_folder = Path(f"{file_22000.with_suffix('')}_{checksum}")
         if to_folder.exists():
             # should never happen
             logger.warning(f"{to_folder} already exists")
+    to_folder = Path(to_folder)
     to_folder.mkdir(exist_ok=True)
+    if capture.duplicates:
+        logger.info(f"Dropped {capture.duplicates} duplicate hash lines of {file_22000}")
+
+    files_essid = {}
+    for essid, hashes in capture.by_essid.items():
+        file_essid = to_folder / f"{essid}.22000"
+        with open(file_essid, 'w') as f:
+            f.writelines(f"{hash_22000.line}\n" for hash_22000 in hashes)
+        files_essid[file_essid] = hashes
+    return files_essid
 
-    curdir = os.getcwd()
-    os.chdir(to_folder)
-    subprocess_call(['hcxhashtool', '-i', file_22000, '--essid-group'])
-    os.chdir(curdir)
 
-    return to_folder
+if __name__ == '__main__':
+    import random
+    import tempfile
+    import time
+    n_lines, n_essids, duplicates = 100_000, 1000, 0.1
+    random.seed(0)
+    essids = [f"essid_{i}".encode().hex() for i in range(n_essids)]
+    lines = []
+    for i in range(int(n_lines * (1 - duplicates))):
+        bssid, essid = f"{random.randrange(2 ** 48):012x}", random.choice(essids)
+        if i % 2:
+            lines.append(f"WPA*01*{random.randrange(2 ** 128):032x}*{bssid}*{i:012x}*{essid}***")
+        else:
+            eapol = f"{random.randrange(2 ** 960):0240x}"
+            lines.append(f"WPA*02*{random.randrange(2 ** 128):032x}*{bssid}*{i:012x}*{essid}*"
+                         f"{random.randrange(2 ** 256):064x}*{eapol}*02")
+    # duplicates: the same PMKID and the same EAPOL of a different message pair
+    lines.extend(line if line.startswith("WPA*01") else line[:-2] + "82"
+                 for line in random.sample(lines, n_lines - len(lines)))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        capture_path = Path(tmpdir) / "synthetic.22000"
+        capture_path.write_text('\n'.join(lines) + '\n')
+        size_mb = capture_path.stat().st_size / 2 ** 20
+        start = time.time()
+        capture = Capture22000.read(capture_path)
+        elapsed = time.time() - start
+        print(f"Indexed {n_lines} lines ({size_mb:.1f} MB) in {elapsed:.2f} sec: "
+              f"{len(capture.hashes)} unique, {len(capture.by_essid)} ESSIDs, {len(capture.by_bssid)} BSSIDs, "
+              f"message pairs {sorted(capture.by_message_pair)}")
+        start = time.time()
+        files_essid = split_by_essid(capture_path, to_folder=Path(tmpdir) / "split")
+        elapsed = time.time() - start
+        print(f"Read and split in {len(files_essid)} ESSID files in {elapsed:.2f} sec")
+        assert capture.duplicates == n_lines * duplicates
+        assert sum(map(len, files_essid.values())) == len(capture.hashes)
+        start = time.time()
+        for file_essid in files_essid:
+            next(bssid_essid_from_22000(file_essid))
+        print(f"Read the BSSID:ESSID of each ESSID file (as before) in {time.time() - start:.2f} sec")
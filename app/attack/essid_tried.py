@@ -0,0 +1,100 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Set
+
+from app.config import ESSID_TRIED, ESSID_TRIED_DB
+from app.logger import logger
+
+STAGE_ESSID = "essid"
+
+
+class EssidTried:
+    """
+    Indexed store of the BSSID:ESSID pairs that have already been attacked.
+    Each process and thread opens its own SQLite connection; SQLite serializes
+    concurrent writers.
+    """
+
+    def __init__(self, db_path: Path = ESSID_TRIED_DB, legacy_path: Path = ESSID_TRIED):
+        self.db_path = Path(db_path)
+        self.legacy_path = Path(legacy_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS essid_tried (
+                                bssid TEXT NOT NULL,
+                                essid TEXT NOT NULL,
+                                stage TEXT NOT NULL,
+                                fast INTEGER NOT NULL,
+                                tried_at REAL NOT NULL,
+                                PRIMARY KEY (bssid, essid, stage, fast)
+                            ) WITHOUT ROWID""")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.import_legacy()
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def import_legacy(self):
+        """
+        Import the legacy flat `bssid:essid_hex` file once.
+        The legacy file did not record the mode: the pairs are imported as
+        tried in the long mode, which is how they were treated before.
+        """
+        if not self.legacy_path.exists():
+            return
+        with self.connect() as conn:
+            # take the write lock before checking to import only once
+            conn.execute("BEGIN IMMEDIATE")
+            imported = conn.execute("SELECT value FROM meta WHERE key = 'legacy_imported'").fetchone()
+            if imported is not None:
+                return
+            tried_at = self.legacy_path.stat().st_mtime
+            with open(self.legacy_path) as f:
+                pairs = set(filter(None, f.read().splitlines()))
+            conn.executemany("INSERT OR IGNORE INTO essid_tried VALUES (?, ?, ?, 0, ?)",
+                             ((*self._split(pair), STAGE_ESSID, tried_at) for pair in pairs))
+            conn.execute("INSERT INTO meta VALUES ('legacy_imported', ?)", (str(time.time()),))
+        logger.info(f"Imported {len(pairs)} tried BSSID:ESSID pairs from {self.legacy_path}")
+
+    @staticmethod
+    def _split(bssid_essid: str):
+        bssid, essid = bssid_essid.split(':')
+        return bssid, essid
+
+    def is_tried(self, bssid_essid: str, stage=STAGE_ESSID, fast=False) -> bool:
+        """
+        A pair is tried in the fast mode if it has been tried in either mode.
+        The long mode is a superset of the fast mode.
+        """
+        return bool(self.tried({bssid_essid}, stage=stage, fast=fast))
+
+    def tried(self, bssid_essid_pairs: Iterable[str], stage=STAGE_ESSID, fast=False) -> Set[str]:
+        """
+        :return: the subset of `bssid_essid_pairs` that has already been tried
+        """
+        if fast:
+            query = "SELECT 1 FROM essid_tried WHERE bssid = ? AND essid = ? AND stage = ? LIMIT 1"
+        else:
+            query = "SELECT 1 FROM essid_tried WHERE bssid = ? AND essid = ? AND stage = ? AND fast = 0"
+        tried = set()
+        with self.connect() as conn:
+            for bssid_essid in set(bssid_essid_pairs):
+                if conn.execute(query, (*self._split(bssid_essid), stage)).fetchone() is not None:
+                    tried.add(bssid_essid)
+        return tried
+
+    def add(self, bssid_essid_pairs: Iterable[str], stage=STAGE_ESSID, fast=False):
+        tried_at = time.time()
+        with self.connect() as conn:
+            conn.executemany("""INSERT INTO essid_tried VALUES (?, ?, ?, ?, ?)
+                                ON CONFLICT (bssid, essid, stage, fast) DO UPDATE SET tried_at = excluded.tried_at""",
+                             ((*self._split(pair), stage, int(fast), tried_at) for pair in set(bssid_essid_pairs)))
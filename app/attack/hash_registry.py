@@ -0,0 +1,101 @@
+"""
+The registry of the hash lines of all uploads.
+
+The same handshake is uploaded many times: by different users, in
+re-captures and in merged captures. The registry maps the hash of each line
+(see `hash_id_of_line`) to the tasks that uploaded it, and marks the task
+that cracks it. A hash line that is being cracked by another task is not
+cracked again: a task of such lines only attaches to the task that cracks
+them and takes its result.
+"""
+
+from collections import Counter
+from typing import Dict, Iterable, List
+
+from sqlalchemy import select
+
+from app import app, db, lock_app
+from app.attack.potfile import potfile_index, hash_id_of_line
+from app.domain import TaskInfoStatus
+from app.uploader import UploadedTask
+
+
+class HashLine(db.Model):
+    __tablename__ = "hash_lines"
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('uploads.id'), index=True)
+    hash_id = db.Column(db.String(512), index=True)  # PMKID/MIC*MACAP*MACSTA*ESSID
+    line = db.Column(db.Text)
+    owner = db.Column(db.Boolean, default=False)  # the task cracks the line
+
+
+def register(task_id: int, lines: Iterable[str], owned: Iterable[str]):
+    """
+    Add the hash lines of a task to the session.
+
+    :param owned: the lines that the task cracks
+    """
+    owned = set(owned)
+    db.session.add_all(HashLine(task_id=task_id, hash_id=hash_id_of_line(line), line=line, owner=line in owned)
+                       for line in lines)
+
+
+def in_flight_owners(lines: Iterable[str]) -> Dict[str, int]:
+    """
+    :return: a dict of the hash lines cracked by the incomplete tasks -> task ID
+    """
+    hash_ids = {hash_id_of_line(line): line for line in lines}
+    query = select(HashLine.hash_id, HashLine.task_id).join(UploadedTask, UploadedTask.id == HashLine.task_id) \
+        .where(HashLine.hash_id.in_(hash_ids), HashLine.owner, UploadedTask.completed.is_(False))
+    return {hash_ids[hash_id]: task_id for hash_id, task_id in db.session.execute(query)}
+
+
+def most_common_owner(owners: Dict[str, int]) -> int:
+    return Counter(owners.values()).most_common(1)[0][0]
+
+
+def task_hash_lines(task_id: int) -> List[str]:
+    """
+    :return: all hash lines of a task, including the ones cracked by other tasks
+    """
+    return list(db.session.scalars(select(HashLine.line).where(HashLine.task_id == task_id)))
+
+
+def resolve_attached(task_id: int) -> List[int]:
+    """
+    Complete the tasks attached to a completed task with the keys of their
+    hash lines. If the task has not cracked them (it was cancelled or
+    aborted), the attached tasks become the owners of their lines.
+
+    :return: the IDs of the attached tasks to crack
+    """
+    with lock_app, app.app_context():
+        task = UploadedTask.query.get(task_id)
+        if task is None or not task.completed:
+            return []
+        crack = []
+        for attached in UploadedTask.query.filter_by(duplicate_of=task_id, completed=False):
+            found_key = potfile_index.found_key(task_hash_lines(attached.id))
+            if found_key is not None or task.status == TaskInfoStatus.COMPLETED:
+                attached.found_key = found_key
+                attached.status = TaskInfoStatus.COMPLETED
+                attached.completed = True
+            else:
+                attached.duplicate_of = None
+                attached.status = TaskInfoStatus.SCHEDULED
+                HashLine.query.filter_by(task_id=attached.id).update(dict(owner=True))
+                crack.append(attached.id)
+        db.session.commit()
+        return crack
+
+
+def cancel_attached(task_id: int) -> bool:
+    """
+    :return: whether the task was attached to another task and has been cancelled
+    """
+    with lock_app, app.app_context():
+        cancelled = UploadedTask.query.filter(UploadedTask.id == task_id, UploadedTask.duplicate_of.is_not(None),
+                                              UploadedTask.completed.is_(False)) \
+            .update(dict(status=TaskInfoStatus.CANCELLED, completed=True))
+        db.session.commit()
+        return cancelled > 0
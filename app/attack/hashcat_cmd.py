@@ -1,12 +1,16 @@
 import os
 import shlex
 import subprocess
+import threading
 import time
 from pathlib import Path
-from typing import Union, List
+from typing import Union, List, Iterable, Iterator, Optional, Callable
 
+from app.attack.status import parse_status_line, HashcatStatus
+from app.attack.supervisor import supervise, encode_candidates
 from app.config import HASHCAT_STATUS_TIMER
-from app.domain import Rule, WordList, ProgressLock, TaskInfoStatus, Mask, HashcatMode
+from app.domain import Rule, WordList, ProgressLock, Mask, HashcatMode
+from app.logger import logger
 
 HASHCAT_WARNINGS = (
     "nvmlDeviceGetCurrPcieLinkWidth",
@@ -41,8 +45,8 @@ def split_warnings_errors(stderr: str):
 
 
 class HashcatCmd:
-    def __init__(self, outfile: Union[str, Path], mode='22000', hashcat_args=(), session=None):
-        self.outfile = str(outfile)
+    def __init__(self, outfile: Optional[Union[str, Path]] = None, mode='22000', hashcat_args=(), session=None):
+        self.outfile = outfile
         self.mode = mode
         self.session = session
         self.rules = []
@@ -56,7 +60,8 @@ class HashcatCmd:
             if rule is not None:
                 rule_path = str(rule.path)
                 command.append("--rules={}".format(shlex.quote(rule_path)))
-        command.append("--outfile={}".format(shlex.quote(self.outfile)))
+        if self.outfile is not None:
+            command.append("--outfile={}".format(shlex.quote(str(self.outfile))))
         if self.session is not None:
             command.append("--session={}".format(shlex.quote(self.session)))
         self._populate_class_specific(command)
@@ -64,6 +69,7 @@ class HashcatCmd:
             # masks are not compatible with wordlists
             command.extend(['-a3', self.mask])
         else:
+            # no wordlists means reading the candidates from stdin
             for word_list in self.wordlists:
                 command.append(shlex.quote(word_list))
         command.append("--force")
@@ -103,39 +109,114 @@ class HashcatCmdCapture(HashcatCmd):
         command.append(self.hcap_file)
 
 
+class HashcatCmdRestore:
+    """
+    Continue an interrupted hashcat session. The original command options
+    are read from the restore file.
+    """
+
+    def __init__(self, session: str, restore_file_path: Union[str, Path]):
+        self.session = session
+        self.restore_file_path = restore_file_path
+
+    def build(self) -> List[str]:
+        return ["hashcat", "--session={}".format(shlex.quote(self.session)), "--restore",
+                "--restore-file-path={}".format(shlex.quote(str(self.restore_file_path)))]
+
+
 class HashcatCmdStdout(HashcatCmd):
     def _populate_class_specific(self, command: List[str]):
         command.append('--stdout')
 
 
-def run_with_status(hashcat_cmd: HashcatCmdCapture, lock: ProgressLock, timeout_minutes=None):
-    if timeout_minutes is None:
-        timeout_minutes = float('inf')
-    timeout_seconds = timeout_minutes * 60
-    start = time.time()
-    hashcat_cmd_list = hashcat_cmd.build()
-    process = subprocess.Popen(hashcat_cmd_list,
-                               universal_newlines=True,
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE)
-    for line in iter(process.stdout.readline, ''):
-        with lock:
-            if lock.cancelled:
-                process.terminate()
-                raise InterruptedError(TaskInfoStatus.CANCELLED)
-        time_spent = time.time() - start
-        if time_spent > timeout_seconds:
+def run_with_status(hashcat_cmd: HashcatCmdCapture, lock: ProgressLock, timeout_minutes=None, devices=(),
+                    on_status: Callable[[HashcatStatus], None] = None):
+    """
+    :param devices: the IDs of the devices the command runs on
+    :param on_status: called with each parsed hashcat status
+    """
+    deadline = None
+    if timeout_minutes is not None:
+        deadline = time.monotonic() + timeout_minutes * 60
+
+    def on_line(line: str):
+        try:
+            status = parse_status_line(line, devices=devices)
+        except ValueError as error:
+            # ignore this update
+            logger.debug(error)
+            return
+        if status is not None:
+            with lock:
+                lock.progress = status.progress
+            if on_status is not None:
+                on_status(status)
+
+    try:
+        supervise(hashcat_cmd.build(), lock=lock, deadline=deadline, on_line=on_line)
+    except TimeoutError:
+        raise TimeoutError(f"Timed out after {timeout_minutes} minutes")
+
+
+def run_hashcat(hashcat_cmd: HashcatCmd, lock: ProgressLock = None):
+    """
+    Run a hashcat command until it exits or the lock is cancelled.
+
+    :return: hashcat stdout and stderr
+    """
+    return supervise(hashcat_cmd.build(), lock=lock)
+
+
+def _feed_stdin(process: subprocess.Popen, candidates: Iterable[str]):
+    try:
+        for data in encode_candidates(iter(candidates)):
+            process.stdin.write(data)
+    except BrokenPipeError:
+        # hashcat exited earlier, for example, when all hashes are cracked
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+def run_with_stdin(hashcat_cmd: HashcatCmd, candidates: Iterable[str], lock: ProgressLock = None):
+    """
+    Run a hashcat command that reads password candidates from stdin.
+    Hashcat starts cracking while the candidates are still being generated.
+
+    :param hashcat_cmd: hashcat command without wordlists
+    :param candidates: an iterable of password candidates
+    :param lock: the candidates feeding and hashcat stop once the lock is cancelled
+    :return: hashcat stdout and stderr
+    """
+    if hashcat_cmd.wordlists or hashcat_cmd.mask is not None:
+        raise ValueError("Hashcat stdin mode is not compatible with wordlists and masks")
+    return supervise(hashcat_cmd.build(), candidates=candidates, lock=lock)
+
+
+def iter_hashcat_stdout(hashcat_cmd: HashcatCmdStdout, words: Iterable[str] = None) -> Iterator[str]:
+    """
+    Lazily read the candidates from a `hashcat --stdout` command.
+
+    :param hashcat_cmd: hashcat stdout command without an outfile
+    :param words: base words to feed to stdin if the command has no wordlists
+    """
+    if hashcat_cmd.outfile is not None:
+        raise ValueError("Hashcat stdout command must not have an outfile")
+    args = hashcat_cmd.build()
+    logger.debug(">>> {}".format(' '.join(args)))
+    stdin = subprocess.PIPE if words is not None else subprocess.DEVNULL
+    process = subprocess.Popen(args, stdin=stdin, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+    if words is not None:
+        threading.Thread(target=_feed_stdin, args=(process, words), daemon=True).start()
+    try:
+        for line in process.stdout:
+            yield line.rstrip(b'\n').decode('utf-8', errors='surrogateescape')
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
             process.terminate()
-            raise TimeoutError(f"Timed out after {timeout_minutes} minutes")
-        if line.startswith("STATUS"):
-            parts = line.split()
-            try:
-                progress_index = parts.index("PROGRESS")
-                tried_keys = parts[progress_index + 1]
-                total_keys = parts[progress_index + 2]
-                progress = 100. * int(tried_keys) / int(total_keys)
-                with lock:
-                    lock.progress = progress
-            except ValueError or IndexError:
-                # ignore this update
-                pass
+        process.wait()
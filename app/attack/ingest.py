@@ -0,0 +1,78 @@
+from pathlib import Path
+from typing import List
+
+from app import app, db, lock_app
+from app.attack.convert import convert_to_22000, split_by_essid
+from app.attack.hash_registry import register, in_flight_owners, most_common_owner
+from app.attack.potfile import potfile_index
+from app.domain import TaskInfoStatus, InvalidFileError
+from app.logger import logger
+from app.uploader import UploadedTask
+
+# the settings of an uploaded capture shared by the tasks of its ESSIDs
+_UPLOAD_COLUMNS = ("user_id", "filename", "wordlist", "rule", "hashcat_args", "uploaded_time", "wordlist_path",
+                   "workload", "timeout", "capture", "checksum")
+
+
+def ingest_capture(task_id: int) -> List[int]:
+    """
+    Convert the uploaded capture of an ingesting task to 22000 and split it
+    by ESSID. The ingesting task becomes the task of the first ESSID; the
+    other ESSIDs get new tasks with the same settings.
+
+    The hash lines that are already in the potfile or are being cracked by
+    other tasks are not cracked again: a task of such lines only is
+    completed right away or attached to the task that cracks them.
+
+    :param task_id: the task created by the upload in the ingesting state
+    :return: the IDs of the tasks to crack
+    """
+    with lock_app, app.app_context():
+        task = UploadedTask.query.get(task_id)
+        if task is None or task.completed:
+            return []
+        if task.status != TaskInfoStatus.INGESTING:
+            # ingested before an interruption
+            return [task.id for task in UploadedTask.query.filter_by(capture=task.capture, completed=False,
+                                                                      duplicate_of=None)]
+        capture_path = Path(task.capture)
+        checksum = task.checksum
+    file_22000 = convert_to_22000(capture_path)
+    files_essid = split_by_essid(file_22000, checksum=checksum)
+    if not files_essid:
+        raise InvalidFileError("No hashes found")
+    with lock_app, app.app_context():
+        task = UploadedTask.query.get(task_id)
+        tasks = [task]
+        for _ in range(len(files_essid) - 1):
+            tasks.append(UploadedTask(**{column: getattr(task, column) for column in _UPLOAD_COLUMNS}))
+        db.session.add_all(tasks)
+        db.session.flush()
+        for new_task, (file_essid, hashes) in zip(tasks, files_essid.items()):
+            new_task.bssid = hashes[0].bssid
+            new_task.essid = bytes.fromhex(hashes[0].essid).decode('utf-8')
+            new_task.file_22000 = str(file_essid)
+            new_task.status = TaskInfoStatus.SCHEDULED
+            lines = [hash_22000.line for hash_22000 in hashes]
+            cracked = potfile_index.lookup(lines)
+            owners = in_flight_owners(line for line in lines if line not in cracked)
+            lines_new = [line for line in lines if line not in cracked and line not in owners]
+            new_task.duplicates = len(lines) - len(lines_new)
+            register(new_task.id, lines, owned=lines_new)
+            if lines_new:
+                if new_task.duplicates:
+                    # crack the new hash lines only
+                    file_essid.write_text(''.join(f"{line}\n" for line in lines_new))
+            elif owners:
+                new_task.duplicate_of = most_common_owner(owners)
+                new_task.status = TaskInfoStatus.ATTACHED
+            else:
+                # the hashes cracked in the earlier uploads are not attacked again
+                new_task.found_key = potfile_index.found_key(lines)
+                new_task.status = TaskInfoStatus.COMPLETED
+                new_task.completed = True
+        db.session.commit()
+        duplicates = sum(new_task.duplicates for new_task in tasks)
+        if duplicates:
+            logger.info(f"Collapsed {duplicates} duplicate hash lines of {capture_path.name}")
+        return [new_task.id for new_task in tasks if not new_task.completed and new_task.duplicate_of is None]
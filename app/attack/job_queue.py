@@ -0,0 +1,239 @@
+import datetime
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import select, update, and_, or_, func
+
+from app import app, db
+from app.config import JOB_LEASE, JOB_MAX_ATTEMPTS
+from app.domain import TaskInfoStatus
+from app.uploader import UploadedTask
+
+
+class JobState:
+    QUEUED = "queued"  # waiting for a consumer
+    RUNNING = "running"  # claimed by a consumer until the lease expires
+    DONE = "done"
+    FAILED = "failed"  # raised an error or ran out of attempts
+    CANCELLED = "cancelled"
+    ACTIVE = (QUEUED, RUNNING)
+
+
+class JobKind:
+    CRACK = "crack"  # crack an uploaded task
+    BENCHMARK = "benchmark"
+    INGEST = "ingest"  # convert and split an uploaded capture in tasks
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), default=JobKind.CRACK)
+    task_id = db.Column(db.Integer, db.ForeignKey('uploads.id'), index=True)
+    user_id = db.Column(db.Integer, index=True)  # the owner of the task
+    state = db.Column(db.String(16), default=JobState.QUEUED, index=True)
+    priority = db.Column(db.Integer, default=0)  # the higher, the sooner
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=JOB_MAX_ATTEMPTS)
+    owner = db.Column(db.String(32))  # the token of the last claim
+    lease_expires = db.Column(db.Float)  # unix time
+    cancel_requested = db.Column(db.Boolean, default=False)
+    progress = db.Column(db.Float, default=0)
+    status = db.Column(db.String(256), default=TaskInfoStatus.SCHEDULED)
+    error = db.Column(db.String(1024))
+    created_time = db.Column(db.DateTime, default=datetime.datetime.now)
+    started_time = db.Column(db.DateTime)
+    finished_time = db.Column(db.DateTime)
+    # bumped on each change of the state or progress, global across the jobs
+    version = db.Column(db.Integer, default=0, index=True)
+
+    @property
+    def duration(self):
+        if self.started_time is None:
+            return datetime.timedelta()
+        finished_time = self.finished_time or datetime.datetime.now()
+        return datetime.timedelta(seconds=int((finished_time - self.started_time).total_seconds()))
+
+
+ClaimedJob = namedtuple("ClaimedJob", ("id", "kind", "task_id", "attempt", "token"))
+
+
+class JobQueue:
+    """
+    A durable job queue in the application database.
+
+    A consumer claims a job with a lease and renews the lease while the job
+    runs; the job of a consumer that died is claimed again once its lease
+    expires, up to `max_attempts` times. Any process can enqueue or cancel
+    jobs: the web tier and the cracking daemon share nothing but the database.
+    """
+
+    def __init__(self, lease=JOB_LEASE):
+        self.lease = lease
+        self.jobs = Job.__table__
+
+    @contextmanager
+    def _transaction(self):
+        with app.app_context(), db.engine.begin() as conn:
+            # take the write lock before reading: concurrent claims are serialized
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            yield conn
+
+    def _next_version(self, conn) -> int:
+        # monotonic because the writers are serialized
+        return conn.execute(select(func.coalesce(func.max(self.jobs.c.version), 0) + 1)).scalar()
+
+    def enqueue(self, kind=JobKind.CRACK, task_id: int = None, priority=0, unique=True) -> int:
+        """
+        :param unique: return the active job of the same kind and task, if any,
+                       instead of adding a new one
+        :return: the job ID
+        """
+        jobs = self.jobs
+        with self._transaction() as conn:
+            if unique:
+                job_id = conn.execute(select(jobs.c.id).where(jobs.c.kind == kind, jobs.c.task_id == task_id,
+                                                              jobs.c.state.in_(JobState.ACTIVE))).scalar()
+                if job_id is not None:
+                    return job_id
+            user_id = select(UploadedTask.user_id).where(UploadedTask.id == task_id).scalar_subquery()
+            result = conn.execute(jobs.insert().values(kind=kind, task_id=task_id, user_id=user_id,
+                                                       priority=priority, state=JobState.QUEUED, attempts=0,
+                                                       max_attempts=JOB_MAX_ATTEMPTS, cancel_requested=False,
+                                                       progress=0, status=TaskInfoStatus.SCHEDULED,
+                                                       created_time=datetime.datetime.now(),
+                                                       version=self._next_version(conn)))
+            return result.inserted_primary_key[0]
+
+    def claim(self, kinds: Iterable[str] = (JobKind.CRACK, JobKind.BENCHMARK)) -> Optional[ClaimedJob]:
+        """
+        Claim the next queued job or a job whose lease has expired.
+        """
+        jobs = self.jobs
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self._transaction() as conn:
+            self._reap_expired(conn, now)
+            expired = and_(jobs.c.state == JobState.RUNNING, jobs.c.lease_expires < now)
+            job = conn.execute(select(jobs.c.id, jobs.c.kind, jobs.c.task_id, jobs.c.attempts)
+                               .where(jobs.c.kind.in_(tuple(kinds)),
+                                      or_(jobs.c.state == JobState.QUEUED, expired))
+                               .order_by(jobs.c.priority.desc(), jobs.c.id)
+                               .limit(1)).first()
+            if job is None:
+                return None
+            conn.execute(update(jobs).where(jobs.c.id == job.id)
+                         .values(state=JobState.RUNNING, owner=token, lease_expires=now + self.lease,
+                                 attempts=job.attempts + 1, started_time=datetime.datetime.now(),
+                                 version=self._next_version(conn)))
+        return ClaimedJob(id=job.id, kind=job.kind, task_id=job.task_id, attempt=job.attempts + 1, token=token)
+
+    def _reap_expired(self, conn, now: float):
+        # the expired jobs that must not be claimed again
+        jobs = self.jobs
+        expired = and_(jobs.c.state == JobState.RUNNING, jobs.c.lease_expires < now)
+        for condition, state, status in ((jobs.c.cancel_requested, JobState.CANCELLED, TaskInfoStatus.CANCELLED),
+                                         (jobs.c.attempts >= jobs.c.max_attempts, JobState.FAILED,
+                                          TaskInfoStatus.ABORTED)):
+            task_ids = select(jobs.c.task_id).where(expired, condition, jobs.c.task_id.is_not(None))
+            conn.execute(update(UploadedTask.__table__)
+                         .where(UploadedTask.id.in_(task_ids), UploadedTask.completed.is_(False))
+                         .values(status=status, completed=True))
+            conn.execute(update(jobs).where(expired, condition)
+                         .values(state=state, finished_time=datetime.datetime.now(),
+                                 version=self._next_version(conn)))
+
+    def heartbeat(self, claims: Iterable[ClaimedJob],
+                  progress: Dict[int, Tuple[float, str]] = None) -> Tuple[Set[int], Set[int]]:
+        """
+        Renew the leases of the claimed jobs and save their progress.
+
+        :param progress: job ID -> (progress, status)
+        :return: the IDs of the jobs cancelled by a user and the IDs of the
+                 jobs lost to another consumer after the lease had expired
+        """
+        jobs = self.jobs
+        claims = tuple(claims)
+        if progress is None:
+            progress = {}
+        cancelled, lost = set(), set()
+        if len(claims) == 0:
+            return cancelled, lost
+        now = time.time()
+        with self._transaction() as conn:
+            for claim in claims:
+                owned = and_(jobs.c.id == claim.id, jobs.c.owner == claim.token, jobs.c.state == JobState.RUNNING)
+                result = conn.execute(update(jobs).where(owned).values(lease_expires=now + self.lease))
+                if result.rowcount == 0:
+                    lost.add(claim.id)
+                elif claim.id in progress:
+                    job_progress, status = progress[claim.id]
+                    # the version is bumped only if the progress has changed
+                    conn.execute(update(jobs).where(owned, or_(jobs.c.progress != job_progress,
+                                                               jobs.c.status != status))
+                                 .values(progress=job_progress, status=status, version=self._next_version(conn)))
+            cancelled.update(conn.execute(select(jobs.c.id).where(jobs.c.id.in_([claim.id for claim in claims]),
+                                                                  jobs.c.cancel_requested)).scalars())
+        return cancelled - lost, lost
+
+    def finish(self, claim: ClaimedJob, state=JobState.DONE, error: str = None) -> bool:
+        """
+        :return: whether the job was still owned by this claim
+        """
+        jobs = self.jobs
+        values = dict(state=state, error=error, finished_time=datetime.datetime.now())
+        if state == JobState.DONE:
+            values['progress'] = 100
+        with self._transaction() as conn:
+            values['version'] = self._next_version(conn)
+            result = conn.execute(update(jobs).where(jobs.c.id == claim.id, jobs.c.owner == claim.token,
+                                                     jobs.c.state == JobState.RUNNING).values(**values))
+        return result.rowcount == 1
+
+    def cancel(self, task_id: int) -> bool:
+        """
+        Cancel the queued job of a task or ask its consumer to stop the running one.
+
+        :return: whether the job has been cancelled before it started
+        """
+        jobs = self.jobs
+        with self._transaction() as conn:
+            job = conn.execute(select(jobs.c.id, jobs.c.state).where(jobs.c.task_id == task_id,
+                                                                     jobs.c.state.in_(JobState.ACTIVE))).first()
+            if job is None:
+                return False
+            if job.state == JobState.RUNNING:
+                conn.execute(update(jobs).where(jobs.c.id == job.id).values(cancel_requested=True))
+                return False
+            conn.execute(update(jobs).where(jobs.c.id == job.id)
+                         .values(state=JobState.CANCELLED, status=TaskInfoStatus.CANCELLED,
+                                 finished_time=datetime.datetime.now(), version=self._next_version(conn)))
+            conn.execute(update(UploadedTask.__table__).where(UploadedTask.id == task_id)
+                         .values(status=TaskInfoStatus.CANCELLED, completed=True))
+        return True
+
+    def cancel_all(self):
+        jobs = self.jobs
+        with self._transaction() as conn:
+            conn.execute(update(jobs).where(jobs.c.state == JobState.RUNNING).values(cancel_requested=True))
+            task_ids = select(jobs.c.task_id).where(jobs.c.state == JobState.QUEUED, jobs.c.task_id.is_not(None))
+            conn.execute(update(UploadedTask.__table__).where(UploadedTask.id.in_(task_ids))
+                         .values(status=TaskInfoStatus.CANCELLED, completed=True))
+            conn.execute(update(jobs).where(jobs.c.state == JobState.QUEUED)
+                         .values(state=JobState.CANCELLED, status=TaskInfoStatus.CANCELLED,
+                                 finished_time=datetime.datetime.now(), version=self._next_version(conn)))
+
+    def stats(self, kind: str = None) -> Dict[str, int]:
+        """
+        :return: the number of jobs in each state
+        """
+        jobs = self.jobs
+        query = select(jobs.c.state, func.count()).group_by(jobs.c.state)
+        if kind is not None:
+            query = query.where(jobs.c.kind == kind)
+        with app.app_context(), db.engine.connect() as conn:
+            return dict(conn.execute(query).all())
+
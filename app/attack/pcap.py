@@ -0,0 +1,303 @@
+"""
+A streaming extractor of the WPA handshakes and PMKIDs of pcap and pcapng
+captures: the in-process converter of `convert_to_22000`, merged with
+hcxpcapngtool if it is installed.
+
+The capture is memory-mapped and read block by block; the 802.11 frames are
+filtered by their frame control field before anything is copied. The ESSIDs
+are taken from the beacons, probe responses and association requests, the
+EAPOL-Key messages M1-M4 are paired by AP, station and replay counter, and
+the PMKIDs are taken from the RSN key data of M1. A 22000 line is emitted
+as soon as its pair and the ESSID of its AP are known.
+
+22000 lines:
+    WPA*01*PMKID*MACAP*MACSTA*ESSID***
+    WPA*02*MIC*MACAP*MACSTA*ESSID*ANONCE*EAPOL*MESSAGEPAIR
+"""
+
+import mmap
+import struct
+from pathlib import Path
+from typing import Iterator, Tuple
+
+from app.domain import InvalidFileError
+
+LINKTYPE_IEEE802_11 = 105
+LINKTYPE_PRISM = 119
+LINKTYPE_RADIOTAP = 127
+LINKTYPE_AVS = 163
+LINKTYPE_PPI = 192
+
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': '<', b'\x4d\x3c\xb2\xa1': '<',  # microseconds, nanoseconds
+    b'\xa1\xb2\xc3\xd4': '>', b'\xa1\xb2\x3c\x4d': '>',
+}
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+PCAPNG_IDB, PCAPNG_PB, PCAPNG_SPB, PCAPNG_EPB = 1, 2, 3, 6
+# the size of the fixed fields of the blocks
+PCAPNG_FIXED_SIZE = {PCAPNG_IDB: 8, PCAPNG_PB: 20, PCAPNG_SPB: 4, PCAPNG_EPB: 20}
+
+LLC_EAPOL = b'\xaa\xaa\x03\x00\x00\x00\x88\x8e'
+EAPOL_KEY = 3
+EAPOL_MAX_SIZE = 255  # the EAPOL of a 22000 line
+PMKID_KDE = b'\xdd\x14\x00\x0f\xac\x04'
+
+# EAPOL-Key information bits
+KEY_PAIRWISE = 0x0008
+KEY_INSTALL = 0x0040
+KEY_ACK = 0x0080
+KEY_MIC = 0x0100
+KEY_SECURE = 0x0200
+
+# message pairs: the messages of the ANonce and of the EAPOL
+M1M2, M1M4, M2M3, M3M4 = 0x00, 0x01, 0x02, 0x05
+
+_ZERO_NONCE = bytes(32)
+
+
+def _ssid_of_tags(frame: bytes, start: int) -> bytes:
+    # the SSID element is the first one
+    if len(frame) >= start + 2 and frame[start] == 0:
+        return frame[start + 2: start + 2 + frame[start + 1]]
+    return b''
+
+
+class HandshakeExtractor:
+    """
+    Pairs the EAPOL messages of the 802.11 frames fed in the capture order.
+    """
+
+    def __init__(self):
+        self.essids = {}  # AP -> ESSID
+        self.anonces = {}  # (AP, STA, message, replay counter) -> ANonce
+        self.eapols = {}  # (AP, STA, message, replay counter) -> (MIC, EAPOL with zeroed MIC)
+        self.pending = {}  # AP -> 22000 lines without the ESSID
+        self.emitted = set()  # the MICs and PMKIDs of the emitted lines
+
+    def feed(self, frame: bytes) -> Iterator[str]:
+        """
+        :param frame: an 802.11 frame
+        :return: the new 22000 lines
+        """
+        if len(frame) < 24:
+            return
+        frame_control, flags = frame[0], frame[1]
+        frame_type, subtype = (frame_control >> 2) & 0b11, frame_control >> 4
+        if flags & 0x40:
+            # protected
+            return
+        if frame_type == 0:
+            if subtype in (5, 8):  # probe response, beacon
+                yield from self._on_essid(frame[16:22], _ssid_of_tags(frame, 36))
+            elif subtype == 0:  # association request
+                yield from self._on_essid(frame[16:22], _ssid_of_tags(frame, 28))
+            elif subtype == 2:  # reassociation request
+                yield from self._on_essid(frame[16:22], _ssid_of_tags(frame, 34))
+        elif frame_type == 2:
+            yield from self._on_data(frame, flags, subtype)
+
+    def _on_essid(self, ap: bytes, essid: bytes) -> Iterator[str]:
+        if not essid or len(essid) > 32 or essid.count(0) == len(essid) or ap in self.essids:
+            return
+        self.essids[ap] = essid
+        for line in self.pending.pop(ap, ()):
+            yield line.replace('*?*', f'*{essid.hex()}*', 1)
+
+    def _on_data(self, frame: bytes, flags: int, subtype: int) -> Iterator[str]:
+        ds = flags & 0b11
+        if ds == 0b01:  # to the AP
+            ap, sta = frame[4:10], frame[10:16]
+        elif ds == 0b10:  # from the AP
+            ap, sta = frame[10:16], frame[4:10]
+        else:
+            return
+        header = 24
+        if subtype & 0x08:  # QoS
+            header += 2
+            if flags & 0x80:  # HT control
+                header += 4
+        if frame[header: header + 8] != LLC_EAPOL:
+            return
+        eapol = frame[header + 8:]
+        if len(eapol) < 99 or eapol[1] != EAPOL_KEY:
+            return
+        eapol = eapol[:4 + struct.unpack_from('>H', eapol, 2)[0]]
+        if len(eapol) < 99 or len(eapol) > EAPOL_MAX_SIZE:
+            return
+        key_info, = struct.unpack_from('>H', eapol, 5)
+        if not key_info & KEY_PAIRWISE:
+            return
+        replay_counter, = struct.unpack_from('>Q', eapol, 9)
+        nonce = eapol[17:49]
+        mic = eapol[81:97]
+        if key_info & KEY_ACK:
+            message = 3 if key_info & KEY_MIC and key_info & KEY_INSTALL else 1
+        elif key_info & KEY_MIC:
+            key_data_length, = struct.unpack_from('>H', eapol, 97)
+            message = 4 if key_info & KEY_SECURE or key_data_length == 0 else 2
+        else:
+            return
+        if message in (1, 3):
+            self.anonces[ap, sta, message, replay_counter] = nonce
+            if message == 1:
+                yield from self._on_pmkid(ap, sta, eapol)
+            # M2 before M3 and M4 before M3 or M1
+            pairs = ((2, replay_counter - 1, M2M3), (4, replay_counter, M3M4)) if message == 3 else \
+                ((2, replay_counter, M1M2), (4, replay_counter + 1, M1M4))
+            for message_eapol, counter, message_pair in pairs:
+                mic_eapol = self.eapols.get((ap, sta, message_eapol, counter))
+                if mic_eapol is not None:
+                    yield from self._emit_eapol(ap, sta, nonce, *mic_eapol, message_pair)
+            return
+        if nonce == _ZERO_NONCE:
+            # the SNonce is needed to derive the PTK
+            return
+        eapol_zeroed = eapol[:81] + bytes(16) + eapol[97:]
+        self.eapols[ap, sta, message, replay_counter] = (mic, eapol_zeroed)
+        # M1 or M3 before M2 and M3 or M1 before M4
+        pairs = ((1, replay_counter, M1M2), (3, replay_counter + 1, M2M3)) if message == 2 else \
+            ((3, replay_counter, M3M4), (1, replay_counter - 1, M1M4))
+        for message_anonce, counter, message_pair in pairs:
+            anonce = self.anonces.get((ap, sta, message_anonce, counter))
+            if anonce is not None:
+                yield from self._emit_eapol(ap, sta, anonce, mic, eapol_zeroed, message_pair)
+                return
+
+    def _on_pmkid(self, ap: bytes, sta: bytes, eapol: bytes):
+        key_data = eapol[99: 99 + struct.unpack_from('>H', eapol, 97)[0]]
+        start = key_data.find(PMKID_KDE)
+        if start == -1:
+            return
+        pmkid = key_data[start + len(PMKID_KDE): start + len(PMKID_KDE) + 16]
+        if len(pmkid) == 16 and pmkid != bytes(16):
+            yield from self._emit(ap, pmkid, f"WPA*01*{pmkid.hex()}*{ap.hex()}*{sta.hex()}*?***")
+
+    def _emit_eapol(self, ap: bytes, sta: bytes, anonce: bytes, mic: bytes, eapol_zeroed: bytes, message_pair: int):
+        yield from self._emit(ap, mic, f"WPA*02*{mic.hex()}*{ap.hex()}*{sta.hex()}*?*{anonce.hex()}*"
+                                       f"{eapol_zeroed.hex()}*{message_pair:02x}")
+
+    def _emit(self, ap: bytes, hash_bytes: bytes, line: str) -> Iterator[str]:
+        # a MIC or PMKID is emitted once, in its first pair
+        if hash_bytes in self.emitted:
+            return
+        self.emitted.add(hash_bytes)
+        essid = self.essids.get(ap)
+        if essid is None:
+            self.pending.setdefault(ap, []).append(line)
+        else:
+            yield line.replace('*?*', f'*{essid.hex()}*', 1)
+
+
+def _frame_offset(data, linktype: int, start: int) -> int:
+    # the offset of the 802.11 frame after the link-layer header
+    if linktype == LINKTYPE_IEEE802_11:
+        return start
+    if linktype in (LINKTYPE_RADIOTAP, LINKTYPE_PPI):
+        return start + struct.unpack_from('<H', data, start + 2)[0]
+    if linktype == LINKTYPE_PRISM:
+        return start + struct.unpack_from('<I', data, start + 4)[0]
+    if linktype == LINKTYPE_AVS:
+        return start + struct.unpack_from('>I', data, start + 4)[0]
+    # the handshakes of the other link types would be missed
+    raise InvalidFileError(f"Unsupported link type {linktype}")
+
+
+def _iter_pcap(data, endian: str) -> Iterator[Tuple[int, int, int]]:
+    linktype, = struct.unpack_from(f'{endian}I', data, 20)
+    record = struct.Struct(f'{endian}IIII')
+    offset, size = 24, len(data)
+    while offset + record.size <= size:
+        ts_sec, ts_frac, captured, original = record.unpack_from(data, offset)
+        offset += record.size
+        yield linktype, offset, min(offset + captured, size)
+        offset += captured
+
+
+def _iter_pcapng(data) -> Iterator[Tuple[int, int, int]]:
+    offset, size = 0, len(data)
+    endian = '<'
+    linktypes = []
+    while offset + 12 <= size:
+        block_type, = struct.unpack_from(f'{endian}I', data, offset)
+        if block_type == PCAPNG_SHB:
+            byte_order, = struct.unpack_from('<I', data, offset + 8)
+            endian = '<' if byte_order == PCAPNG_BYTE_ORDER else '>'
+            linktypes = []  # the interfaces of the section
+        block_length, = struct.unpack_from(f'{endian}I', data, offset + 4)
+        if block_length < 12 or offset + block_length > size:
+            # truncated capture
+            return
+        body = offset + 8
+        end = offset + block_length - 4
+        if end - body < PCAPNG_FIXED_SIZE.get(block_type, 0):
+            raise InvalidFileError(f"Malformed pcapng block of type {block_type} at offset {offset}")
+        if block_type == PCAPNG_IDB:
+            linktypes.append(struct.unpack_from(f'{endian}H', data, body)[0])
+        elif block_type == PCAPNG_EPB:
+            interface, ts_high, ts_low, captured = struct.unpack_from(f'{endian}IIII', data, body)
+            if interface < len(linktypes):
+                yield linktypes[interface], body + 20, min(body + 20 + captured, end)
+        elif block_type == PCAPNG_SPB:
+            if linktypes:
+                original, = struct.unpack_from(f'{endian}I', data, body)
+                yield linktypes[0], body + 4, min(body + 4 + original, end)
+        elif block_type == PCAPNG_PB:
+            interface, drops, ts_high, ts_low, captured = struct.unpack_from(f'{endian}HHIII', data, body)
+            if interface < len(linktypes):
+                yield linktypes[interface], body + 20, min(body + 20 + captured, end)
+        offset += block_length
+
+
+def iter_packets(data) -> Iterator[Tuple[int, int, int]]:
+    """
+    :param data: the bytes of a pcap or pcapng capture
+    :return: (link type, start, end) of each packet
+    """
+    magic = bytes(data[:4])
+    if magic in PCAP_MAGIC and len(data) >= 24:
+        return _iter_pcap(data, PCAP_MAGIC[magic])
+    if len(data) >= 12 and struct.unpack('<I', magic)[0] == PCAPNG_SHB:
+        return _iter_pcapng(data)
+    raise InvalidFileError("Not a pcap or pcapng capture")
+
+
+# the frame control of beacons, probe responses and (re)association requests
+_MANAGEMENT = frozenset((0x80, 0x50, 0x00, 0x20))
+
+
+def iter_22000_lines(capture_path) -> Iterator[str]:
+    """
+    Lazily extract the 22000 hash lines of a pcap or pcapng capture.
+    """
+    if Path(capture_path).stat().st_size == 0:
+        raise InvalidFileError("Empty capture")
+    with open(capture_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        extractor = HandshakeExtractor()
+        for linktype, start, end in iter_packets(data):
+            try:
+                start = _frame_offset(data, linktype, start)
+            except struct.error:
+                # a packet shorter than its link-layer header
+                continue
+            if end - start < 24:
+                continue
+            frame_control = data[start]
+            # copy the unprotected data frames and the frames with an ESSID only
+            if frame_control & 0b1100 == 0b1000 and not data[start + 1] & 0x40 or frame_control in _MANAGEMENT:
+                yield from extractor.feed(data[start:end])
+
+
+def pcap_to_22000(capture_path, file_22000) -> int:
+    """
+    Convert a pcap or pcapng capture to a 22000 file.
+
+    :return: the number of hash lines
+    """
+    count = 0
+    with open(file_22000, 'w') as f:
+        for line in iter_22000_lines(capture_path):
+            f.write(f"{line}\n")
+            count += 1
+    return count
+
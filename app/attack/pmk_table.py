@@ -0,0 +1,182 @@
+"""
+PMK tables of the frequently uploaded ESSIDs.
+
+The PMK of a WPA handshake is PBKDF2-HMAC-SHA1(password, ESSID, 4096, 32):
+it depends on the ESSID and the password only. The PMKs of the fast stage
+wordlists are precomputed for the ESSIDs that show up often in the uploads,
+and the captures of these ESSIDs are attacked in the 22001 mode, which
+checks a PMK with a single HMAC instead of 4096 PBKDF2 iterations.
+
+The PMKs are computed by a small thread pool: hashlib releases the GIL in
+PBKDF2, and the server process, which runs the web and the job queue
+threads, is never forked.
+
+Table file format (little-endian):
+    header: magic b'PMK2', uint64 number of PMKs, uint64 wordlist size in bytes,
+            uint64 wordlist mtime in nanoseconds
+    body: 32-byte PMKs of the 8-63 bytes long words of the wordlist, in order
+"""
+
+import concurrent.futures
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import deque
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import select, func
+
+from app import app, db
+from app.config import PMK_TABLES_DIR, PMK_ESSID_MIN_UPLOADS, PMK_TABLES_ESSIDS, PMK_TABLES_THREADS, \
+    PMK_TABLES_INTERVAL
+from app.domain import WordList
+from app.logger import logger
+from app.uploader import UploadedTask
+from app.word_magic import create_digits_wordlist, create_fast_wordlists
+from app.word_magic.wordlist_stats import WPA_MIN_LENGTH, WPA_MAX_LENGTH
+
+PMK_TABLE_MAGIC = b'PMK2'
+PMK_SIZE = 32
+PMK_CHUNK_SIZE = 1000  # words per pool task
+PMK_CHUNKS_IN_FLIGHT = 16  # pool tasks submitted ahead
+_HEADER = struct.Struct("<4sQQQ")
+
+# the wordlists of the fast stages that are worth a table
+PMK_WORDLISTS = (WordList.TOP1K_RULE_BEST64, WordList.DIGITS_8)
+
+
+def pmk(password: bytes, essid: bytes) -> bytes:
+    return hashlib.pbkdf2_hmac('sha1', password, essid, 4096, PMK_SIZE)
+
+
+def _pmk_chunk(essid: bytes, words: List[bytes]) -> bytes:
+    return b''.join(pmk(word, essid) for word in words)
+
+
+def _imap(pool: concurrent.futures.Executor, func, items: Iterator) -> Iterator:
+    # Executor.map submits all items at once; the chunks of a large wordlist
+    # are submitted as the results are consumed instead
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= PMK_CHUNKS_IN_FLIGHT:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _wpa_words(wordlist_path: Path) -> Iterator[bytes]:
+    with open(wordlist_path, 'rb') as f:
+        for line in f:
+            word = line.rstrip(b'\r\n')
+            if WPA_MIN_LENGTH <= len(word) <= WPA_MAX_LENGTH:
+                yield word
+
+
+class PmkTable:
+    def __init__(self, essid: str, wordlist_path: Path, tables_dir: Path = PMK_TABLES_DIR):
+        self.essid = essid
+        self.wordlist_path = Path(wordlist_path)
+        self.path = Path(tables_dir) / essid.encode('utf-8').hex() / f"{self.wordlist_path.name}.pmk"
+
+    def __repr__(self):
+        return f"PmkTable('{self.essid}', '{self.wordlist_path.name}')"
+
+    def _read_header(self):
+        with open(self.path, 'rb') as f:
+            return _HEADER.unpack(f.read(_HEADER.size))
+
+    def is_valid(self) -> bool:
+        """
+        :return: whether the table exists and matches the current wordlist
+        """
+        if not self.path.exists() or not self.wordlist_path.exists():
+            return False
+        magic, count, wordlist_size, wordlist_mtime = self._read_header()
+        stat = self.wordlist_path.stat()
+        return magic == PMK_TABLE_MAGIC and (wordlist_size, wordlist_mtime) == (stat.st_size, stat.st_mtime_ns)
+
+    def precompute(self, pool: concurrent.futures.Executor):
+        stat = self.wordlist_path.stat()
+        words = _wpa_words(self.wordlist_path)
+        chunks = iter(lambda: list(islice(words, PMK_CHUNK_SIZE)), [])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        path_tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+        count = 0
+        with open(path_tmp, 'wb') as f:
+            f.write(_HEADER.pack(PMK_TABLE_MAGIC, count, stat.st_size, stat.st_mtime_ns))
+            for pmks in _imap(pool, partial(_pmk_chunk, self.essid.encode('utf-8')), chunks):
+                f.write(pmks)
+                count += len(pmks) // PMK_SIZE
+            f.seek(0)
+            f.write(_HEADER.pack(PMK_TABLE_MAGIC, count, stat.st_size, stat.st_mtime_ns))
+        os.replace(path_tmp, self.path)
+        logger.info(f"Precomputed {count} PMKs of {self}")
+
+    def iter_pmks_hex(self) -> Iterator[str]:
+        """
+        :return: the PMKs as the 22001 mode password candidates
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(_HEADER.size)
+            for chunk in iter(lambda: f.read(PMK_SIZE * PMK_CHUNK_SIZE), b''):
+                for start in range(0, len(chunk), PMK_SIZE):
+                    yield chunk[start: start + PMK_SIZE].hex()
+
+    def password(self, pmk_hex: str) -> Optional[str]:
+        """
+        :return: the wordlist word of a PMK or None
+        """
+        pmks = np.memmap(self.path, dtype=np.uint8, mode='r', offset=_HEADER.size).reshape(-1, PMK_SIZE)
+        matches = np.flatnonzero((pmks == np.frombuffer(bytes.fromhex(pmk_hex), dtype=np.uint8)).all(axis=1))
+        if len(matches) == 0:
+            return None
+        word = next(islice(_wpa_words(self.wordlist_path), int(matches[0]), None))
+        return word.decode('utf-8', errors='surrogateescape')
+
+
+def frequent_essids(min_uploads=PMK_ESSID_MIN_UPLOADS, limit=PMK_TABLES_ESSIDS) -> List[str]:
+    """
+    :return: the ESSIDs of at least `min_uploads` tasks, the most frequent first
+    """
+    uploads = func.count(UploadedTask.id)
+    query = select(UploadedTask.essid).where(UploadedTask.essid.isnot(None)) \
+        .group_by(UploadedTask.essid).having(uploads >= min_uploads).order_by(uploads.desc()).limit(limit)
+    with app.app_context():
+        return list(db.session.execute(query).scalars())
+
+
+def update_pmk_tables(threads=PMK_TABLES_THREADS):
+    """
+    Precompute the missing and outdated PMK tables of the frequent ESSIDs.
+    """
+    tables = [PmkTable(essid, wordlist.path) for essid in frequent_essids() for wordlist in PMK_WORDLISTS]
+    tables = [table for table in tables if not table.is_valid()]
+    if not tables:
+        return
+    create_digits_wordlist()
+    create_fast_wordlists()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix="pmk") as pool:
+        for table in tables:
+            table.precompute(pool)
+
+
+def start_pmk_tables_updater() -> threading.Thread:
+    def update_periodically():
+        while True:
+            try:
+                update_pmk_tables()
+            except Exception as error:
+                logger.exception(error)
+            time.sleep(PMK_TABLES_INTERVAL)
+
+    updater = threading.Thread(target=update_periodically, name="pmk-tables", daemon=True)
+    updater.start()
+    return updater
+
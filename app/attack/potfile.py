@@ -0,0 +1,177 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Dict, Iterator, Tuple, Optional
+
+from app.config import HASHCAT_POTFILE, POTFILE_INDEX_DB
+from app.logger import logger
+
+
+def hash_id_of_line(line: str) -> str:
+    """
+    :param line: a 22000 hash line
+           WPA*TYPE*PMKID/MIC*MACAP*MACSTA*ESSID*ANONCE*EAPOL*MESSAGEPAIR
+    :return: the hash as hashcat writes it to the potfile:
+             PMKID/MIC*MACAP*MACSTA*ESSID
+    """
+    return '*'.join(line.split('*')[2:6]).lower()
+
+
+def essid_of_outfile(essid: str) -> bytes:
+    """
+    :param essid: an ESSID as hashcat writes it to the outfile, in the
+                  `$HEX[...]` notation if it is not printable or has a ':'
+    :return: the ESSID bytes
+    """
+    if essid.startswith('$HEX[') and essid.endswith(']'):
+        return bytes.fromhex(essid[5:-1])
+    return essid.encode('utf-8', errors='surrogateescape')
+
+
+def hash_id_of_key_line(line: str) -> str:
+    """
+    :param line: a hashcat outfile line
+           PMKID/MIC:MACAP:MACSTA:ESSID:PASSWORD
+    :return: the hash ID of its 22000 line, see `hash_id_of_line`
+    """
+    hash_hex, mac_ap, mac_sta, essid_key = line.split(':', maxsplit=3)
+    essid = essid_key.split(':', maxsplit=1)[0]
+    return f"{hash_hex}*{mac_ap}*{mac_sta}*{essid_of_outfile(essid).hex()}".lower()
+
+
+class PotfileIndex:
+    """
+    Indexed hashcat potfile: the cracked hashes of all uploads.
+
+    The potfile is appended by hashcat and `append`. The index tails it: the new
+    complete lines after the last indexed offset are indexed before each
+    lookup, which costs a `stat` call when the potfile has not changed.
+    A potfile that shrinks has been rewritten and is indexed from scratch.
+    Each thread reuses its own SQLite connection to answer the lookups
+    without connection overhead.
+    """
+
+    def __init__(self, potfile: Path = HASHCAT_POTFILE, db_path: Path = POTFILE_INDEX_DB):
+        self.potfile = Path(potfile)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS potfile (
+                                hash_id TEXT PRIMARY KEY,
+                                key TEXT NOT NULL,
+                                line TEXT NOT NULL
+                            )""")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=60)
+        return conn
+
+    @contextmanager
+    def connect(self):
+        conn = self._conn
+        with conn:
+            yield conn
+
+    def _indexed_offset(self, conn) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'offset'").fetchone()
+        return 0 if row is None else row[0]
+
+    def refresh(self) -> int:
+        """
+        Index the lines appended to the potfile since the last call.
+
+        :return: the number of new lines
+        """
+        if not self.potfile.exists():
+            return 0
+        size = self.potfile.stat().st_size
+        with self.connect() as conn:
+            if size == self._indexed_offset(conn):
+                return 0
+            # take the write lock before checking to index each line once
+            conn.execute("BEGIN IMMEDIATE")
+            offset = self._indexed_offset(conn)
+            if size < offset:
+                logger.info(f"{self.potfile} has been rewritten. Reindexing")
+                conn.execute("DELETE FROM potfile")
+                offset = 0
+            with open(self.potfile, 'rb') as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+            # the last line might still be being written
+            data = data[:data.rfind(b'\n') + 1]
+            lines = data.decode('utf-8', errors='replace').splitlines()
+            rows = []
+            for line in lines:
+                hash_part, sep, key = line.partition(':')
+                if sep:
+                    rows.append((hash_part.lower(), key, line))
+            conn.executemany("INSERT OR REPLACE INTO potfile VALUES (?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('offset', ?)", (offset + len(data),))
+        return len(lines)
+
+    def append(self, hash_id: str, key: str):
+        """
+        Add a key cracked without the potfile, for example, in the 22001 mode.
+        """
+        self.potfile.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.potfile, 'a', errors='surrogateescape') as f:
+            f.write(f"{hash_id}:{key}\n")
+
+    def lookup(self, hash_lines: Iterable[str]) -> Dict[str, str]:
+        """
+        :param hash_lines: 22000 hash lines
+        :return: a dict of the cracked hash lines -> key
+        """
+        self.refresh()
+        cracked = {}
+        conn = self._conn
+        for line in hash_lines:
+            row = conn.execute("SELECT key FROM potfile WHERE hash_id = ?", (hash_id_of_line(line),)).fetchone()
+            if row is not None:
+                cracked[line] = row[0]
+        return cracked
+
+    def found_key(self, hash_lines: Iterable[str]) -> Optional[str]:
+        """
+        :return: the cracked keys in the `read_plain_key` format
+                 'essid:key, ...' or None
+        """
+        found_keys = set()
+        for line, key in self.lookup(hash_lines).items():
+            essid = bytes.fromhex(line.split('*')[5]).decode('utf-8', errors='replace')
+            found_keys.add(f"{essid}:{key}")
+        if not found_keys:
+            return None
+        return ', '.join(sorted(found_keys))
+
+    def last_position(self, after: int = 0, limit: int = 1000) -> Optional[int]:
+        """
+        :return: the position of the last line of a page or None if the page is empty
+        """
+        self.refresh()
+        return self._conn.execute("SELECT MAX(rowid) FROM (SELECT rowid FROM potfile WHERE rowid > ? "
+                                  "ORDER BY rowid LIMIT ?)", (after, limit)).fetchone()[0]
+
+    def iter_lines(self, after: int = 0, limit: int = 1000) -> Iterator[Tuple[int, str]]:
+        """
+        A page of the potfile lines in the order they were indexed.
+
+        :param after: the position of the last line of the previous page
+        :return: (position, line) pairs
+        """
+        # a separate connection: the page is read lazily by a response stream
+        with sqlite3.connect(self.db_path, timeout=60) as conn:
+            yield from conn.execute("SELECT rowid, line FROM potfile WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                                    (after, limit))
+
+
+potfile_index = PotfileIndex()
+
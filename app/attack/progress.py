@@ -0,0 +1,132 @@
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+from flask import has_app_context
+from sqlalchemy import select, func, or_
+
+from app import app, db
+from app.attack.job_queue import Job, JobState
+from app.config import PROGRESS_POLL, PROGRESS_MAX_STREAMS
+from app.uploader import UploadedTask
+
+
+class ProgressRegistry:
+    """
+    The versioned progress of the jobs.
+
+    Each change of a job bumps the global version of the jobs table (see
+    JobQueue). A single watcher thread per process polls the latest version;
+    the clients wait for it to change and then query only the jobs of their
+    user that have changed since the version they have seen. The user
+    version must be read before the changes: a change in between is sent
+    twice rather than never.
+
+    A progress stream holds a server thread while it is open: at most
+    `max_streams` streams are open at once, the other clients poll.
+    """
+
+    def __init__(self, poll=PROGRESS_POLL, max_streams=PROGRESS_MAX_STREAMS):
+        self.poll = poll
+        self._version = None
+        self._condition = threading.Condition()
+        self._watcher = None
+        self._streams = threading.BoundedSemaphore(max_streams)
+
+    def _watch(self):
+        while True:
+            version = self.latest_version()
+            with self._condition:
+                if version != self._version:
+                    self._version = version
+                    self._condition.notify_all()
+            time.sleep(self.poll)
+
+    @staticmethod
+    def latest_version() -> int:
+        with _app_context():
+            return db.session.execute(select(func.coalesce(func.max(Job.version), 0))).scalar()
+
+    def version(self) -> int:
+        """
+        :return: the latest version seen by the watcher
+        """
+        with self._condition:
+            if self._watcher is None:
+                self._version = self.latest_version()
+                self._watcher = threading.Thread(target=self._watch, name="progress-watcher", daemon=True)
+                self._watcher.start()
+            return self._version
+
+    def open_stream(self) -> bool:
+        """
+        :return: whether a progress stream can be opened; if so, it must be
+                 closed with `close_stream`
+        """
+        return self._streams.acquire(blocking=False)
+
+    def close_stream(self):
+        self._streams.release()
+
+    def wait(self, version: int, timeout: float = None) -> int:
+        """
+        Wait for a version newer than `version`.
+
+        :return: the latest version; the same version on timeout
+        """
+        self.version()
+        with self._condition:
+            self._condition.wait_for(lambda: self._version > version, timeout=timeout)
+            return self._version
+
+    @staticmethod
+    def user_version(user_id: int) -> int:
+        with _app_context():
+            return db.session.execute(select(func.coalesce(func.max(Job.version), 0))
+                                      .where(Job.user_id == user_id)).scalar()
+
+    @staticmethod
+    def changes(user_id: int, since: int = 0) -> List[Dict]:
+        """
+        :param since: the version seen by the client; if zero, the active
+                      tasks and the tasks finished in the last minute
+        :return: the progress of the user tasks that have changed since then
+        """
+        query = select(Job, UploadedTask).join(UploadedTask, Job.task_id == UploadedTask.id) \
+            .where(Job.user_id == user_id).order_by(Job.version)
+        if since > 0:
+            query = query.where(Job.version > since)
+        else:
+            finished_since = datetime.datetime.now() - datetime.timedelta(minutes=1)
+            query = query.where(or_(Job.state.in_(JobState.ACTIVE), Job.finished_time > finished_since))
+        tasks_progress = {}
+        with _app_context():
+            for job, task in db.session.execute(query):
+                if job.state in JobState.ACTIVE:
+                    status, duration = job.status, job.duration
+                else:
+                    status, duration = task.status, task.duration
+                # the latest job of a task overrides the previous ones
+                tasks_progress[task.id] = dict(task_id=task.id,
+                                               progress=f"{job.progress:.2f}",
+                                               status=status,
+                                               duration=str(duration),
+                                               found_key=task.found_key)
+        return list(tasks_progress.values())
+
+
+@contextmanager
+def _app_context():
+    # reuse the database session of a request: a nested app context would
+    # check out another connection from the pool
+    if has_app_context():
+        yield
+    else:
+        with app.app_context():
+            yield
+
+
+progress_registry = ProgressRegistry()
+
@@ -0,0 +1,248 @@
+import concurrent.futures
+import re
+import threading
+from functools import lru_cache
+from typing import Callable, Sequence, Tuple, Hashable, List
+
+from app.config import LARGE_JOB_CANDIDATES
+from app.logger import logger
+from app.utils import subprocess_call
+
+DEVICE_ID_PATTERN = re.compile(r"^\s*(?:Backend )?Device ID #(\d+)(?: \(Alias: #(\d+)\))?")
+
+
+def parse_hashcat_devices(info: str) -> Tuple[int, ...]:
+    """
+    Parse the device IDs from `hashcat -I` output. A device that is exposed
+    by several backends (CUDA and OpenCL) is listed once, under its lowest ID.
+    """
+    devices = set()
+    for line in info.splitlines():
+        match = DEVICE_ID_PATTERN.match(line)
+        if match is None:
+            continue
+        device_id, alias = match.groups()
+        device_id = int(device_id)
+        if alias is not None and int(alias) < device_id:
+            continue
+        devices.add(device_id)
+    return tuple(sorted(devices))
+
+
+@lru_cache()
+def hashcat_devices() -> Tuple[int, ...]:
+    try:
+        out, err = subprocess_call(['hashcat', '-I', '--force'])
+    except FileNotFoundError:
+        logger.error("hashcat is not installed")
+        return ()
+    devices = parse_hashcat_devices(out)
+    logger.info(f"Discovered hashcat devices: {devices}")
+    return devices
+
+
+class _Job:
+    def __init__(self, fn: Callable, args, kwargs, size: int, exclusive: bool, coalesce_key: Hashable = None):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.size = size
+        self.exclusive = exclusive
+        self.coalesce_key = coalesce_key
+        self.future = concurrent.futures.Future()
+
+
+class DeviceScheduler:
+    """
+    Runs several hashcat jobs at once, each on its own subset of devices.
+
+    Placement:
+      - a small job runs on a single device;
+      - a large job (`size >= large_job_size` candidates) runs on all free
+        devices but one, which is reserved for the small jobs;
+      - an exclusive job (benchmark) waits for all devices; the jobs
+        submitted after it wait for it.
+    Jobs are dispatched in the submission order. The jobs submitted after a
+    large job that waits for devices wait for it too, unless another large
+    job is running: its spare device is left for the small jobs.
+    Coalesced jobs that are queued with the same key when one of them is
+    dispatched run together in a single call.
+
+    If no devices are discovered, the jobs run one at a time on the default
+    devices. The devices of `hashcat -I` are discovered on the first use,
+    not when the app is imported.
+    """
+
+    def __init__(self, devices: Sequence[int] = None, large_job_size=LARGE_JOB_CANDIDATES):
+        self._devices = None if devices is None else tuple(devices)
+        self._slots = None
+        self._free = set()
+        self._large_running = 0
+        self.large_job_size = large_job_size
+        self._pending = []
+        self._shutdown = False
+        self._condition = threading.Condition()
+        threading.Thread(target=self._dispatch, name="scheduler", daemon=True).start()
+
+    def _discover_devices(self):
+        # called with the condition held
+        if self._slots is None:
+            if self._devices is None:
+                self._devices = hashcat_devices()
+            # None is the default devices slot: hashcat decides
+            self._slots = self._devices or (None,)
+            self._free = set(self._slots)
+
+    def discover_devices(self) -> Tuple[int, ...]:
+        """
+        Discover the devices now rather than on the first job.
+        """
+        with self._condition:
+            self._discover_devices()
+            return self._devices
+
+    @property
+    def devices(self) -> Tuple[int, ...]:
+        return self.discover_devices()
+
+    @property
+    def slots(self) -> Tuple:
+        """
+        The device slots that jobs run on; a single default slot if no
+        devices are discovered.
+        """
+        with self._condition:
+            self._discover_devices()
+            return self._slots
+
+    def submit(self, fn: Callable, *args, size=0, exclusive=False, **kwargs) -> concurrent.futures.Future:
+        """
+        Schedule `fn(*args, devices=devices, **kwargs)`, where `devices` is
+        a tuple of the hashcat device IDs assigned to the job (empty for the
+        default devices).
+
+        :param size: the number of candidates of the job
+        :param exclusive: run on all devices with no other jobs
+        """
+        job = _Job(fn, args, kwargs, size=size, exclusive=exclusive)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Cannot schedule new jobs after shutdown")
+            self._discover_devices()
+            self._pending.append(job)
+            self._condition.notify_all()
+        return job.future
+
+    def submit_coalesced(self, fn: Callable, item, key: Hashable, size=0) -> concurrent.futures.Future:
+        """
+        Schedule `fn(items, devices=devices)`, merged with the other queued
+        jobs of the same `key`. `fn` returns a list of results in the order
+        of `items`; an exception in the list is set to the job of the item.
+
+        :param item: the argument of this job in `items`
+        :param key: the jobs of the same key must be safe to merge
+        :param size: the number of candidates of the job
+        """
+        job = _Job(fn, (item,), {}, size=size, exclusive=False, coalesce_key=key)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Cannot schedule new jobs after shutdown")
+            self._discover_devices()
+            self._pending.append(job)
+            self._condition.notify_all()
+        return job.future
+
+    def shutdown(self):
+        """
+        Cancel the pending jobs and stop dispatching. Running jobs are not interrupted.
+        """
+        with self._condition:
+            self._shutdown = True
+            for job in self._pending:
+                job.future.cancel()
+            self._pending.clear()
+            self._condition.notify_all()
+
+    def is_large(self, job: _Job) -> bool:
+        return job.size >= self.large_job_size
+
+    def _runs_spread(self, job: _Job) -> bool:
+        # the job runs on several devices
+        return self.is_large(job) and not job.exclusive and len(self._slots) > 1
+
+    def _place(self, job: _Job):
+        # returns the slots assigned to the job or None if it must wait
+        free = sorted(self._free, key=lambda slot: -1 if slot is None else slot)
+        if not free:
+            return None
+        if job.exclusive:
+            if len(free) == len(self._slots):
+                return tuple(free)
+            return None
+        if self._runs_spread(job):
+            # reserve a device for the small jobs
+            n_devices = len(free) - 1
+            if n_devices <= 0:
+                return None
+            return tuple(free[:n_devices])
+        return tuple(free[:1])
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                if self._shutdown:
+                    return
+                self._pending = [job for job in self._pending if not job.future.cancelled()]
+                # the jobs submitted after an exclusive job wait for it
+                barrier = next((index for index, job in enumerate(self._pending) if job.exclusive),
+                               len(self._pending))
+                candidates = self._pending[:barrier + 1]
+                for job in candidates:
+                    if job not in self._pending:
+                        # coalesced with a previous job
+                        continue
+                    slots = self._place(job)
+                    if slots is None:
+                        if self._runs_spread(job) and self._large_running == 0:
+                            # reserve the devices that are freed for the large job
+                            break
+                        continue
+                    jobs = [job]
+                    if job.coalesce_key is not None:
+                        jobs.extend(other for other in self._pending
+                                    if other is not job and other.coalesce_key == job.coalesce_key)
+                    for member in jobs:
+                        self._pending.remove(member)
+                    self._free.difference_update(slots)
+                    large = self._runs_spread(job)
+                    self._large_running += large
+                    threading.Thread(target=self._run, args=(jobs, slots, large), daemon=True).start()
+                self._condition.wait()
+
+    def _run(self, jobs: List[_Job], slots: Tuple, large: bool):
+        devices = tuple(slot for slot in slots if slot is not None)
+        try:
+            jobs = [job for job in jobs if job.future.set_running_or_notify_cancel()]
+            if not jobs:
+                return
+            job = jobs[0]
+            try:
+                if job.coalesce_key is None:
+                    results = [job.fn(*job.args, devices=devices, **job.kwargs)]
+                else:
+                    results = job.fn([member.args[0] for member in jobs], devices=devices)
+            except BaseException as error:
+                for member in jobs:
+                    member.future.set_exception(error)
+            else:
+                for member, result in zip(jobs, results):
+                    if isinstance(result, BaseException):
+                        member.future.set_exception(result)
+                    else:
+                        member.future.set_result(result)
+        finally:
+            with self._condition:
+                self._free.update(slots)
+                self._large_running -= large
+                self._condition.notify_all()
+
@@ -0,0 +1,133 @@
+"""
+Hashcat machine-readable status (`--status --machine-readable`) parser.
+
+A status line is a sequence of tab-separated sections; each section is an
+upper-case key followed by its values:
+
+STATUS <n> SPEED <hashes> <msec> ... EXEC_RUNTIME <msec> ... CURKU <n>
+PROGRESS <done> <total> RECHASH <done> <total> RECSALT <done> <total>
+TEMP <celsius> ... REJECTED <n> UTIL <percent> ...
+
+The sections with the values per device (SPEED, EXEC_RUNTIME, TEMP, UTIL)
+list the active devices in order. The samples are stored in `StatusSample`.
+"""
+
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence
+
+HASHCAT_STATUS_NAMES = {
+    0: "Initializing",
+    1: "Autotuning",
+    2: "Selftest",
+    3: "Running",
+    4: "Paused",
+    5: "Exhausted",
+    6: "Cracked",
+    7: "Aborted",
+    8: "Quit",
+    9: "Bypass",
+    10: "Aborted (Checkpoint)",
+    11: "Aborted (Runtime)",
+    12: "Running (Checkpoint Quit requested)",
+    13: "Aborted (Finish)",
+}
+
+# speed is in hashes per second; temperature is -1 if not available
+DeviceStatus = namedtuple("DeviceStatus", ("device_id", "speed", "exec_runtime", "temperature", "utilization"))
+
+
+class HashcatStatus(namedtuple("HashcatStatus", ("status", "devices", "restore_point", "progress_done",
+                                                 "progress_total", "recovered_hashes", "total_hashes",
+                                                 "recovered_salts", "total_salts", "rejected"))):
+    @property
+    def status_name(self) -> str:
+        return HASHCAT_STATUS_NAMES.get(self.status, f"Unknown ({self.status})")
+
+    @property
+    def progress(self) -> float:
+        if self.progress_total == 0:
+            return 0.
+        return 100. * self.progress_done / self.progress_total
+
+    @property
+    def speed(self) -> int:
+        return sum(device.speed for device in self.devices)
+
+    def to_dict(self) -> Dict:
+        return dict(status=self.status_name,
+                    progress=self.progress,
+                    speed=self.speed,
+                    restore_point=self.restore_point,
+                    recovered_hashes=self.recovered_hashes,
+                    total_hashes=self.total_hashes,
+                    rejected=self.rejected,
+                    devices=[device._asdict() for device in self.devices])
+
+
+def _number(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _sections(line: str) -> Dict[str, List]:
+    sections = {}
+    values = None
+    for token in line.split():
+        if token[0].isalpha():
+            values = sections.setdefault(token, [])
+        elif values is not None:
+            values.append(_number(token))
+    return sections
+
+
+def parse_status_line(line: str, devices: Sequence[int] = ()) -> Optional[HashcatStatus]:
+    """
+    :param line: a hashcat machine-readable status line
+    :param devices: the IDs of the devices hashcat runs on (`--backend-devices`);
+                    the devices are numbered from 1 if not given
+    :return: the parsed status or None if the line is not a status line
+    :raises ValueError: on a malformed status line
+    """
+    if not line.startswith("STATUS"):
+        return None
+    try:
+        sections = _sections(line)
+    except ValueError as error:
+        raise ValueError(f"Invalid hashcat status line '{line.strip()}': {error}")
+    if len(sections["STATUS"]) != 1 or len(sections.get("PROGRESS", ())) != 2:
+        raise ValueError(f"Invalid hashcat status line '{line.strip()}'")
+
+    # SPEED lists (hashes, msec) pairs
+    speed_pairs = sections.get("SPEED", [])
+    speeds = [int(hashes * 1000 / msec) if msec else 0
+              for hashes, msec in zip(speed_pairs[::2], speed_pairs[1::2])]
+    exec_runtime = sections.get("EXEC_RUNTIME", [])
+    temperature = sections.get("TEMP", [])
+    utilization = sections.get("UTIL", [])
+    device_ids = list(devices) if devices else range(1, len(speeds) + 1)
+
+    def device_value(values, index):
+        return values[index] if index < len(values) else None
+
+    device_statuses = tuple(DeviceStatus(device_id=device_id,
+                                         speed=speed,
+                                         exec_runtime=device_value(exec_runtime, index),
+                                         temperature=device_value(temperature, index),
+                                         utilization=device_value(utilization, index))
+                            for index, (device_id, speed) in enumerate(zip(device_ids, speeds)))
+    progress_done, progress_total = sections["PROGRESS"]
+    recovered_hashes, total_hashes = sections.get("RECHASH", (0, 0))
+    recovered_salts, total_salts = sections.get("RECSALT", (0, 0))
+    return HashcatStatus(status=sections["STATUS"][0],
+                         devices=device_statuses,
+                         restore_point=sections.get("CURKU", [0])[0],
+                         progress_done=progress_done,
+                         progress_total=progress_total,
+                         recovered_hashes=recovered_hashes,
+                         total_hashes=total_hashes,
+                         recovered_salts=recovered_salts,
+                         total_salts=total_salts,
+                         rejected=sections.get("REJECTED", [0])[0])
+
@@ -0,0 +1,176 @@
+"""
+Event-driven supervisor of the hashcat processes.
+
+A single selector loop writes the password candidates to stdin, drains
+stdout and stderr and checks the cancellation and the wall-clock deadline
+at least every SUPERVISOR_POLL seconds, regardless of how often hashcat
+prints its status. A process that must stop is asked to quit with SIGINT,
+which lets hashcat save its restore point, then terminated with SIGTERM and
+killed with SIGKILL if it does not exit within HASHCAT_STOP_GRACE seconds.
+"""
+
+import os
+import selectors
+import signal
+import subprocess
+import time
+from itertools import islice
+from typing import Iterable, Iterator, Callable, Tuple, List
+
+from app.config import SUPERVISOR_POLL, HASHCAT_STOP_GRACE
+from app.domain import TaskInfoStatus
+from app.logger import logger
+
+STDIN_CHUNK_SIZE = 10_000  # candidates per single write to hashcat stdin
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGKILL)
+
+
+def encode_candidates(candidates: Iterable[str]) -> Iterator[bytes]:
+    # surrogateescape restores the original bytes of non-utf8 words
+    for chunk in iter(lambda: list(islice(candidates, STDIN_CHUNK_SIZE)), []):
+        chunk.append('')
+        yield '\n'.join(chunk).encode('utf-8', errors='surrogateescape')
+
+
+def _is_cancelled(lock) -> bool:
+    if lock is None:
+        return False
+    with lock:
+        return lock.cancelled
+
+
+class _Stdin:
+    # non-blocking writer of the encoded candidates
+    def __init__(self, pipe, candidates: Iterable[str]):
+        self.pipe = pipe
+        self.chunks = encode_candidates(iter(candidates))
+        self.pending = memoryview(b'')
+        os.set_blocking(pipe.fileno(), False)
+
+    def write(self) -> bool:
+        """
+        :return: whether there is more data to write
+        """
+        if len(self.pending) == 0:
+            self.pending = memoryview(next(self.chunks, b''))
+            if len(self.pending) == 0:
+                return False
+        try:
+            written = os.write(self.pipe.fileno(), self.pending)
+        except BlockingIOError:
+            return True
+        except BrokenPipeError:
+            # hashcat exited earlier, for example, when all hashes are cracked
+            return False
+        self.pending = self.pending[written:]
+        return True
+
+
+def supervise(args: List[str], candidates: Iterable[str] = None, lock=None, deadline: float = None,
+              on_line: Callable[[str], None] = None) -> Tuple[str, str]:
+    """
+    Run a command until it exits, is cancelled or passes the deadline.
+
+    :param args: command args
+    :param candidates: password candidates to write to stdin
+    :param lock: ProgressLock or ProgressLockGroup; the process is stopped
+                 once the lock is cancelled
+    :param deadline: `time.monotonic()` deadline
+    :param on_line: called with each stdout line
+    :raises InterruptedError: if cancelled
+    :raises TimeoutError: if the deadline has passed
+    :return: stdout and stderr
+    """
+    args = list(map(str, args))
+    logger.debug(">>> {}{}".format(' '.join(args), " < stdin" if candidates is not None else ""))
+    if not all(args):
+        raise ValueError(f"Empty arg in {args}")
+    process = subprocess.Popen(args, stdin=subprocess.PIPE if candidates is not None else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output = {process.stdout: bytearray(), process.stderr: bytearray()}
+    line_start = 0  # the start of the incomplete stdout line
+    selector = selectors.DefaultSelector()
+    for pipe in output:
+        selector.register(pipe, selectors.EVENT_READ)
+    stdin = None
+    if candidates is not None:
+        stdin = _Stdin(process.stdin, candidates)
+        selector.register(process.stdin, selectors.EVENT_WRITE)
+    stop_error = None
+    stop_signals = iter(STOP_SIGNALS)
+    next_signal_time = None
+
+    def close_stdin():
+        nonlocal stdin
+        stdin = None
+        selector.unregister(process.stdin)
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    def handle_events(timeout) -> bool:
+        nonlocal line_start
+        events = selector.select(timeout=timeout) if selector.get_map() else ()
+        for key, _ in events:
+            if key.fileobj is process.stdin:
+                if not stdin.write():
+                    close_stdin()
+                continue
+            data = os.read(key.fd, 2 ** 16)
+            if not data:
+                selector.unregister(key.fileobj)
+                continue
+            output[key.fileobj].extend(data)
+            if key.fileobj is process.stdout and on_line is not None:
+                stdout = output[process.stdout]
+                line_end = stdout.find(b'\n', line_start)
+                while line_end != -1:
+                    on_line(stdout[line_start: line_end + 1].decode('utf-8', errors='ignore'))
+                    line_start = line_end + 1
+                    line_end = stdout.find(b'\n', line_start)
+        return len(events) > 0
+
+    try:
+        while process.poll() is None:
+            if not selector.get_map():
+                time.sleep(SUPERVISOR_POLL)
+            handle_events(timeout=SUPERVISOR_POLL)
+            if stop_error is None:
+                if _is_cancelled(lock):
+                    stop_error = InterruptedError(TaskInfoStatus.CANCELLED)
+                elif deadline is not None and time.monotonic() > deadline:
+                    stop_error = TimeoutError("Timed out")
+                if stop_error is not None:
+                    logger.debug(f"Stopping {args[0]}: {stop_error!r}")
+                    if stdin is not None:
+                        close_stdin()
+                    next_signal_time = time.monotonic()
+            if next_signal_time is not None and time.monotonic() >= next_signal_time \
+                    and process.poll() is None:
+                process.send_signal(next(stop_signals, signal.SIGKILL))
+                next_signal_time = time.monotonic() + HASHCAT_STOP_GRACE
+        # the pipes might be held open by the children of the process
+        while handle_events(timeout=0):
+            pass
+    finally:
+        selector.close()
+        if process.poll() is None:
+            process.kill()
+        for pipe in (process.stdin, process.stdout, process.stderr):
+            if pipe is not None:
+                try:
+                    pipe.close()
+                except BrokenPipeError:
+                    pass
+        process.wait()
+    if stop_error is not None:
+        raise stop_error
+    stdout = output[process.stdout].decode('utf-8', errors='ignore')
+    stderr = output[process.stderr].decode('utf-8', errors='ignore')
+    if stderr or process.returncode not in (0, 1):
+        # return code 1 means exhausted
+        logger.debug(stdout)
+        logger.error(stderr)
+    return stdout, stderr
+
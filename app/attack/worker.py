@@ -1,30 +1,53 @@
 import concurrent.futures
 import re
-import time
+import threading
 from asyncio import CancelledError
+from functools import partial
 from pathlib import Path
+from typing import List, Union
 
 from app import app, db, lock_app
 from app.attack.base_attack import BaseAttack
-from app.attack.hashcat_cmd import run_with_status, HashcatCmdCapture
-from app.config import BENCHMARK_FILE
-from app.domain import Rule, TaskInfoStatus, InvalidFileError, ProgressLock
+from app.attack.hash_registry import task_hash_lines, resolve_attached, cancel_attached
+from app.attack.hashcat_cmd import run_with_status, HashcatCmdRestore
+from app.attack.ingest import ingest_capture
+from app.attack.job_queue import JobQueue, JobKind, JobState
+from app.attack.pmk_table import start_pmk_tables_updater
+from app.attack.potfile import potfile_index, hash_id_of_line, hash_id_of_key_line
+from app.attack.scheduler import DeviceScheduler
+from app.attack.status import HashcatStatus
+from app.config import BENCHMARK_FILE, HASHCAT_SESSIONS_DIR, JOB_QUEUE_CONSUMER, JOB_QUEUE_POLL, JOB_QUEUE_PREFETCH, \
+    FUSED_FAST_STAGES, INGEST_WORKERS
+from app.domain import Rule, TaskInfoStatus, InvalidFileError, ProgressLock, ProgressLockGroup
 from app.logger import logger
-from app.uploader import UploadForm, UploadedTask
+from app.uploader import UploadedTask, record_status
 from app.utils import read_plain_key, date_formatted, subprocess_call, read_hashcat_brain_password
+from app.word_magic.estimate import count_main_wordlist_candidates
+from app.word_magic.wordlist import download_wordlist, scan_wordlists
 
 
 class CapAttack(BaseAttack):
 
     def __init__(self, file_22000, lock: ProgressLock, wordlist: Path = None, rule: Rule = None,
-                 hashcat_args=(), timeout=None):
+                 hashcat_args=(), timeout=None, resume_stage: str = None, resume_session: str = None):
+        """
+        :param resume_stage: the stage to resume an interrupted task from
+        :param resume_session: the hashcat session of the interrupted stage
+        """
         super().__init__(file_22000=file_22000,
                          hashcat_args=hashcat_args,
-                         verbose=False)
+                         verbose=False,
+                         fused=FUSED_FAST_STAGES)
         self.lock = lock
         self.timeout = timeout
         self.wordlist = wordlist
         self.rule = rule
+        self.devices = ()
+        self.task_id = lock.task_id
+        # the file names of different uploads collide
+        self.session = f"task_{self.task_id}"
+        self.resume_stage = resume_stage
+        self.resume_session = resume_session
 
     def cancel_if_needed(self):
         with self.lock:
@@ -35,10 +58,50 @@ class CapAttack(BaseAttack):
         self.cancel_if_needed()
         return not self.key_file.exists()
 
+    def set_devices(self, devices):
+        self.devices = tuple(devices)
+
+    def new_cmd(self, hcap_file: Union[str, Path] = None, outfile: Union[str, Path] = None, session: str = None):
+        hashcat_cmd = super().new_cmd(hcap_file=hcap_file, outfile=outfile, session=session)
+        hashcat_args = [*hashcat_cmd.hashcat_args,
+                        f"--restore-file-path={restore_file_path(hashcat_cmd.session)}"]
+        if self.devices:
+            hashcat_args.append(f"--backend-devices={','.join(map(str, self.devices))}")
+        hashcat_cmd.hashcat_args = tuple(hashcat_args)
+        return hashcat_cmd
+
+    def save_stage(self, stage: str, session: str = None):
+        # persisted to resume the task after a restart
+        if session is None:
+            session = self.session
+        with lock_app:
+            with app.app_context():
+                UploadedTask.query.filter_by(id=self.task_id).update(dict(stage=stage, session=session))
+                db.session.commit()
+
+    def restore_session(self):
+        """
+        :return: the hashcat session to restore the main wordlist from or None
+        """
+        if self.resume_stage != "main_wordlist" or self.resume_session is None:
+            return None
+        if not restore_file_path(self.resume_session).exists():
+            return None
+        return self.resume_session
+
+    def main_wordlist_key(self):
+        # the tasks of the same key can share a main wordlist run
+        return str(self.wordlist), self.rule, self.hashcat_args, self.timeout
+
     def read_key(self):
-        dump_keys_cmd = HashcatCmdCapture(self.file_22000, outfile=self.key_file, hashcat_args=['--show'])
-        subprocess_call(dump_keys_cmd.build())
-        key_password = read_plain_key(self.key_file)
+        # the potfile index has the keys of the hashes cracked before, which
+        # hashcat skips without writing them to the outfile, and of the hash
+        # lines of the task cracked by other tasks
+        with open(self.file_22000) as f:
+            hash_lines = f.read().splitlines()
+        with lock_app, app.app_context():
+            hash_lines.extend(task_hash_lines(self.task_id))
+        key_password = read_plain_key(self.key_file) or potfile_index.found_key(hash_lines)
         with self.lock:
             self.lock.found_key = key_password
 
@@ -75,28 +138,63 @@ class CapAttack(BaseAttack):
             self.lock.set_status("Running digits8")
         super().run_digits8()
 
+    def run_fused(self):
+        if not self.is_attack_needed():
+            return
+        with self.lock:
+            self.lock.set_status("Running fast attacks")
+        super().run_fused()
+
+    def wait_wordlist(self, lock=None):
+        """
+        Wait for the main wordlist to be downloaded.
+
+        :param lock: the lock to report the download progress to
+        """
+        if lock is None:
+            lock = self.lock
+        if self.wordlist.exists():
+            return
+        download = download_wordlist(self.wordlist)
+        with lock:
+            lock.set_status("Downloading the wordlist")
+        # released by the download event; the timeout is to check cancellation
+        while not download.wait(timeout=5):
+            with lock:
+                if lock.cancelled:
+                    raise CancelledError(TaskInfoStatus.CANCELLED)
+            progress = download.progress
+            if progress is not None:
+                with lock:
+                    lock.set_status(f"Downloading the wordlist ({progress:.0f}%)")
+        if download.error is not None:
+            raise download.error
+
     def run_main_wordlist(self):
         """
         Run main attack, specified by the user through the client app.
         """
         if self.wordlist is None or not self.is_attack_needed():
             return
-        if not self.wordlist.exists():
-            with self.lock:
-                self.lock.set_status("Downloading the wordlist")
-            while not self.wordlist.exists():
-                time.sleep(5)
-                self.cancel_if_needed()
+        self.wait_wordlist()
         with self.lock:
             self.lock.set_status("Running the main wordlist")
-        hashcat_cmd = self.new_cmd()
-        hashcat_cmd.add_wordlists(self.wordlist)
-        hashcat_cmd.add_rule(self.rule)
-        run_with_status(hashcat_cmd, lock=self.lock, timeout_minutes=self.timeout)
+        self.save_stage("main_wordlist")
+        if self.restore_session() == self.session:
+            hashcat_cmd = HashcatCmdRestore(self.session, restore_file_path(self.session))
+        else:
+            hashcat_cmd = self.new_cmd()
+            hashcat_cmd.add_wordlists(self.wordlist)
+            hashcat_cmd.add_rule(self.rule)
+        run_with_status(hashcat_cmd, lock=self.lock, timeout_minutes=self.timeout, devices=self.devices,
+                        on_status=self.record_status)
+
+    def record_status(self, status: HashcatStatus):
+        record_status(self.task_id, status, stage="main_wordlist")
 
     def run_all(self):
         """
-        Run all attacks.
+        Run all attacks but the main wordlist, which is scheduled separately.
         """
         with self.lock:
             task_id = self.lock.task_id
@@ -105,51 +203,182 @@ class CapAttack(BaseAttack):
                 task = UploadedTask.query.get(task_id)
                 task.status = TaskInfoStatus.RUNNING
                 db.session.commit()
-        super().run_all()
-        self.run_main_wordlist()
+        stages = self.stages()
+        names = [name for name, attack in stages]
+        if self.resume_stage in names:
+            # the stages before the interrupted one are done
+            stages = stages[names.index(self.resume_stage):]
+        for name, attack in stages:
+            self.save_stage(name)
+            attack()
+
+
+def restore_file_path(session: str) -> Path:
+    return HASHCAT_SESSIONS_DIR / f"{session}.restore"
 
 
-def _crack_async(attack: CapAttack):
+def run_main_wordlist_coalesced(attacks: List[CapAttack]):
+    """
+    Run the main wordlist of several tasks in a single hashcat run over the
+    joint hashes. The tasks must share the `main_wordlist_key`.
+    The joint hashes are kept in HASHCAT_SESSIONS_DIR until the run finishes
+    to restore the run after a restart.
+    """
+    leader = attacks[0]
+    lock = ProgressLockGroup(attack.lock for attack in attacks)
+    leader.wait_wordlist(lock=lock)
+    with lock:
+        lock.set_status(f"Running the main wordlist (shared by {len(attacks)} tasks)")
+    session = leader.restore_session()
+    restore = session is not None and all(attack.restore_session() == session for attack in attacks)
+    if not restore:
+        session = f"coalesced_{leader.task_id}"
+    file_22000 = HASHCAT_SESSIONS_DIR / f"{session}.22000"
+    outfile = file_22000.with_suffix('.key')
+    for attack in attacks:
+        attack.save_stage("main_wordlist", session=session)
+    if restore:
+        hashcat_cmd = HashcatCmdRestore(session, restore_file_path(session))
+    else:
+        with open(file_22000, 'w') as f:
+            for attack in attacks:
+                f.writelines(f"{line}\n" for line in attack.file_22000.read_text().splitlines())
+        outfile.unlink(missing_ok=True)
+        hashcat_cmd = leader.new_cmd(hcap_file=file_22000, outfile=outfile, session=session)
+        hashcat_cmd.add_wordlists(leader.wordlist)
+        hashcat_cmd.add_rule(leader.rule)
+
+    def on_status(status: HashcatStatus):
+        for attack in attacks:
+            attack.record_status(status)
+
+    run_with_status(hashcat_cmd, lock=lock, timeout_minutes=leader.timeout, devices=leader.devices,
+                    on_status=on_status)
+    if outfile.exists():
+        _distribute_keys(outfile.read_text().splitlines(), attacks)
+    file_22000.unlink(missing_ok=True)
+    outfile.unlink(missing_ok=True)
+
+
+def _distribute_keys(key_lines, attacks: List[CapAttack]):
+    # the outfile lines are 'hash:mac_ap:mac_sta:essid:password'
+    key_lines = [(hash_id_of_key_line(line), line) for line in key_lines]
+    for attack in attacks:
+        with attack.lock:
+            if attack.lock.cancelled:
+                continue
+        hash_ids = {hash_id_of_line(line) for line in attack.file_22000.read_text().splitlines() if line}
+        found = [line for hash_id, line in key_lines if hash_id in hash_ids]
+        if found:
+            with open(attack.key_file, 'a') as f:
+                f.writelines(f"{line}\n" for line in found)
+
+
+def _crack_async(attack: CapAttack, devices=()):
     """
     Called in background process.
     :param attack: hashcat attack to crack uploaded capture
+    :param devices: hashcat device IDs assigned by the scheduler
     """
+    attack.set_devices(devices)
     attack.check_not_empty()
     attack.run_all()
     attack.read_key()
-    logger.info(f"Finished cracking {attack.file_22000}")
+    logger.info(f"Finished the fast attacks of {attack.file_22000}")
     for name, timer in attack.timers.items():
         elapsed = timer['elapsed'] / timer['count']
         logger.debug(f"Timer {name}: {elapsed:.2f} sec")
 
 
-def _hashcat_benchmark_async():
+def _crack_main_wordlist_async(attacks: List[CapAttack], devices=()):
+    """
+    Called in background process.
+    :param attacks: the attacks that share the main wordlist, rule and hashcat args
+    :param devices: hashcat device IDs assigned by the scheduler
+    :return: a list of results (None or an exception) of each attack
+    """
+    results = [None] * len(attacks)
+    attacks_needed = []
+    for index, attack in enumerate(attacks):
+        attack.set_devices(devices)
+        try:
+            if attack.is_attack_needed():
+                attacks_needed.append(attack)
+        except CancelledError as error:
+            results[index] = error
+    if len(attacks_needed) == 1 and attacks_needed[0].restore_session() in (None, attacks_needed[0].session):
+        attacks_needed[0].run_main_wordlist()
+    elif attacks_needed:
+        # a single task can restore a coalesced run it took part in
+        logger.info(f"Running the main wordlist {attacks_needed[0].wordlist} for {len(attacks_needed)} tasks")
+        run_main_wordlist_coalesced(attacks_needed)
+    for index, attack in enumerate(attacks):
+        if results[index] is None:
+            try:
+                # the task might be cancelled and detached during the run
+                attack.cancel_if_needed()
+            except CancelledError as error:
+                results[index] = error
+                continue
+            attack.read_key()
+            logger.info(f"Finished cracking {attack.file_22000}")
+    return results
+
+
+def _hashcat_benchmark_async(devices=()):
     """
     Called in background process.
     """
-    out, err = subprocess_call(['hashcat', '-m2500', "-b", "--machine-readable", "--quiet", "--force"])
-    pattern = re.compile("\d+:2500:.*:.*:\d+\.\d+:\d+")
+    # attacks run in the 22000 mode
+    mode = '22000'
+    out, err = subprocess_call(['hashcat', f'-m{mode}', "-b", "--machine-readable", "--quiet", "--force"])
+    pattern = re.compile(rf"\d+:{mode}:.*:.*:\d+\.\d+:\d+")
     total_speed = 0
     for line in filter(pattern.fullmatch, out.splitlines()):
         device_speed = int(line.split(':')[-1])
         total_speed += device_speed
     if total_speed > 0:
-        snapshot = "{date},{speed}\n".format(date=date_formatted(), speed=total_speed)
+        snapshot = "{date},{speed},{mode}\n".format(date=date_formatted(), speed=total_speed, mode=mode)
         with lock_app, open(BENCHMARK_FILE, 'a') as f:
             f.write(snapshot)
 
 
 class HashcatWorker:
-    def __init__(self, app):
+    def __init__(self, app, consume=JOB_QUEUE_CONSUMER):
         """
         Called in main process.
         :param app: flask app
+        :param consume: claim and run the jobs of the queue in this process;
+                        the consumer starts in `start()`
         """
-        # we don't need more than 1 thread since hashcat utilizes all devices at once
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # jobs run concurrently on the device subsets of `hashcat -I`
+        self.scheduler = DeviceScheduler()
+        # the uploads are converted and split aside of the hashcat devices
+        self.ingest_executor = concurrent.futures.ThreadPoolExecutor(max_workers=INGEST_WORKERS,
+                                                                     thread_name_prefix="ingest")
         self.app = app
+        self.queue = JobQueue()
         self.locks = {}
-        self.locks_onetime = []
+        self._detached = set()  # the jobs of the tasks cancelled while running
+        self.claims = {}  # job id -> (ClaimedJob, ProgressLock or None)
+        self._claims_lock = threading.Lock()
+        self._lost_tasks = set()  # the tasks that are run by another consumer now
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self.consumer = None
+        if consume:
+            self.consumer = threading.Thread(target=self._consume, name="job-queue", daemon=True)
+
+    def start(self):
+        """
+        Called in main process once the database tables are created.
+        """
+        if self.consumer is not None:
+            # discover the hashcat devices before the first job is claimed
+            self.scheduler.discover_devices()
+            self.consumer.start()
+            start_pmk_tables_updater()
+            threading.Thread(target=scan_wordlists, name="scan-wordlists", daemon=True).start()
         if not BENCHMARK_FILE.exists():
             self.benchmark()
 
@@ -162,7 +391,12 @@ class HashcatWorker:
         if exception is not None:
             logger.exception(repr(exception), exc_info=False)
         job_id = id(future)
-        lock = self.locks.pop(job_id, None)
+        with self._claims_lock:
+            if job_id in self._detached:
+                # finished in `cancel`
+                self._detached.discard(job_id)
+                return
+            lock = self.locks.pop(job_id, None)
         if lock is None:
             logger.error("Could not find lock for job {}".format(job_id))
             return
@@ -172,49 +406,229 @@ class HashcatWorker:
             else:
                 lock.set_status(TaskInfoStatus.COMPLETED)
             if exception is not None:
-                if isinstance(exception, CancelledError):
+                if isinstance(exception, (CancelledError, InterruptedError)):
                     lock.set_status(TaskInfoStatus.CANCELLED)
                 else:
                     lock.set_status(repr(exception))
             lock.finish()
             update_dict = lock.update_dict()
             task_id = lock.task_id
+        with self._claims_lock:
+            if task_id in self._lost_tasks:
+                self._lost_tasks.discard(task_id)
+                return
         with app.app_context():
             UploadedTask.query.filter_by(id=task_id).update(update_dict)
             db.session.commit()
-        self.locks_onetime.append(lock)
+        if future.cancelled() or isinstance(exception, (CancelledError, InterruptedError)):
+            state = JobState.CANCELLED
+        elif exception is not None:
+            state = JobState.FAILED
+        else:
+            state = JobState.DONE
+        self._finish_job(task_id=task_id, state=state, error=None if exception is None else repr(exception))
 
-    def submit_capture(self, file_22000, uploaded_form: UploadForm, task: UploadedTask):
+    def submit_capture(self, task: UploadedTask):
         """
         Called in main process.
-        Starts cracking .cap file in parallel process.
-        :param uploaded_task: uploaded .cap file task
-        :param timeout: brute force timeout in minutes
-        """
-        lock = ProgressLock(task_id=task.id)
-        hashcat_args = uploaded_form.hashcat_args(secret=True)
-        hashcat_args.append(f"--workload-profile={uploaded_form.workload.data}")
-        wordlist_path = uploaded_form.get_wordlist_path()
-        rule = uploaded_form.get_rule()
-        attack = CapAttack(file_22000=file_22000,
-                           lock=lock,
-                           wordlist=wordlist_path,
-                           rule=rule,
-                           hashcat_args=hashcat_args,
-                           timeout=uploaded_form.timeout.data)
-        future = self.executor.submit(_crack_async, attack=attack)
-        future.add_done_callback(self.callback_attack)
-        with lock:
-            lock.future = future
-        self.locks[id(future)] = lock
+        Queues the uploaded task to be ingested or cracked by a job queue
+        consumer.
+        """
+        if task.duplicate_of is not None:
+            # waits for the task that cracks the same hashes
+            self._resolve_attached(task.duplicate_of)
+            return
+        kind = JobKind.INGEST if task.status == TaskInfoStatus.INGESTING else JobKind.CRACK
+        self.queue.enqueue(kind=kind, task_id=task.id)
+        self._wakeup.set()
 
     def benchmark(self):
         """
         Run hashcat WPA benchmark.
         """
-        self.executor.submit(_hashcat_benchmark_async)
+        self.queue.enqueue(kind=JobKind.BENCHMARK, priority=1)
+        self._wakeup.set()
+
+    def _consume(self):
+        # the job queue consumer thread
+        while not self._stop.is_set():
+            try:
+                self._heartbeat()
+                self._claim_jobs()
+            except Exception as error:
+                # the database can be locked for long; retry later
+                logger.exception(error)
+            self._wakeup.wait(timeout=JOB_QUEUE_POLL)
+            self._wakeup.clear()
+
+    def _heartbeat(self):
+        progress = {}
+        with self._claims_lock:
+            claims = tuple(self.claims.values())
+        for claim, lock in claims:
+            if lock is not None:
+                with lock:
+                    progress[claim.id] = (lock.progress, lock.status)
+        cancelled, lost = self.queue.heartbeat([claim for claim, lock in claims], progress=progress)
+        for claim, lock in claims:
+            if claim.id in lost:
+                logger.warning(f"Job {claim.id} of task {claim.task_id} is claimed by another consumer")
+                with self._claims_lock:
+                    self.claims.pop(claim.id, None)
+                    self._lost_tasks.add(claim.task_id)
+            if lock is not None and (claim.id in cancelled or claim.id in lost):
+                with lock:
+                    lock.cancel()
+
+    def _count_claims(self, *kinds) -> int:
+        with self._claims_lock:
+            return sum(claim.kind in kinds for claim, lock in self.claims.values())
+
+    def _claim_jobs(self):
+        while self._count_claims(JobKind.INGEST) < INGEST_WORKERS:
+            claim = self.queue.claim(kinds=(JobKind.INGEST,))
+            if claim is None:
+                break
+            self._start_ingest(claim)
+        capacity = len(self.scheduler.slots) * JOB_QUEUE_PREFETCH
+        while self._count_claims(JobKind.CRACK, JobKind.BENCHMARK) < capacity:
+            claim = self.queue.claim()
+            if claim is None:
+                return
+            if claim.kind == JobKind.BENCHMARK:
+                with self._claims_lock:
+                    self.claims[claim.id] = (claim, None)
+                future = self.scheduler.submit(_hashcat_benchmark_async, exclusive=True)
+                future.add_done_callback(partial(self._callback_benchmark, claim=claim))
+            else:
+                self._start_task(claim)
+
+    def _callback_benchmark(self, future: concurrent.futures.Future, claim):
+        exception = None if future.cancelled() else future.exception()
+        if exception is not None:
+            logger.exception(repr(exception), exc_info=False)
+        with self._claims_lock:
+            self.claims.pop(claim.id, None)
+        self.queue.finish(claim, state=JobState.DONE if exception is None else JobState.FAILED,
+                          error=None if exception is None else repr(exception))
+
+    def _start_ingest(self, claim):
+        with self._claims_lock:
+            self.claims[claim.id] = (claim, None)
+        future = self.ingest_executor.submit(ingest_capture, claim.task_id)
+        future.add_done_callback(partial(self._callback_ingest, claim=claim))
+
+    def _callback_ingest(self, future: concurrent.futures.Future, claim):
+        exception = None if future.cancelled() else future.exception()
+        with self._claims_lock:
+            self.claims.pop(claim.id, None)
+        if exception is not None:
+            logger.exception(repr(exception), exc_info=False)
+            with lock_app, app.app_context():
+                UploadedTask.query.filter_by(id=claim.task_id).update(dict(status=repr(exception), completed=True))
+                db.session.commit()
+            self.queue.finish(claim, state=JobState.FAILED, error=repr(exception))
+            return
+        for task_id in future.result():
+            self.queue.enqueue(kind=JobKind.CRACK, task_id=task_id)
+        self.queue.finish(claim, state=JobState.DONE)
+        self._wakeup.set()
+
+    def _start_task(self, claim):
+        with app.app_context():
+            task = UploadedTask.query.get(claim.task_id)
+            if task is not None and not task.completed:
+                try:
+                    attack = self._attack_from_task(task)
+                except (FileNotFoundError, InvalidFileError) as error:
+                    logger.exception(error)
+                    task.status = TaskInfoStatus.ABORTED
+                    task.completed = True
+                    db.session.commit()
+                    self.queue.finish(claim, state=JobState.FAILED, error=repr(error))
+                    self._resolve_attached(claim.task_id)
+                    return
+                stage = task.stage
+        if task is None or task.completed:
+            self.queue.finish(claim, state=JobState.CANCELLED)
+            self._resolve_attached(claim.task_id)
+            return
+        with self._claims_lock:
+            self.claims[claim.id] = (claim, attack.lock)
+        if claim.attempt > 1:
+            logger.info(f"Resuming task {claim.task_id} from the '{stage}' stage")
+        if stage == "main_wordlist":
+            self._submit_main_wordlist(attack)
+        else:
+            self._submit_fast_attacks(attack)
+
+    def _finish_job(self, task_id: int, state: str, error: str = None):
+        with self._claims_lock:
+            claims = [claim for claim, lock in self.claims.values() if claim.task_id == task_id]
+            for claim in claims:
+                del self.claims[claim.id]
+        for claim in claims:
+            self.queue.finish(claim, state=state, error=error)
+        self._resolve_attached(task_id)
+        self._wakeup.set()
+
+    def _resolve_attached(self, task_id: int):
+        for attached_id in resolve_attached(task_id):
+            self.queue.enqueue(kind=JobKind.CRACK, task_id=attached_id)
+
+    @staticmethod
+    def _attack_from_task(task: UploadedTask) -> CapAttack:
+        # the stage of an interrupted task is resumed
+        hashcat_args = task.hashcat_args.split()
+        if "--brain-client" in hashcat_args:
+            hashcat_args.append(f"--brain-password={read_hashcat_brain_password()}")
+        if task.workload is not None:
+            hashcat_args.append(f"--workload-profile={task.workload}")
+        wordlist = Path(task.wordlist_path) if task.wordlist_path is not None else None
+        return CapAttack(file_22000=task.file_22000,
+                         lock=ProgressLock(task_id=task.id),
+                         wordlist=wordlist,
+                         rule=Rule.from_data(task.rule),
+                         hashcat_args=hashcat_args,
+                         timeout=task.timeout,
+                         resume_stage=task.stage,
+                         resume_session=task.session)
+
+    def _submit_fast_attacks(self, attack: CapAttack):
+        future = self.scheduler.submit(_crack_async, attack=attack)
+        with attack.lock:
+            attack.lock.future = future
+        self.locks[id(future)] = attack.lock
+        future.add_done_callback(partial(self.callback_fast_attacks, attack=attack))
+
+    def _submit_main_wordlist(self, attack: CapAttack, future_fast: concurrent.futures.Future = None):
+        size = count_main_wordlist_candidates(attack.wordlist, rule=attack.rule)
+        # a restored run is merged only with the tasks of the same session
+        key = attack.restore_session() or attack.main_wordlist_key()
+        future = self.scheduler.submit_coalesced(_crack_main_wordlist_async, item=attack,
+                                                 key=key, size=size or 0)
+        with attack.lock:
+            attack.lock.future = future
+        if future_fast is not None:
+            self.locks.pop(id(future_fast), None)
+        self.locks[id(future)] = attack.lock
+        future.add_done_callback(self.callback_attack)
+
+    def callback_fast_attacks(self, future: concurrent.futures.Future, attack: CapAttack):
+        # called when the fast attacks are done or cancelled; the main wordlist
+        # is queued to be merged with the other tasks of the same wordlist
+        lock = attack.lock
+        if future.cancelled() or future.exception() is not None or attack.wordlist is None:
+            self.callback_attack(future)
+            return
+        with lock:
+            if lock.cancelled or lock.found_key is not None:
+                self.callback_attack(future)
+                return
+        self._submit_main_wordlist(attack, future_fast=future)
 
     def terminate(self):
+        self.queue.cancel_all()
         for lock in tuple(self.locks.values()):
             with lock:
                 lock.cancel()
@@ -224,9 +638,46 @@ class HashcatWorker:
     def cancel(self, task_id: int):
         for job_id, lock in tuple(self.locks.items()):
             with lock:
-                if lock.task_id == task_id:
-                    return lock.cancel()
-        return False
+                if lock.task_id != task_id:
+                    continue
+                if lock.cancel():
+                    # not started yet
+                    return True
+            # the run goes on for the other tasks of a coalesced run
+            self._detach(job_id)
+            return True
+        # queued or running in another process
+        if self.queue.cancel(task_id):
+            self._resolve_attached(task_id)
+            return True
+        return cancel_attached(task_id)
+
+    def _detach(self, job_id: int):
+        # finish a task cancelled while running without waiting for its run
+        with self._claims_lock:
+            lock = self.locks.pop(job_id, None)
+            if lock is None:
+                return
+            self._detached.add(job_id)
+        with lock:
+            lock.finish()
+            update_dict = lock.update_dict()
+        with app.app_context():
+            UploadedTask.query.filter_by(id=lock.task_id).update(update_dict)
+            db.session.commit()
+        self._finish_job(task_id=lock.task_id, state=JobState.CANCELLED)
 
     def __del__(self):
-        self.executor.shutdown(wait=False)
+        # the worker might not be fully initialized
+        if hasattr(self, '_stop'):
+            self._stop.set()
+        if hasattr(self, 'scheduler'):
+            self.scheduler.shutdown()
+        if hasattr(self, 'ingest_executor'):
+            self.ingest_executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    # A standalone cracking daemon. Run the web tier with JOB_QUEUE_CONSUMER=0.
+    from app.views import hashcat_worker
+    hashcat_worker.consumer.join()
@@ -1,3 +1,4 @@
+import os
 import secrets
 from pathlib import Path
 
@@ -6,34 +7,116 @@ ROOT_PRIVATE_DIR = Path(__file__).parent.parent
 
 WORDLISTS_DIR = ROOT_PRIVATE_DIR / "wordlists"
 WORDLISTS_USER_DIR = HASHCAT_WPA_CACHE_DIR / "wordlists"  # user custom wordlists
+WORDLISTS_STATS_DIR = HASHCAT_WPA_CACHE_DIR / "wordlists_stats"
 RULES_DIR = ROOT_PRIVATE_DIR / "rules"
 MASKS_DIR = ROOT_PRIVATE_DIR / "masks"
 LOGS_DIR = ROOT_PRIVATE_DIR / "logs"
 
 DATABASE_DIR = HASHCAT_WPA_CACHE_DIR / "database"
-ESSID_TRIED = DATABASE_DIR / "essid_tried"
+ESSID_TRIED = DATABASE_DIR / "essid_tried"  # legacy, imported in ESSID_TRIED_DB
+ESSID_TRIED_DB = DATABASE_DIR / "essid_tried.db"
 DATABASE_PATH = DATABASE_DIR / "hashcat_wpa.db"
+POTFILE_INDEX_DB = DATABASE_DIR / "potfile.db"
+
+# Generated ESSID password candidates
+CANDIDATES_CACHE_DIR = HASHCAT_WPA_CACHE_DIR / "candidates"
+CANDIDATES_CACHE_MAX_BYTES = int(os.getenv('CANDIDATES_CACHE_MAX_BYTES', 2 * 2 ** 30))
 
 # Hashcat
 HASHCAT_STATUS_TIMER = 20  # seconds
+HASHCAT_POTFILE = Path.home() / ".hashcat" / "hashcat.potfile"
+POTFILE_PAGE_SIZE = 1000  # potfile lines per page of /hashcat.potfile
+# The supervisor checks the cancellation and the deadline of a hashcat run
+# every SUPERVISOR_POLL seconds and waits HASHCAT_STOP_GRACE seconds after
+# SIGINT and SIGTERM before the next signal.
+SUPERVISOR_POLL = 0.2
+HASHCAT_STOP_GRACE = 5
+STATUS_SAMPLES_MAX = 500  # hashcat status samples stored per task
+# Uploaded captures are written to disk in chunks and hashed on the fly
+UPLOAD_CHUNK_SIZE = 2 ** 20
+MAX_CAPTURE_SIZE = int(os.getenv('MAX_CAPTURE_SIZE', 2 ** 32))  # bytes
+# Each candidate of a hashcat run is hashed against all ESSIDs of the run,
+# so only the ESSIDs with few candidates share a run: the ESSIDs are batched
+# while the candidates of a batch do not exceed ESSID_BATCH_CANDIDATES, up
+# to ESSID_BATCH_SIZE ESSIDs. An ESSID with more candidates runs alone.
+ESSID_BATCH_SIZE = 8
+ESSID_BATCH_CANDIDATES = int(os.getenv('ESSID_BATCH_CANDIDATES', 100_000))
+# Run the fast stages of the uploaded tasks in a single hashcat process
+FUSED_FAST_STAGES = bool(int(os.getenv('FUSED_FAST_STAGES', 1)))
+# Extract the hashes of pcap and pcapng captures in-process; the lines of
+# hcxpcapngtool are merged in if it is installed, and it converts the
+# captures the in-process extractor finds no hashes in
+NATIVE_PCAP_CONVERTER = bool(int(os.getenv('NATIVE_PCAP_CONVERTER', 1)))
+# Jobs with more main wordlist candidates run on all free devices but one,
+# the others run on a single device
+LARGE_JOB_CANDIDATES = 10 ** 8
 BENCHMARK_FILE = HASHCAT_WPA_CACHE_DIR / "benchmark.csv"
+# PMK tables of the fast stage wordlists for the ESSIDs of at least
+# PMK_ESSID_MIN_UPLOADS tasks, updated every PMK_TABLES_INTERVAL seconds
+PMK_TABLES_DIR = HASHCAT_WPA_CACHE_DIR / "pmk"
+PMK_ESSID_MIN_UPLOADS = 3
+PMK_TABLES_ESSIDS = 10  # max ESSIDs with tables
+# hashlib releases the GIL in PBKDF2: the PMKs are computed by threads of the
+# server process, which leave the other CPUs to hashcat
+PMK_TABLES_THREADS = int(os.getenv('PMK_TABLES_THREADS', 2))
+PMK_TABLES_INTERVAL = 3600
 HASHCAT_BRAIN_PASSWORD_PATH = HASHCAT_WPA_CACHE_DIR / "brain" / "hashcat_brain_password"
+# hashcat restore files and the hashes of the coalesced runs
+HASHCAT_SESSIONS_DIR = HASHCAT_WPA_CACHE_DIR / "sessions"
+
+# Job queue
+# A consumer claims the queued jobs and runs them on the hashcat devices.
+# Disable it in the web tier when a separate cracking daemon is running.
+JOB_QUEUE_CONSUMER = os.getenv('JOB_QUEUE_CONSUMER', '1') == '1'
+JOB_QUEUE_POLL = 2  # seconds between the lease renewals and the claims of a consumer
+JOB_QUEUE_PREFETCH = 2  # jobs claimed per hashcat device
+INGEST_WORKERS = 2  # threads that convert and split the uploaded captures
+JOB_LEASE = 60  # seconds; a job of a dead consumer is claimed again after its lease expires
+JOB_MAX_ATTEMPTS = 3
+PROGRESS_POLL = 0.5  # seconds between the checks of the job versions for the progress streams
+PROGRESS_STREAM_TIMEOUT = 60  # seconds; a progress stream is reopened by the browser
+# the progress streams of a process, each holding a thread; the other clients poll the progress
+PROGRESS_MAX_STREAMS = int(os.getenv('PROGRESS_MAX_STREAMS', 16))
+PROGRESS_KEEP_ALIVE = 15  # seconds
 
 # mkdirs
 HASHCAT_WPA_CACHE_DIR.mkdir(exist_ok=True, parents=True)
 WORDLISTS_USER_DIR.mkdir(exist_ok=True)
+WORDLISTS_STATS_DIR.mkdir(exist_ok=True)
 LOGS_DIR.mkdir(exist_ok=True)
 DATABASE_DIR.mkdir(exist_ok=True)
+CANDIDATES_CACHE_DIR.mkdir(exist_ok=True)
 HASHCAT_BRAIN_PASSWORD_PATH.parent.mkdir(exist_ok=True)
+HASHCAT_SESSIONS_DIR.mkdir(exist_ok=True)
+
+
+def read_secret_key(path: Path = HASHCAT_WPA_CACHE_DIR / "secret_key") -> bytes:
+    # shared by all processes of the web tier to accept each other's sessions
+    if not path.exists():
+        path_tmp = path.with_name(f"{path.name}.{os.getpid()}")
+        path_tmp.write_bytes(secrets.token_bytes(64))
+        path_tmp.chmod(0o600)
+        try:
+            # atomic: the first process wins
+            os.link(path_tmp, path)
+        except FileExistsError:
+            pass
+        path_tmp.unlink()
+    return path.read_bytes()
+
 
 class Config:
     """ Flask application config """
 
-    SECRET_KEY = secrets.token_bytes(64)
+    SECRET_KEY = read_secret_key()
 
     # Flask-SQLAlchemy settings
     SQLALCHEMY_DATABASE_URI = "sqlite:///{}".format(DATABASE_PATH)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # several processes share the database: wait for the write lock
+    SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"timeout": 60}}
 
     # Airodump capture files
     CAPTURES_DIR = HASHCAT_WPA_CACHE_DIR / "captures"
+    # larger requests are rejected before the body is read; leaves room for the form fields
+    MAX_CONTENT_LENGTH = MAX_CAPTURE_SIZE + 2 ** 20
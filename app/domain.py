@@ -9,7 +9,7 @@ from typing import Union
 from app.config import WORDLISTS_DIR, RULES_DIR, MASKS_DIR
 
 NONE_STR = str(None)
-Benchmark = namedtuple('Benchmark', ('date', 'speed'))
+Benchmark = namedtuple('Benchmark', ('date', 'speed', 'mode'))
 
 
 class InvalidFileError(Exception):
@@ -134,7 +134,9 @@ class Workload(Enum):
 
 
 class TaskInfoStatus:
+    INGESTING = "Ingesting"  # the uploaded capture is being converted and split by ESSID
     SCHEDULED = "Scheduled"  # added to the tasks queue
+    ATTACHED = "Attached"  # waits for the result of a task that cracks the same hashes
     RUNNING = "Running"  # started execution
     COMPLETED = "Completed"  # all attacks run
     CANCELLED = "Cancelled"  # user cancelled
@@ -149,7 +151,7 @@ class ProgressLock:
         self.progress = 0
         self.status = TaskInfoStatus.SCHEDULED
         self.found_key = None
-        self.cancelled = False  # needed in hashcat_cmd.run_with_status()
+        self.cancelled = False  # checked by the hashcat supervisor
         self.completed = False  # checked in /progress
         self._start_time = time.time()
 
@@ -186,3 +188,45 @@ class ProgressLock:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._lock.release()
+
+
+class ProgressLockGroup:
+    """
+    The locks of the tasks that share a hashcat run. The progress and status
+    are sent to each lock; a cancelled task is detached from the run, which
+    is cancelled when all tasks are cancelled.
+    """
+
+    def __init__(self, locks):
+        self._locks = tuple(locks)
+        self._lock = threading.RLock()
+
+    @property
+    def locks(self):
+        # the tasks that are not cancelled
+        return tuple(lock for lock in self._locks if not lock.cancelled)
+
+    @property
+    def cancelled(self):
+        return len(self.locks) == 0
+
+    @property
+    def progress(self):
+        return min((lock.progress for lock in self.locks), default=100)
+
+    @progress.setter
+    def progress(self, progress):
+        for lock in self.locks:
+            with lock:
+                lock.progress = progress
+
+    def set_status(self, status):
+        for lock in self.locks:
+            with lock:
+                lock.set_status(status)
+
+    def __enter__(self):
+        self._lock.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._lock.release()
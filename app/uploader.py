@@ -1,23 +1,74 @@
 import datetime
+import hashlib
+import json
 from pathlib import Path
+from typing import List, Dict, Tuple, BinaryIO
 
-from flask_uploads import UploadSet, configure_uploads
+import sqlalchemy
+from flask_uploads import UploadSet, UploadNotAllowed, configure_uploads, extension
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms.fields import RadioField, SubmitField, BooleanField, IntegerField
+from werkzeug.exceptions import RequestEntityTooLarge
 from wtforms.validators import Optional, ValidationError, NumberRange
 
-from app import app, db
+from app import app, db, lock_app
+from app.attack.status import HashcatStatus
+from app.config import STATUS_SAMPLES_MAX, UPLOAD_CHUNK_SIZE, MAX_CAPTURE_SIZE
 from app.domain import Rule, NONE_STR, TaskInfoStatus, Workload, HashcatMode, BrainClientFeature
+from app.logger import logger
 from app.utils import read_hashcat_brain_password
-from app.word_magic.wordlist import estimate_runtime_fmt, wordlist_choices, find_wordlist_by_path
+from app.word_magic.estimate import estimate_runtime_fmt
+from app.word_magic.wordlist import wordlist_choices, find_wordlist_by_path
 
 
 def check_incomplete_tasks():
+    """
+    Mark the incomplete tasks that cannot be resumed as aborted.
+
+    :return: the incomplete tasks to resume or that are still in the job queue
+    """
+    tasks_resume = []
     for task in UploadedTask.query.filter_by(completed=False):
-        task.status = TaskInfoStatus.ABORTED
-        task.completed = True
+        if task.status == TaskInfoStatus.INGESTING:
+            resumable = task.capture is not None and Path(task.capture).exists()
+        else:
+            resumable = task.file_22000 is not None and Path(task.file_22000).exists()
+        if resumable:
+            tasks_resume.append(task)
+        else:
+            task.status = TaskInfoStatus.ABORTED
+            task.completed = True
     db.session.commit()
+    return tasks_resume
+
+
+def add_missing_columns(engine: sqlalchemy.Engine = None):
+    """
+    Add the model columns that the tables of an older database lack:
+    `db.create_all()` creates only the missing tables.
+    """
+    if engine is None:
+        engine = db.engine
+    inspector = sqlalchemy.inspect(engine)
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                column_ddl = sqlalchemy.schema.CreateColumn(column).compile(dialect=engine.dialect)
+                if column.default is not None and column.default.is_scalar:
+                    # the existing rows take the default value
+                    default = sqlalchemy.literal(column.default.arg, type_=column.type) \
+                        .compile(dialect=engine.dialect, compile_kwargs=dict(literal_binds=True))
+                    column_ddl = f"{column_ddl} DEFAULT {default}"
+                conn.execute(sqlalchemy.text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+                logger.info(f"Added the column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 
 def backward_db_compatibility():
@@ -41,6 +92,58 @@ class UploadedTask(db.Model):
     completed = db.Column(db.Boolean, default=False)
     essid = db.Column(db.String(64))
     bssid = db.Column(db.String(64))
+    # needed to resume the task after a restart
+    file_22000 = db.Column(db.String(1024))
+    wordlist_path = db.Column(db.String(1024))
+    workload = db.Column(db.String(8))
+    timeout = db.Column(db.Integer)
+    capture = db.Column(db.String(1024))  # the uploaded capture file
+    checksum = db.Column(db.String(32), index=True)  # MD5 of the uploaded capture
+    duplicate_of = db.Column(db.Integer, db.ForeignKey('uploads.id'))  # the task that cracks the same hashes
+    duplicates = db.Column(db.Integer, default=0)  # the hash lines cracked by other tasks or before
+    stage = db.Column(db.String(64))  # the current attack stage
+    session = db.Column(db.String(128))  # hashcat session of the current stage
+
+
+class StatusSample(db.Model):
+    __tablename__ = "status_samples"
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('uploads.id'), index=True)
+    time = db.Column(db.DateTime, default=datetime.datetime.now)
+    stage = db.Column(db.String(64))
+    progress = db.Column(db.Float)
+    speed = db.Column(db.BigInteger)  # hashes per second of all devices
+    sample = db.Column(db.Text)  # HashcatStatus.to_dict() in JSON
+
+    def to_dict(self):
+        sample = json.loads(self.sample)
+        sample.update(time=self.time.isoformat(timespec='seconds'), stage=self.stage)
+        return sample
+
+
+def record_status(task_id: int, status: HashcatStatus, stage: str = None):
+    """
+    Add a status sample to the time series of a task.
+    Once a task has more than STATUS_SAMPLES_MAX samples, every other
+    sample is dropped: the series covers the whole run at a lower rate.
+    """
+    with lock_app, app.app_context():
+        db.session.add(StatusSample(task_id=task_id, stage=stage, progress=status.progress, speed=status.speed,
+                                    sample=json.dumps(status.to_dict())))
+        db.session.commit()
+        sample_ids = db.session.scalars(db.select(StatusSample.id).where(StatusSample.task_id == task_id)
+                                        .order_by(StatusSample.id)).all()
+        if len(sample_ids) > STATUS_SAMPLES_MAX:
+            # keep the first and the latest samples
+            drop = sample_ids[1:-1:2]
+            StatusSample.query.filter(StatusSample.id.in_(drop)).delete()
+            db.session.commit()
+            logger.debug(f"Thinned the status samples of task {task_id} to {len(sample_ids) - len(drop)}")
+
+
+def status_samples(task_id: int) -> List[Dict]:
+    samples = StatusSample.query.filter_by(task_id=task_id).order_by(StatusSample.id)
+    return [sample.to_dict() for sample in samples]
 
 
 class UploadForm(FlaskForm):
@@ -55,8 +158,8 @@ class UploadForm(FlaskForm):
                                                                            message='Airodump & Hashcat capture files only')])
     submit = SubmitField('Submit')
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         self.wordlist.choices = wordlist_choices()
 
     def get_wordlist_path(self):
@@ -90,3 +193,38 @@ class UploadForm(FlaskForm):
 
 cap_uploads = UploadSet(name='files', extensions=HashcatMode.valid_suffixes(), default_dest=lambda app: app.config['CAPTURES_DIR'])
 configure_uploads(app, cap_uploads)
+
+
+def save_capture(stream: BinaryIO, filename: str, folder: str) -> Tuple[Path, str]:
+    """
+    Write an uploaded capture to the captures folder in UPLOAD_CHUNK_SIZE
+    chunks, hashing it in the same pass. The memory does not grow with the
+    capture size.
+
+    :param stream: the file-like request body or uploaded file
+    :param folder: the subfolder of the user
+    :return: the capture path and its MD5 checksum
+    """
+    basename = cap_uploads.get_basename(filename)
+    if not cap_uploads.extension_allowed(extension(basename)):
+        raise UploadNotAllowed()
+    target_folder = Path(cap_uploads.config.destination) / folder
+    target_folder.mkdir(parents=True, exist_ok=True)
+    if (target_folder / basename).exists():
+        basename = cap_uploads.resolve_conflict(str(target_folder), basename)
+    cap_path = target_folder / basename
+    md5 = hashlib.md5()
+    size = 0
+    try:
+        with open(cap_path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+                size += len(chunk)
+                # the body of a chunked request has no length to check upfront
+                if size > MAX_CAPTURE_SIZE:
+                    raise RequestEntityTooLarge(f"The capture exceeds {MAX_CAPTURE_SIZE} bytes")
+                md5.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        cap_path.unlink(missing_ok=True)
+        raise
+    return cap_path, md5.hexdigest()
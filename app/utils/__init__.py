@@ -1,2 +1,3 @@
-from .file_io import read_plain_key, read_last_benchmark, bssid_essid_from_22000, calculate_md5, check_file_22000, read_hashcat_brain_password
-from .utils import subprocess_call, is_safe_url, date_formatted
+from .file_io import read_plain_key, read_last_benchmark, bssid_essid_from_22000, calculate_md5, check_file_22000, read_hashcat_brain_password, \
+    bssid_essid_of_line, group_22000_by_essid, Capture22000, Hash22000, iter_22000
+from .utils import subprocess_call, is_safe_url, date_formatted, iter_unique
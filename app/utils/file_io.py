@@ -1,6 +1,8 @@
 import hashlib
+from collections import namedtuple
 from pathlib import Path
 import secrets
+from typing import Iterable, Iterator, Set
 
 from app import lock_app
 from app.logger import logger
@@ -23,13 +25,27 @@ def read_plain_key(key_path):
     return ', '.join(found_keys)
 
 
-def read_last_benchmark():
+def read_last_benchmark(mode='22000'):
+    """
+    Read the last benchmark of the hashcat mode. Falls back to the last
+    benchmark of any mode: WPA modes share the PBKDF2 cost.
+    """
     if not BENCHMARK_FILE.exists():
-        return Benchmark(date="(Never)", speed=0)
+        return Benchmark(date="(Never)", speed=0, mode=mode)
     with lock_app, open(BENCHMARK_FILE) as f:
-        last_line = f.read().splitlines()[-1]
-    date_str, speed = last_line.split(',')
-    return Benchmark(date=date_str, speed=speed)
+        lines = f.read().splitlines()
+    benchmarks = []
+    for line in filter(None, lines):
+        # legacy lines have no mode
+        date_str, speed, *benchmark_mode = line.split(',')
+        benchmark_mode = benchmark_mode[0] if benchmark_mode else '2500'
+        benchmarks.append(Benchmark(date=date_str, speed=speed, mode=benchmark_mode))
+    if not benchmarks:
+        return Benchmark(date="(Never)", speed=0, mode=mode)
+    benchmarks_mode = [benchmark for benchmark in benchmarks if benchmark.mode == str(mode)]
+    if benchmarks_mode:
+        return benchmarks_mode[-1]
+    return benchmarks[-1]
 
 
 def read_hashcat_brain_password():
@@ -41,20 +57,88 @@ def read_hashcat_brain_password():
     return brain_password
 
 
-def bssid_essid_from_22000(file_22000):
+# WPA*TYPE*PMKID/MIC*MACAP*MACSTA*ESSID*ANONCE*EAPOL*MESSAGEPAIR
+# type '01' is PMKID, '02' is EAPOL; the ESSID is in hex
+Hash22000 = namedtuple('Hash22000', ('line', 'type', 'hash', 'bssid', 'station', 'essid', 'message_pair'))
+
+
+def parse_22000_line(line: str) -> Hash22000:
+    info_split = line.split('*')
+    if len(info_split) < 6 or info_split[0] != "WPA":
+        raise InvalidFileError("Not a 22000 file")
+    message_pair = info_split[8] if len(info_split) > 8 else ''
+    return Hash22000(line=line, type=info_split[1], hash=info_split[2], bssid=info_split[3],
+                     station=info_split[4], essid=info_split[5], message_pair=message_pair)
+
+
+def parse_22000_lines(lines: Iterable[str]) -> Iterator[Hash22000]:
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line:
+            yield parse_22000_line(line)
+
+
+def iter_22000(file_22000) -> Iterator[Hash22000]:
+    """
+    Lazily read the hash lines of a 22000 file.
+    """
     if not Path(file_22000).exists():
         raise FileNotFoundError(file_22000)
     with open(file_22000) as f:
-        lines = f.read().splitlines()
-    bssid_essids = set()
-    for line in lines:
-        info_split = line.split('*')
-        if len(info_split) == 0:
-            raise InvalidFileError("Not a 22000 file")
-        bssid = info_split[3]
-        essid = info_split[5]  # in hex format
-        bssid_essids.add(f"{bssid}:{essid}")
-    return iter(bssid_essids)
+        yield from parse_22000_lines(f)
+
+
+class Capture22000:
+    """
+    The unique hashes of a 22000 file, indexed by ESSID, BSSID and message
+    pair in a single pass. Hash lines that differ in the message pair only
+    are duplicates: hashcat checks the same hash twice.
+    """
+
+    def __init__(self, hashes: Iterable[Hash22000]):
+        self.hashes = []
+        self.duplicates = 0
+        self.by_essid = {}  # hex ESSID -> hashes
+        self.by_bssid = {}
+        self.by_message_pair = {}
+        seen = set()
+        for hash_22000 in hashes:
+            hash_id = '*'.join(hash_22000.line.split('*')[:8])
+            if hash_id in seen:
+                self.duplicates += 1
+                continue
+            seen.add(hash_id)
+            self.hashes.append(hash_22000)
+            self.by_essid.setdefault(hash_22000.essid, []).append(hash_22000)
+            self.by_bssid.setdefault(hash_22000.bssid, []).append(hash_22000)
+            self.by_message_pair.setdefault(hash_22000.message_pair, []).append(hash_22000)
+
+    @classmethod
+    def read(cls, file_22000):
+        return cls(iter_22000(file_22000))
+
+    def bssid_essids(self) -> Set[str]:
+        return {f"{hash_22000.bssid}:{hash_22000.essid}" for hash_22000 in self.hashes}
+
+
+def bssid_essid_from_22000(file_22000):
+    # the unique pairs in the order of the lines
+    return iter(dict.fromkeys(f"{hash_22000.bssid}:{hash_22000.essid}" for hash_22000 in iter_22000(file_22000)))
+
+
+def bssid_essid_of_line(line: str) -> str:
+    hash_22000 = parse_22000_line(line)
+    return f"{hash_22000.bssid}:{hash_22000.essid}"
+
+
+def group_22000_by_essid(file_22000) -> dict:
+    """
+    Group the unique hash lines of a 22000 file by ESSID.
+
+    :return: a dict of hex ESSID -> hash lines
+    """
+    essid_hashes = Capture22000.read(file_22000).by_essid
+    return {essid: [hash_22000.line for hash_22000 in hashes] for essid, hashes in essid_hashes.items()}
 
 
 def check_file_22000(file_22000):
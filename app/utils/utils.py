@@ -1,7 +1,7 @@
 import datetime
 import subprocess
 from functools import lru_cache
-from typing import List
+from typing import List, Iterable, Iterator, Hashable
 from urllib.parse import urlparse, urljoin
 
 from flask import request, Markup
@@ -25,6 +25,22 @@ def subprocess_call(args: List[str]):
     return completed.stdout, completed.stderr
 
 
+def iter_unique(iterable: Iterable[Hashable], max_size: int) -> Iterator:
+    """
+    Lazily drop the duplicates from an iterable, keeping at most `max_size`
+    recently seen items in memory. Duplicates that are further apart than
+    `max_size` items might pass through.
+    """
+    recent, previous = set(), set()
+    for item in iterable:
+        if item in recent or item in previous:
+            continue
+        if len(recent) >= max_size // 2:
+            recent, previous = set(), recent
+        recent.add(item)
+        yield item
+
+
 def is_safe_url(target):
     ref_url = urlparse(request.host_url)
     test_url = urlparse(urljoin(request.host_url, target))
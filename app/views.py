@@ -1,24 +1,29 @@
+import io
+import json
 import shlex
+import time
 from http import HTTPStatus
 from pathlib import Path
-from threading import Thread
 
 import flask
 from flask import request, render_template, redirect, url_for
 from flask.json import jsonify
 from flask_login import login_user, logout_user, login_required, current_user
+from flask_uploads import UploadNotAllowed
 
 from app import app, db
-from app.attack.convert import split_by_essid, convert_to_22000
+from app.attack.potfile import potfile_index
+from app.attack.progress import progress_registry
 from app.attack.worker import HashcatWorker
+from app.config import PROGRESS_STREAM_TIMEOUT, PROGRESS_KEEP_ALIVE, POTFILE_PAGE_SIZE
 from app.domain import TaskInfoStatus, Rule, InvalidFileError
-from app.logger import logger
 from app.login import LoginForm, RegistrationForm, User, RoleEnum, register_user, create_first_users, Role, \
     roles_required, user_has_roles
-from app.uploader import cap_uploads, UploadForm, UploadedTask, check_incomplete_tasks, backward_db_compatibility
-from app.utils.file_io import read_last_benchmark, bssid_essid_from_22000
+from app.uploader import UploadForm, UploadedTask, check_incomplete_tasks, backward_db_compatibility, \
+    add_missing_columns, status_samples, save_capture
+from app.utils.file_io import read_last_benchmark, Capture22000, parse_22000_lines
 from app.utils.utils import is_safe_url, hashcat_devices_info
-from app.word_magic import create_digits_wordlist, estimate_runtime_fmt, create_fast_wordlists
+from app.word_magic import create_digits_wordlist, estimate_attack_runtime, create_fast_wordlists
 from app.word_magic.wordlist import download_wordlist
 
 hashcat_worker = HashcatWorker(app)
@@ -55,70 +60,149 @@ def upload():
     if form.validate_on_submit():
         if not user_has_roles(current_user, RoleEnum.USER):
             return flask.abort(HTTPStatus.FORBIDDEN, description="You do not have the permission to start jobs.")
-        # flask-uploads already uses werkzeug.secure_filename()
-        filename = cap_uploads.save(request.files['capture'], folder=current_user.username)
-        cap_path = Path(app.config['CAPTURES_DIR']) / filename
-        cap_path = Path(shlex.quote(str(cap_path)))
-        try:
-            file_22000 = convert_to_22000(cap_path)
-        except (FileNotFoundError, InvalidFileError) as error:
-            logger.exception(error)
-            return flask.abort(HTTPStatus.BAD_REQUEST, description=str(error))
-        Thread(target=download_wordlist, args=(form.get_wordlist_path(),)).start()
-        folder_split_by_essid = split_by_essid(file_22000)
-        tasks = {}
-        hashcat_args = ' '.join(form.hashcat_args())
-        for file_essid in folder_split_by_essid.iterdir():
-            bssid_essid = next(bssid_essid_from_22000(file_essid))
-            bssid, essid = bssid_essid.split(':')
-            essid = bytes.fromhex(essid).decode('utf-8')
-            new_task = UploadedTask(user_id=current_user.id, filename=cap_path.name, wordlist=form.get_wordlist_name(),
-                                    rule=form.rule.data, bssid=bssid, essid=essid, hashcat_args=hashcat_args)
-            tasks[file_essid] = new_task
-        db.session.add_all(tasks.values())
-        db.session.commit()
-        for file_essid, task in tasks.items():
-            hashcat_worker.submit_capture(file_essid, uploaded_form=form, task=task)
-        flask.flash(f"Uploaded {filename}")
+        capture = request.files['capture']
+        cap_path, checksum = save_capture(capture.stream, capture.filename, folder=current_user.username)
+        new_task = submit_upload(form, cap_path, checksum)
+        if request.accept_mimetypes.best == 'application/json':
+            return upload_accepted(new_task)
+        flask.flash(f"Uploaded {cap_path.name}")
         return redirect(url_for('user_profile'))
     return render_template('upload.html', title='Upload', form=form)
 
 
+@app.route('/upload/<filename>', methods=['PUT'])
+@login_required
+def upload_stream(filename):
+    """
+    Upload a capture as the raw request body, which is streamed to disk
+    without the form parsing. The task settings are the query parameters
+    named after the upload form fields: wordlist, rule, timeout, workload,
+    brain and brain_client_feature.
+    """
+    if not user_has_roles(current_user, RoleEnum.USER):
+        return flask.abort(HTTPStatus.FORBIDDEN, description="You do not have the permission to start jobs.")
+    form = UploadForm(formdata=request.args, meta=dict(csrf=False))
+    del form.capture
+    if not form.validate():
+        return flask.abort(HTTPStatus.BAD_REQUEST, description=str(form.errors))
+    try:
+        cap_path, checksum = save_capture(request.stream, filename, folder=current_user.username)
+    except UploadNotAllowed:
+        return flask.abort(HTTPStatus.BAD_REQUEST, description=f"Invalid capture file format: '{filename}'")
+    return upload_accepted(submit_upload(form, cap_path, checksum))
+
+
+def submit_upload(form: UploadForm, cap_path: Path, checksum: str) -> UploadedTask:
+    # the capture is converted and split by ESSID in tasks by the worker
+    cap_path = Path(shlex.quote(str(cap_path)))
+    download_wordlist(form.get_wordlist_path())
+    hashcat_args = ' '.join(form.hashcat_args())
+    wordlist_path = form.get_wordlist_path()
+    new_task = UploadedTask(user_id=current_user.id, filename=cap_path.name, wordlist=form.get_wordlist_name(),
+                            rule=form.rule.data, hashcat_args=hashcat_args, capture=str(cap_path),
+                            checksum=checksum,
+                            wordlist_path=str(wordlist_path) if wordlist_path is not None else None,
+                            workload=form.workload.data, timeout=form.timeout.data,
+                            status=TaskInfoStatus.INGESTING)
+    db.session.add(new_task)
+    db.session.commit()
+    hashcat_worker.submit_capture(new_task)
+    return new_task
+
+
+def upload_accepted(task: UploadedTask):
+    response = jsonify(task_id=task.id, status=task.status)
+    response.status_code = HTTPStatus.ACCEPTED
+    response.headers['Location'] = url_for('task_status', task_id=task.id)
+    return response
+
+
 @app.route('/estimate_runtime', methods=['POST'])
 @login_required
 def estimate_runtime():
+    """
+    Estimate the runtime for the ESSID of an ingested task (`task_id`) or
+    for the ESSIDs of a .22000 `capture`. Other captures are converted by
+    the ingest workers only, and the runtime is estimated per Access Point.
+    """
     wordlist = request.form.get('wordlist')
     rule = Rule.from_data(request.form.get('rule'))
-    runtime = estimate_runtime_fmt(wordlist_path=wordlist, rule=rule)
-    return jsonify(runtime)
+    essids = None
+    task_id = request.form.get('task_id', type=int)
+    capture = request.files.get('capture')
+    if task_id is not None:
+        task = UploadedTask.query.filter_by(id=task_id, user_id=current_user.id).first_or_404()
+        if task.essid is not None:
+            essids = [task.essid]
+    elif capture is not None and Path(capture.filename or '').suffix == ".22000":
+        lines = io.TextIOWrapper(capture.stream, encoding='utf-8', errors='replace')
+        try:
+            essids_hex = Capture22000(parse_22000_lines(lines)).by_essid
+            essids = [bytes.fromhex(essid_hex).decode('utf-8', errors='replace') for essid_hex in essids_hex]
+        except (InvalidFileError, ValueError) as error:
+            return flask.abort(HTTPStatus.BAD_REQUEST, description=str(error))
+    estimate = estimate_attack_runtime(essids, wordlist_path=wordlist, rule=rule)
+    return jsonify(estimate)
 
 
 @app.route('/user_profile')
 @login_required
 def user_profile():
     return render_template('user_profile.html', title='Home', tasks=current_user.uploads[::-1],
-                           benchmark=read_last_benchmark(), devices=hashcat_devices_info(), progress=progress())
+                           benchmark=read_last_benchmark(), devices=hashcat_devices_info())
 
 
 @app.route('/progress')
 @login_required
 def progress():
-    tasks_progress = []
-    user_tasks_id = set(task.id for task in current_user.uploads)
-    locks = set(hashcat_worker.locks.values())
-    locks.update(hashcat_worker.locks_onetime)
-    hashcat_worker.locks_onetime.clear()
-    for lock in locks:
-        with lock:
-            task_id = lock.task_id
-            if task_id in user_tasks_id:
-                task_progress = dict(task_id=task_id,
-                                     progress=f"{lock.progress:.2f}",
-                                     status=lock.status,
-                                     duration=str(lock.duration),
-                                     found_key=lock.found_key)
-                tasks_progress.append(task_progress)
-    return jsonify(tasks_progress)
+    """
+    The progress of the tasks that have changed since the `since` version.
+    Supports conditional requests with ETag.
+    """
+    since = request.args.get('since', default=0, type=int)
+    version = progress_registry.user_version(current_user.id)
+    if request.if_none_match.contains(str(version)):
+        response = flask.Response(status=HTTPStatus.NOT_MODIFIED)
+    else:
+        tasks_progress = progress_registry.changes(current_user.id, since=since)
+        response = jsonify(version=version, tasks=tasks_progress)
+    response.set_etag(str(version))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/progress/stream')
+@login_required
+def progress_stream():
+    """
+    Server-Sent Events of the progress of the tasks that have changed.
+    The event ID is the version to resume from after a reconnect.
+    If all the progress streams are open, the client is told to stop
+    reconnecting (204 No Content) and to poll the progress instead.
+    """
+    if not progress_registry.open_stream():
+        return flask.Response(status=HTTPStatus.NO_CONTENT)
+    user_id = current_user.id
+    since = request.headers.get('Last-Event-ID', default=0, type=int)
+
+    def stream(since):
+        deadline = time.monotonic() + PROGRESS_STREAM_TIMEOUT
+        version_seen = progress_registry.version()
+        while time.monotonic() < deadline:
+            version = progress_registry.user_version(user_id)
+            tasks_progress = progress_registry.changes(user_id, since=since)
+            if tasks_progress:
+                yield f"id: {version}\ndata: {json.dumps(tasks_progress)}\n\n"
+            since = version
+            version_latest = progress_registry.wait(version_seen, timeout=PROGRESS_KEEP_ALIVE)
+            if version_latest == version_seen:
+                yield ": keep-alive\n\n"
+            version_seen = version_latest
+
+    response = flask.Response(stream(since), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(progress_registry.close_stream)
+    return response
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -176,6 +260,24 @@ def cancel(task_id):
         return jsonify("Cancelling...")
 
 
+@app.route("/task/<int:task_id>/status")
+@login_required
+def task_status(task_id):
+    """
+    The time series of the hashcat status samples of a task and the
+    benchmark speed that the runtime estimates are based on. `duplicates`
+    is the number of the hash lines of the task resolved by other tasks.
+    """
+    task = UploadedTask.query.get(task_id)
+    if task is None:
+        return flask.Response(status=HTTPStatus.BAD_REQUEST)
+    if task.user_id != current_user.id:
+        return flask.Response(status=HTTPStatus.FORBIDDEN)
+    benchmark = read_last_benchmark()
+    return jsonify(task_id=task.id, status=task.status, duplicates=task.duplicates, duplicate_of=task.duplicate_of,
+                   benchmark_speed=int(benchmark.speed), samples=status_samples(task.id))
+
+
 @app.route('/terminate')
 @login_required
 @roles_required(RoleEnum.ADMIN)
@@ -188,13 +290,30 @@ def terminate():
 @login_required
 @roles_required(RoleEnum.ADMIN)
 def hashcat_potfile():
-    hashcat_potfile = Path.home() / ".hashcat" / "hashcat.potfile"
-    if hashcat_potfile.exists():
-        return hashcat_potfile.read_text()
-    return jsonify("Empty hashcat.potfile")
+    """
+    A page of the potfile lines, streamed. The position of the last line
+    is the `after` argument of the next page, linked in the response.
+    """
+    after = request.args.get('after', default=0, type=int)
+    limit = min(request.args.get('limit', default=POTFILE_PAGE_SIZE, type=int), POTFILE_PAGE_SIZE)
+    last = potfile_index.last_position(after=after, limit=limit)
+    if last is None:
+        return jsonify("Empty hashcat.potfile")
+
+    def generate():
+        for position, line in potfile_index.iter_lines(after=after, limit=limit):
+            yield f"{line}\n"
+
+    response = flask.Response(flask.stream_with_context(generate()), mimetype='text/plain')
+    response.headers['Link'] = '<{}>; rel="next"'.format(url_for('hashcat_potfile', after=last, limit=limit))
+    return response
 
 
 with app.app_context():
     create_first_users()
-    check_incomplete_tasks()
+    add_missing_columns()
+    for task in check_incomplete_tasks():
+        # a no-op for the tasks that are queued or run by a consumer
+        hashcat_worker.submit_capture(task)
     backward_db_compatibility()
+hashcat_worker.start()
@@ -1,2 +1,3 @@
 from .digits.create_digits import create_digits_wordlist
-from .wordlist import estimate_runtime_fmt, create_fast_wordlists
+from .wordlist import create_fast_wordlists
+from .estimate import estimate_attack_runtime, estimate_runtime_fmt
@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, Callable, Optional
+
+from app.config import CANDIDATES_CACHE_DIR, CANDIDATES_CACHE_MAX_BYTES
+from app.domain import Rule, WordList
+from app.logger import logger
+from app.utils import calculate_md5
+
+# bump the version when the candidates generation changes
+CANDIDATES_VERSION = 1
+
+
+@lru_cache()
+def _file_md5(path: Path, st_mtime_ns: int, st_size: int):
+    # the file stats are part of the cache key
+    return calculate_md5(path)
+
+
+def file_checksum(path: Path):
+    path = Path(path)
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return _file_md5(path, stat.st_mtime_ns, stat.st_size)
+
+
+class CandidatesCache:
+    """
+    Content-addressed on-disk cache of the generated ESSID password candidates.
+    The entries are gzip-compressed text files, evicted in the least recently
+    used order when the cache exceeds `max_bytes`, with the candidates count
+    stored beside.
+    """
+
+    def __init__(self, cache_dir: Path = CANDIDATES_CACHE_DIR, max_bytes=CANDIDATES_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(essid: str, fast: bool) -> str:
+        if fast:
+            digits_wordlist = WordList.DIGITS_APPEND_SHORT
+        else:
+            digits_wordlist = WordList.DIGITS_APPEND
+        key = dict(essid=essid, fast=fast, version=CANDIDATES_VERSION,
+                   rule=file_checksum(Rule.ESSID.path),
+                   digits=file_checksum(digits_wordlist.path))
+        key = json.dumps(key, sort_keys=True).encode('utf-8', errors='surrogateescape')
+        return hashlib.sha256(key).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.txt.gz"
+
+    @staticmethod
+    def _count_path(path: Path) -> Path:
+        return path.with_name(path.name.replace('.txt.gz', '.count'))
+
+    def count(self, essid: str, fast: bool) -> Optional[int]:
+        """
+        The number of the cached candidates of an ESSID or None if not cached.
+        """
+        try:
+            return int(self._count_path(self.path(self.key(essid, fast=fast))).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def essid_candidates(self, essid: str, fast: bool, generate: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        Stream the cached candidates of an ESSID or generate and cache them.
+
+        :param generate: a function that returns a candidates generator
+        """
+        path = self.path(self.key(essid, fast=fast))
+        with self._lock:
+            hit = path.exists()
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        logger.debug(f"Candidates cache {'hit' if hit else 'miss'} for '{essid}' (fast={fast}); {self.stats()}")
+        if hit:
+            return self._read(path, generate)
+        return self._write_through(path, generate())
+
+    def _read(self, path: Path, generate: Callable[[], Iterator[str]]) -> Iterator[str]:
+        try:
+            # update the access time for the LRU eviction
+            os.utime(path)
+            f = gzip.open(path, 'rt', encoding='utf-8', errors='surrogateescape')
+        except FileNotFoundError:
+            # evicted by another thread or process after the lookup
+            logger.warning(f"Cache entry {path} is evicted before reading; generating the candidates")
+            yield from self._write_through(path, generate())
+            return
+        # an open entry is read to the end even if it is evicted meanwhile
+        with f:
+            for line in f:
+                yield line.rstrip('\n')
+
+    def _write_through(self, path: Path, candidates: Iterator[str]) -> Iterator[str]:
+        # the entry is written to a unique temp file and published only when
+        # the candidates are exhausted
+        path_tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        count_tmp = path_tmp.with_suffix('.count')
+        count = 0
+        try:
+            with gzip.open(path_tmp, 'wt', encoding='utf-8', errors='surrogateescape',
+                           compresslevel=3) as f:
+                for candidate in candidates:
+                    f.write(candidate)
+                    f.write('\n')
+                    count += 1
+                    yield candidate
+            count_tmp.write_text(str(count))
+            os.replace(count_tmp, self._count_path(path))
+            os.replace(path_tmp, path)
+        finally:
+            path_tmp.unlink(missing_ok=True)
+            count_tmp.unlink(missing_ok=True)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in self.cache_dir.glob("*.txt.gz"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for mtime, size, entry in entries)
+        for mtime, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            self._count_path(entry).unlink(missing_ok=True)
+            total -= size
+            logger.debug(f"Evicted {entry.name} from the candidates cache")
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        hit_rate = self.hits / requests if requests else 0
+        return dict(hits=self.hits, misses=self.misses, hit_rate=round(hit_rate, 3))
+
+
+candidates_cache = CandidatesCache()
@@ -3,11 +3,12 @@ import itertools
 import string
 from datetime import date
 from enum import Enum, unique
+from functools import lru_cache
 from pathlib import Path
 from typing import Union, Iterable
-from tqdm import trange
 
-from dateutil.rrule import rrule, DAILY
+import numpy as np
+from tqdm import trange
 
 from app.config import WORDLISTS_DIR
 from app.logger import logger
@@ -18,6 +19,10 @@ WORDLISTS_DIR.mkdir(exist_ok=True)
 
 LETTER_ALPHABETS = (string.ascii_lowercase, string.ascii_uppercase, 'zxcvbnm', 'asdfghjkl', 'qwertyuiop')
 
+# the passwords are built as fixed-width ASCII byte arrays (dtype 'S');
+# null padding sorts before any char, therefore the order matches str sorting
+CHUNK_SIZE = 1_000_000
+
 
 @unique
 class Mask(Enum):
@@ -31,28 +36,55 @@ class Mask(Enum):
 
 
 def all_unique(passwords) -> bool:
-    return len(set(passwords)) == len(passwords)
+    return len(np.unique(passwords)) == len(passwords)
+
+
+def as_bytes(passwords: Iterable[str]) -> np.ndarray:
+    return np.array(list(passwords), dtype=np.bytes_).reshape(-1)
+
+
+def digits_matrix(values: np.ndarray, width: int) -> np.ndarray:
+    """
+    Zero-padded decimal ASCII digits of non-negative integers.
+
+    :return: (len(values), width) uint8 array
+    """
+    values = np.asarray(values, dtype=np.int64)
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    return (values[:, np.newaxis] // powers % 10 + ord('0')).astype(np.uint8)
 
 
-def create_days(flashback_years: int, date_fmt=("%m%d%Y", "%d%m%Y", "%Y%m%d", "%Y%d%m")) -> list:
+def join_columns(*columns: np.ndarray) -> np.ndarray:
+    # (N, w1), (N, w2), ... uint8 arrays -> N fixed-width byte strings
+    matrix = np.ascontiguousarray(np.hstack(columns))
+    return matrix.view(f'S{matrix.shape[1]}').reshape(-1)
+
+
+def create_days(flashback_years: int, date_fmt=("%m%d%Y", "%d%m%Y", "%Y%m%d", "%Y%d%m")) -> np.ndarray:
     end_day = date.today()
     start_day = date(end_day.year - flashback_years, end_day.month, end_day.day)
-    days = set()
-    for date_formatted in date_fmt:
-        for dt in rrule(DAILY, dtstart=start_day, until=end_day):
-            days.add(dt.strftime(date_formatted))
+    days = np.arange(np.datetime64(start_day), np.datetime64(end_day) + 1)
+    months = days.astype('datetime64[M]')
+    directives = {
+        'Y': digits_matrix(days.astype('datetime64[Y]').astype(np.int64) + 1970, width=4),
+        'm': digits_matrix(months.astype(np.int64) % 12 + 1, width=2),
+        'd': digits_matrix((days - months).astype(np.int64) + 1, width=2),
+    }
+    formatted = [join_columns(*(directives[directive] for directive in fmt[1::2]))
+                 for fmt in date_fmt]
+    years = set()
     for year in range(1000, end_day.year):
         year = str(year)
         for reverse in range(2):
-            days.add(f"{year}{year}")
+            years.add(f"{year}{year}")
             year = year[::-1]
-        days.add(f"{year}{year[2:] * 2}")
-        days.add(f"{year}{int(year) + 1}")
+        years.add(f"{year}{year[2:] * 2}")
+        years.add(f"{year}{int(year) + 1}")
         suffix = int(year[2:])
         for increment in [2, 3]:
             suffix_inc = ''.join(f"{suffix + 1 + inc:02d}" for inc in range(increment))
-            days.add(f"{year}{suffix_inc}")
-    return sorted(days)
+            years.add(f"{year}{suffix_inc}")
+    return np.unique(np.concatenate(formatted + [as_bytes(years)]))
 
 
 def create_increments():
@@ -69,29 +101,28 @@ def create_increments():
     return digits
 
 
-def create_digits_mask(masks: Iterable, alphabet=string.digits, alphabet_size_max=4) -> list:
-    digits = []
+@lru_cache(maxsize=None)
+def _permutations(alphabet_size: int, length: int) -> np.ndarray:
+    return np.array(list(itertools.permutations(range(alphabet_size), length)),
+                    dtype=np.intp).reshape(-1, length)
 
-    def convert(pattern: str, alphabet_mask: Iterable[str], code: Iterable[str]):
-        mask_to_code = dict(zip(alphabet_mask, code))
-        pattern_decoded = []
-        for char_mask in pattern:
-            pattern_decoded.append(mask_to_code[char_mask])
-        return ''.join(pattern_decoded)
 
+def create_digits_mask(masks: Iterable, alphabet=string.digits, alphabet_size_max=4) -> np.ndarray:
+    alphabet_codes = np.frombuffer(alphabet.encode('ascii'), dtype=np.uint8)
+    digits = []
     for pattern in masks:
         alphabet_mask = sorted(set(pattern))
         alphabet_mask_size = len(alphabet_mask)
+        # each row is a code: the alphabet indices of the mask chars
         if len(alphabet_mask) > alphabet_size_max:
             # only ascending order: 11223344
-            for start in range(len(alphabet) + 1 - alphabet_mask_size):
-                code = alphabet[start: start+alphabet_mask_size]
-                sample = convert(pattern, alphabet_mask, code)
-                digits.append(sample)
+            starts = np.arange(len(alphabet) + 1 - alphabet_mask_size)
+            codes = starts[:, np.newaxis] + np.arange(alphabet_mask_size)
         else:
-            for digits_perm in itertools.permutations(alphabet, alphabet_mask_size):
-                sample = convert(pattern, alphabet_mask, code=digits_perm)
-                digits.append(sample)
+            codes = _permutations(len(alphabet), alphabet_mask_size)
+        pattern_index = [alphabet_mask.index(char_mask) for char_mask in pattern]
+        digits.append(join_columns(alphabet_codes[codes[:, pattern_index]]))
+    digits = np.concatenate(digits) if digits else as_bytes([])
     assert all_unique(digits)
     return digits
 
@@ -116,11 +147,20 @@ def read_mask(mask_path: str) -> list:
     return list(lines)
 
 
-def write_digits(digits: Union[set, list], path_to: str):
-    digits = sorted(set(digits))
+def write_digits(digits: Iterable[Union[np.ndarray, Iterable[str]]], path_to: str):
+    """
+    Write the sorted unique passwords, streamed in chunks.
+
+    :param digits: byte arrays or collections of str passwords
+    """
+    digits = [part if isinstance(part, np.ndarray) else as_bytes(part) for part in digits]
+    digits = np.unique(np.concatenate(digits))
     digits_count = len(digits)
-    with open(path_to, 'w') as f:
-        f.write('\n'.join(digits))
+    with open(path_to, 'wb') as f:
+        for start in range(0, digits_count, CHUNK_SIZE):
+            if start > 0:
+                f.write(b'\n')
+            f.write(b'\n'.join(digits[start: start + CHUNK_SIZE].tolist()))
     logger.debug(f"Wrote {digits_count} digits to {path_to}")
 
 
@@ -137,14 +177,14 @@ def generate_mask_stdout(mask_len: int, pattern_len: int):
 
 
 def create_digits_8(flashback_years=200, cycle_length_max=20):
-    digits = create_days(flashback_years)
+    digits = [create_days(flashback_years)]
     masks = read_mask(Mask.MASK_8.path)
-    digits.extend(create_digits_mask(masks, alphabet=string.digits, alphabet_size_max=4))
+    digits.append(create_digits_mask(masks, alphabet=string.digits, alphabet_size_max=4))
     for alphabet in LETTER_ALPHABETS:
-        digits.extend(create_digits_mask(masks, alphabet=alphabet, alphabet_size_max=2))
+        digits.append(create_digits_mask(masks, alphabet=alphabet, alphabet_size_max=2))
     for password_length in range(8, cycle_length_max + 1):
-        digits.extend(create_digits_cycle(password_length))
-    digits.extend(create_increments())
+        digits.append(create_digits_cycle(password_length))
+    digits.append(create_increments())
     write_digits(digits, WordList.DIGITS_8.path)
 
 
@@ -166,37 +206,45 @@ def create_digits_append(short: bool, flashback_years=100, cycle_length_max=4):
     digits.update(range(curr_year, curr_year - flashback_years - 1, -1))
     digits = set(map(str, digits))
     digits.update(f"{digit:02d}" for digit in range(10))
+    digits = [digits]
     if not short:
-        digits.update(create_days(flashback_years=1,
+        digits.append(create_days(flashback_years=1,
                                   date_fmt=('%m%d', '%d%m')))
     masks = read_mask(Mask.MASK_1.path)
-    digits.update(create_digits_mask(masks, alphabet=string.digits,
+    digits.append(create_digits_mask(masks, alphabet=string.digits,
                                      alphabet_size_max=1 if short else 2))
     for password_length in range(1, cycle_length_max + 1):
-        digits.update(create_digits_cycle(password_length))
+        digits.append(create_digits_cycle(password_length))
     write_digits(digits, digits_wordlist.path)
 
 
 def create_digits_short(flashback_years=50, cycle_length_max=10):
-    digits = set()
     digits_wordlist_path = WORDLISTS_DIR / "digits_short.txt"
     masks = read_mask(Mask.MASK_8.path)
-    digits.update(create_digits_mask(masks, alphabet=string.digits, alphabet_size_max=3))
+    digits = [create_digits_mask(masks, alphabet=string.digits, alphabet_size_max=3)]
     for alphabet in LETTER_ALPHABETS:
-        digits.update(create_digits_mask(masks, alphabet=alphabet, alphabet_size_max=1))
+        digits.append(create_digits_mask(masks, alphabet=alphabet, alphabet_size_max=1))
     for password_length in range(8, cycle_length_max + 1):
-        digits.update(create_digits_cycle(password_length))
-    digits.update(create_days(flashback_years, date_fmt=("%d%m%Y",)))
+        digits.append(create_digits_cycle(password_length))
+    digits.append(create_days(flashback_years, date_fmt=("%d%m%Y",)))
     write_digits(digits, digits_wordlist_path)
 
 
 def create_digit_triples(n=8, k=4):
+    """
+    All n-digit passwords with at most n-k distinct digits, streamed in chunks.
+    """
     m = n - k
-    with open(WORDLISTS_DIR / f"digits_triple_{n}_{k}.txt", 'w') as f:
-        for d in trange(10 ** n):
-            s = f"{d:0{n}d}"
-            if len(set(s)) <= m:
-                f.write(f"{s}\n")
+    # number of distinct digits of each 10-bit digits set
+    distinct_count = np.array([bin(digits_set).count('1') for digits_set in range(1 << 10)])
+    newline = np.full((CHUNK_SIZE, 1), ord('\n'), dtype=np.uint8)
+    with open(WORDLISTS_DIR / f"digits_triple_{n}_{k}.txt", 'wb') as f:
+        for start in trange(0, 10 ** n, CHUNK_SIZE):
+            values = np.arange(start, min(start + CHUNK_SIZE, 10 ** n))
+            matrix = digits_matrix(values, width=n)
+            digits_set = np.bitwise_or.reduce(1 << (matrix - ord('0')).astype(np.uint16), axis=1)
+            matrix = matrix[distinct_count[digits_set] <= m]
+            f.write(np.hstack([matrix, newline[:len(matrix)]]).tobytes())
 
 
 def create_digits_wordlist():
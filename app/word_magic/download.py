@@ -0,0 +1,146 @@
+import hashlib
+import os
+import threading
+import urllib.request
+import uuid
+import zlib
+from pathlib import Path
+from typing import Optional
+
+from app.logger import logger
+from app.word_magic.wordlist_stats import wordlist_stats
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60  # seconds, per socket operation
+
+
+class Download:
+    """
+    A single wordlist download. Waiting threads are released by an event
+    when the download finishes or fails.
+    """
+
+    def __init__(self, path: Path, url: str = None, checksum: str = None):
+        self.path = Path(path)
+        self.url = url
+        self.checksum = checksum
+        self.downloaded = 0  # compressed bytes
+        self.total = None  # compressed bytes, if reported by the server
+        self.error = None
+        self._finished = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    @property
+    def progress(self) -> Optional[float]:
+        # percentage of the downloaded bytes
+        if self.finished:
+            return 100.
+        if not self.total:
+            return None
+        return 100. * self.downloaded / self.total
+
+    def wait(self, timeout=None) -> bool:
+        """
+        :return: True if the download has finished (successfully or not)
+        """
+        return self._finished.wait(timeout)
+
+    def finish(self, error: Exception = None):
+        self.error = error
+        self._finished.set()
+
+    def run(self) -> Optional[Exception]:
+        """
+        Download, verify and decompress a gzip file in a single streaming pass.
+        The wordlist appears at its path atomically and only if the checksum
+        of the gzip file matches. The wordlist stats are persisted before the
+        waiting threads are released by `finish`.
+
+        :return: the error or None
+        """
+        path_tmp = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex}.part")
+        md5 = hashlib.md5()
+        # wbits=31: gzip header and trailer
+        decompressor = zlib.decompressobj(wbits=31)
+        logger.debug(f"Downloading {self.url}")
+        try:
+            with urllib.request.urlopen(self.url, timeout=DOWNLOAD_TIMEOUT) as response, \
+                    open(path_tmp, 'wb') as f:
+                self.total = response.length
+                for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    md5.update(chunk)
+                    self.downloaded += len(chunk)
+                    while chunk:
+                        f.write(decompressor.decompress(chunk))
+                        # concatenated gzip members
+                        chunk = decompressor.unused_data
+                        if chunk:
+                            f.write(decompressor.flush())
+                            decompressor = zlib.decompressobj(wbits=31)
+                f.write(decompressor.flush())
+            if not decompressor.eof:
+                raise ValueError(f"{self.url} is truncated")
+            if self.checksum is not None and md5.hexdigest() != self.checksum:
+                raise ValueError(f"MD5 checksum of {self.url} does not match: "
+                                 f"expected {self.checksum}, got {md5.hexdigest()}")
+            os.replace(path_tmp, self.path)
+            wordlist_stats(self.path)
+        except Exception as error:
+            logger.error(f"Failed to download {self.url}: {error!r}")
+            return error
+        else:
+            logger.debug(f"Downloaded and extracted {self.path}")
+            return None
+        finally:
+            path_tmp.unlink(missing_ok=True)
+
+
+class DownloadManager:
+    """
+    Starts at most one download per wordlist path. Concurrent requests of the
+    same wordlist share the in-flight download. A finished download is
+    forgotten: the wordlist is on disk then. A failed one is kept to report
+    its error until it is restarted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._downloads = {}
+
+    def start(self, path: Path, url: str = None, checksum: str = None) -> Download:
+        """
+        Start downloading a wordlist in background or join the in-flight download.
+        """
+        path = Path(path)
+        with self._lock:
+            download = self._downloads.get(path)
+            if download is not None and not (download.finished and download.error is not None):
+                return download
+            download = Download(path, url=url, checksum=checksum)
+            if path.exists():
+                download.finish()
+                return download
+            if url is None:
+                download.finish(FileNotFoundError(f"{path} does not exist and cannot be downloaded"))
+                return download
+            self._downloads[path] = download
+        threading.Thread(target=self._run, args=(download,), name=f"download {path.name}", daemon=True).start()
+        return download
+
+    def _run(self, download: Download):
+        error = download.run()
+        with self._lock:
+            if error is None and self._downloads.get(download.path) is download:
+                del self._downloads[download.path]
+            download.finish(error)
+
+    def get(self, path: Path) -> Optional[Download]:
+        with self._lock:
+            return self._downloads.get(Path(path))
+
+
+download_manager = DownloadManager()
+
@@ -1,20 +1,20 @@
 import re
-import shutil
-import tempfile
-import uuid
-from copy import deepcopy
-from itertools import permutations
-from pathlib import Path
+from itertools import permutations, chain
+from typing import Iterable, Iterator
 
 import wordninja
 
-from app.attack.hashcat_cmd import HashcatCmdStdout
+from app.attack.hashcat_cmd import run_with_stdin
 from app.domain import Rule, WordList
 from app.logger import logger
-from app.utils import subprocess_call
-from app.word_magic.hamming import hamming_ball
+from app.utils import iter_unique
+from app.word_magic.candidates_cache import candidates_cache
+from app.word_magic.hamming import hamming_ball_unique, hamming_ball_size
+from app.word_magic.rule_engine import apply_rules
 
 MAX_COMPOUNDS = 5  # max compounds for rule best64 attack
+MAX_UNIQUE_CANDIDATES = 500_000  # the size of the deduplication window
+MAX_HAMMING_CANDIDATES = 300_000  # max Hamming ball cousins of the ESSID compounds
 
 
 def _split_uppercase(word: str) -> set:
@@ -74,93 +74,116 @@ def _collect_essid_parts(essid_origin: str, max_compounds=MAX_COMPOUNDS):
     return essid_parts
 
 
+def _wpa_length_bounds(word: str) -> dict:
+    # the bounds in chars are exact for ASCII words only
+    if word.isascii():
+        return dict(min_length=8, max_length=63)
+    return {}
+
+
+def _essid_hamming_words(essid: str):
+    return sorted({essid, essid.lower()})
+
+
 def _collect_essid_hamming(essid: str, hamming_dist_max=1):
-    essid_hamming = set()
-    essid_hamming.update(hamming_ball(s=essid, n=hamming_dist_max))
-    essid_hamming.update(hamming_ball(s=essid.lower(), n=hamming_dist_max))
-    logger.debug(f"Essid {essid} -> {len(essid_hamming)} hamming cousins with dist={hamming_dist_max}")
-    return essid_hamming
+    for word in _essid_hamming_words(essid):
+        yield from hamming_ball_unique(s=word, n=hamming_dist_max, **_wpa_length_bounds(word))
+
+
+def _essid_hamming_size(essid: str, hamming_dist_max=1) -> int:
+    return sum(hamming_ball_size(s=word, n=hamming_dist_max, **_wpa_length_bounds(word))
+               for word in _essid_hamming_words(essid))
+
 
+def _select_essid_hamming(essid: str, essid_compounds, budget=MAX_HAMMING_CANDIDATES):
+    """
+    Select the ESSID and its compounds, the longest first, for the Hamming
+    ball attack so that the total number of cousins fits the budget.
+    """
+    selected = [essid]
+    total = _essid_hamming_size(essid)
+    for compound in sorted(essid_compounds, key=len, reverse=True):
+        if compound == essid:
+            continue
+        size = _essid_hamming_size(compound)
+        if size > 0 and total + size <= budget:
+            selected.append(compound)
+            total += size
+    logger.debug(f"Essid {essid} -> {total} hamming cousins of {len(selected)} compounds")
+    return selected
+
+
+def _collect_essid_rule(essid_compounds: Iterable[str]):
+    """
+    ESSID + essid.rule candidates.
+    """
+    return apply_rules(essid_compounds, Rule.ESSID)
 
-def _collect_essid_rule(essid_wordlist_path: Path):
+
+def _collect_essid_digits(essid_compounds: Iterable[str], fast=True):
     """
-    Run ESSID + best64.rule attack.
+    ESSID + digits_append.txt combinator candidates (prepend and append).
     """
-    with tempfile.NamedTemporaryFile(mode='w+', errors='ignore') as f:
-        # Ignore UnicodeDecodeError: 'utf-8' codec can't decode byte ...
-        hashcat_stdout = HashcatCmdStdout(outfile=f.name)
-        hashcat_stdout.add_wordlists(essid_wordlist_path)
-        hashcat_stdout.add_rule(Rule(Rule.ESSID))
-        subprocess_call(hashcat_stdout.build())
-        candidates = f.read().splitlines()
-    return candidates
-
-
-def _run_essid_digits(compounds_fpath: Path, hashcat_cmd=None, fast=True):
-    if not fast:
-        assert hashcat_cmd is not None, \
-            "Non-fast mode requires running a hashcat command."
-    candidates = set()
-    wordlist_order = [compounds_fpath]
     if fast:
-        wordlist_order.append(WordList.DIGITS_APPEND_SHORT)
+        digits_wordlist = WordList.DIGITS_APPEND_SHORT
     else:
-        wordlist_order.append(WordList.DIGITS_APPEND)
-    with open(compounds_fpath) as f:
-        compounds_count = len(f.readlines())
-    if compounds_count > 1000 and hashcat_cmd is not None:
-        # reduce IO operations, run the hashcat attack directly
-        fast = False
-    for reverse in range(2):
-        with tempfile.NamedTemporaryFile(mode='w+', errors='ignore') as f:
-            hashcat_stdout = HashcatCmdStdout(outfile=f.name)
-            hashcat_stdout.add_wordlists(*wordlist_order, options=['-a1'])
-            subprocess_call(hashcat_stdout.build())
-            if fast:
-                candidates.update(f.read().splitlines())
-            else:
-                _hashcat_cmd_tmp = deepcopy(hashcat_cmd)
-                _hashcat_cmd_tmp.add_wordlists(f.name)
-                subprocess_call(_hashcat_cmd_tmp.build())
-        wordlist_order = wordlist_order[::-1]
-    return candidates
+        digits_wordlist = WordList.DIGITS_APPEND
+    with open(digits_wordlist.path) as f:
+        digits = f.read().splitlines()
+    for compound in essid_compounds:
+        for digit in digits:
+            yield compound + digit
+            yield digit + compound
+
+
+def _is_wpa_valid(candidate: str) -> bool:
+    # WPA passwords are 8-63 bytes long
+    return 8 <= len(candidate.encode('utf-8', errors='surrogateescape')) <= 63
+
+
+def essid_candidates(essid: str, fast=True) -> Iterator[str]:
+    """
+    Lazily generate unique WPA-valid password candidates for an ESSID.
+    Repeated ESSIDs are read from the candidates cache.
+    """
+    return candidates_cache.essid_candidates(essid, fast=fast,
+                                             generate=lambda: _generate_essid_candidates(essid, fast=fast))
+
+
+def _generate_essid_candidates(essid: str, fast=True) -> Iterator[str]:
+    essid_compounds = sorted(_collect_essid_parts(essid))
+
+    # (1) Hamming ball attack
+    hamming_essids = _select_essid_hamming(essid, essid_compounds)
+    candidates = chain(
+        chain.from_iterable(map(_collect_essid_hamming, hamming_essids)),
+        # (2) essid rule attack
+        _collect_essid_rule(essid_compounds),
+        # (3) digits_append attack
+        _collect_essid_digits(essid_compounds, fast=fast),
+    )
+    candidates = filter(_is_wpa_valid, candidates)
+    return iter_unique(candidates, max_size=MAX_UNIQUE_CANDIDATES)
 
 
 def run_essid_attack(essid, hashcat_cmd=None, fast=True):
     # hashcat_cmd could be None for debug mode to check the no. of candidates
+    candidates = essid_candidates(essid, fast=fast)
+    if hashcat_cmd is None:
+        return set(candidates)
+    run_with_stdin(hashcat_cmd, candidates)
 
-    password_candidates = set()
-    essid_as_wordlist_dir = Path(tempfile.mkdtemp())
 
-    # (1) Hamming ball attack
-    essid_compounds = _collect_essid_parts(essid)
-    # Limit the number of word compounds to an arbitrary number.
-    if len(essid_compounds) < 100:
-        for compound in essid_compounds:
-            password_candidates.update(_collect_essid_hamming(essid=compound))
-    else:
-        password_candidates.update(_collect_essid_hamming(essid=essid))
-
-    # (2) best64 rule attack
-    # A random unique file path.
-    compounds_fpath = essid_as_wordlist_dir / str(uuid.uuid4())
-    compounds_fpath.write_text('\n'.join(essid_compounds))
-    password_candidates.update(_collect_essid_rule(compounds_fpath))
-
-    # (3) digits_append attack
-    password_candidates.update(_run_essid_digits(compounds_fpath,
-                                                 hashcat_cmd=hashcat_cmd,
-                                                 fast=fast))
-
-    if hashcat_cmd is not None:
-        with tempfile.NamedTemporaryFile(mode='w') as f:
-            f.write('\n'.join(password_candidates))
-            hashcat_cmd = deepcopy(hashcat_cmd)
-            hashcat_cmd.add_wordlists(f.name)
-            subprocess_call(hashcat_cmd.build())
-
-    shutil.rmtree(essid_as_wordlist_dir)
-    return password_candidates
+def run_essids_attack(essids: Iterable[str], hashcat_cmd, fast=True, lock=None):
+    """
+    Attack several ESSIDs with a single hashcat run, fed by the candidates
+    of each ESSID one after another.
+
+    :param essids: ESSIDs of the hashes in the hashcat command capture file
+    :param lock: the run is stopped once the lock is cancelled
+    """
+    candidates = chain.from_iterable(essid_candidates(essid, fast=fast) for essid in essids)
+    run_with_stdin(hashcat_cmd, candidates, lock=lock)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,158 @@
+"""
+Runtime estimation of the attack stages: `BaseAttack.run_all` followed by
+the main wordlist of `CapAttack`.
+
+Uploaded captures are split by ESSID and each ESSID is attacked in a separate
+task; hashcat computes the PMK of each candidate once per ESSID (salt),
+therefore the runtime of a stage is its candidate count divided by the
+22000 benchmark speed, summed over the ESSIDs.
+
+The ESSID candidates are counted from the candidates cache; at most
+ESTIMATE_ESSIDS_MAX uncached ESSIDs are generated per estimate, and the
+counts of the other ESSIDs are extrapolated.
+"""
+
+import datetime
+from collections import namedtuple
+from functools import lru_cache
+from itertools import chain
+from pathlib import Path
+from typing import Iterable, Union
+
+from app.domain import Rule, WordList, NONE_STR
+from app.utils import read_last_benchmark
+from app.word_magic.candidates_cache import candidates_cache
+from app.word_magic.essid import essid_candidates
+from app.word_magic.rule_engine import apply_rules, read_words
+from app.word_magic.wordlist import find_wordlist_by_path, count_rules, count_wordlist
+from app.word_magic.wordlist_stats import WPA_MIN_LENGTH, WPA_MAX_LENGTH, wordlist_stats
+
+ESTIMATE_ESSIDS_MAX = 3  # max uncached ESSIDs whose candidates are generated
+
+# candidates=None means unknown
+StageEstimate = namedtuple('StageEstimate', ('name', 'candidates'))
+
+
+def _is_wpa_valid(candidate: str) -> bool:
+    length = len(candidate.encode('utf-8', errors='surrogateescape'))
+    return WPA_MIN_LENGTH <= length <= WPA_MAX_LENGTH
+
+
+@lru_cache()
+def count_names_candidates() -> int:
+    names = chain(read_words(WordList.NAMES_UA_RU.path),
+                  read_words(WordList.NAMES_RU_CYRILLIC.path))
+    return sum(map(_is_wpa_valid, apply_rules(names, Rule.ESSID)))
+
+
+def count_essid_candidates(essid: str, fast=False) -> int:
+    # the generated candidates are stored in the candidates cache and
+    # reused by the attack
+    count = candidates_cache.count(essid, fast=fast)
+    if count is None:
+        count = sum(1 for _ in essid_candidates(essid, fast=fast))
+    return count
+
+
+def count_essids_candidates(essids: Iterable[str], fast=False, max_generated=ESTIMATE_ESSIDS_MAX) -> int:
+    """
+    Count the candidates of the ESSIDs, generating the candidates of up to
+    `max_generated` uncached ESSIDs. The other uncached ESSIDs are assumed
+    to have the mean count of the counted ones.
+    """
+    counts = []
+    n_uncounted = 0
+    for essid in essids:
+        count = candidates_cache.count(essid, fast=fast)
+        if count is None:
+            if max_generated == 0:
+                n_uncounted += 1
+                continue
+            max_generated -= 1
+            count = count_essid_candidates(essid, fast=fast)
+        counts.append(count)
+    total = sum(counts)
+    if counts:
+        total += n_uncounted * total // len(counts)
+    return total
+
+
+def count_main_wordlist_candidates(wordlist_path: Union[Path, str, None], rule: Rule = None):
+    if wordlist_path in (None, NONE_STR):
+        return 0
+    wordlist = find_wordlist_by_path(wordlist_path)
+    if wordlist is None:
+        return None
+    # the WPA-valid count; the hard-coded total count of a default wordlist
+    # until the wordlist is downloaded and scanned
+    stats = wordlist_stats(wordlist.path, scan=False)
+    if stats is not None:
+        count = stats.count_wpa
+    else:
+        count = wordlist.count
+    if count is None:
+        return None
+    return count * count_rules(rule)
+
+
+def estimate_stages(essids: Iterable[str] = None, wordlist_path=None, rule: Rule = None, fast=False):
+    """
+    Count the candidates of each attack stage, summed over the ESSIDs.
+
+    :param essids: ESSIDs of the uploaded capture; if None, a single unknown
+                   ESSID is assumed
+    :return: a list of StageEstimate
+    """
+    if essids is None:
+        essid_candidates_count = None
+        n_essids = 1
+    else:
+        essids = list(essids)
+        essid_candidates_count = count_essids_candidates(essids, fast=fast)
+        n_essids = len(essids)
+    # the stages that do not depend on the ESSID, in the order of BaseAttack.run_all
+    stages = [
+        StageEstimate("top1k", count_wordlist(WordList.TOP1K_RULE_BEST64.path, scan=False)),
+        StageEstimate("digits8", count_wordlist(WordList.DIGITS_8.path, scan=False)),
+        StageEstimate("keyboard_walk", count_wordlist(WordList.KEYBOARD_WALK.path, scan=False)),
+        StageEstimate("names", count_names_candidates()),
+    ]
+    main_wordlist = count_main_wordlist_candidates(wordlist_path, rule=rule)
+    if main_wordlist != 0:
+        stages.append(StageEstimate("main_wordlist", main_wordlist))
+    stages = [StageEstimate(stage.name, stage.candidates * n_essids if stage.candidates is not None else None)
+              for stage in stages]
+    stages.insert(3, StageEstimate("essid", essid_candidates_count))
+    return stages
+
+
+def _runtime_fmt(candidates, speed) -> str:
+    if candidates is None or speed == 0:
+        return "unknown"
+    runtime = int(candidates / speed)  # in seconds
+    return str(datetime.timedelta(seconds=runtime))
+
+
+def estimate_attack_runtime(essids: Iterable[str] = None, wordlist_path=None, rule: Rule = None, fast=False) -> dict:
+    """
+    Estimate the runtime of each attack stage with the 22000 benchmark speed.
+    """
+    speed = int(read_last_benchmark(mode='22000').speed)
+    if essids is not None:
+        essids = list(essids)
+    stages = estimate_stages(essids, wordlist_path=wordlist_path, rule=rule, fast=fast)
+    # the unknown stages are excluded from the total
+    total = sum(stage.candidates for stage in stages if stage.candidates is not None)
+    return dict(
+        runtime=_runtime_fmt(total, speed),
+        speed=speed,
+        essids=len(essids) if essids is not None else None,
+        stages=[dict(name=stage.name, candidates=stage.candidates,
+                     runtime=_runtime_fmt(stage.candidates, speed))
+                for stage in stages]
+    )
+
+
+def estimate_runtime_fmt(wordlist_path: Path, rule: Rule) -> str:
+    # the runtime per ESSID, excluding the ESSID stage
+    return estimate_attack_runtime(wordlist_path=wordlist_path, rule=rule)['runtime']
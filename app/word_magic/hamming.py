@@ -1,7 +1,9 @@
 import string
-from collections import Counter
 from itertools import chain, combinations, product
-from typing import Union, List
+from math import comb
+from typing import Union, List, Iterator, FrozenSet, Tuple
+
+ALPHABET_DEFAULT = string.digits + string.ascii_letters
 
 
 def hamming_circle(s: str, n: int, alphabet: Union[str, List[str]]):
@@ -25,7 +27,7 @@ def hamming_circle(s: str, n: int, alphabet: Union[str, List[str]]):
             yield ''.join(cousin_delete)
 
 
-def hamming_ball(s: str, n: int, alphabet: Union[str, List[str]] = string.digits + string.ascii_letters):
+def hamming_ball(s: str, n: int, alphabet: Union[str, List[str]] = ALPHABET_DEFAULT):
     """Generate strings over alphabet whose Hamming distance from s is
     less than or equal to n.
     """
@@ -33,9 +35,194 @@ def hamming_ball(s: str, n: int, alphabet: Union[str, List[str]] = string.digits
                                for i in range(n + 1))
 
 
-if __name__ == '__main__':
-    res = hamming_ball('Spartansky', n=2)
-    res = list(set(res))
-    print(Counter(map(len, res)))
-    print(f"Total: {len(res)}")
-    print(res[:100])
+class HammingNeighbourhood:
+    """
+    The same strings as in `hamming_ball()`, each generated exactly once, and
+    the exact number of them computed without generating.
+
+    For each radius 1 <= i <= n the ball consists of
+      - substitutions: `i` chars replaced with other alphabet chars;
+      - insertions: `i` chars from `alphabet[:-1]` inserted before `i`
+        distinct chars of `s`;
+      - deletions: `i` chars deleted,
+    and of `s` itself. These sets have different lengths or Hamming distances
+    and do not overlap. Deletions are generated from the leftmost embedding of
+    each distinct subsequence. Insertions are generated by walking the subset
+    automaton of the insertion NFA, which is deterministic and thus visits
+    each distinct string once; the suffixes of small automaton nodes are
+    memoized because many prefixes lead to the same node.
+    """
+
+    suffixes_memo_max = 50_000  # max memoized suffixes per automaton node
+
+    def __init__(self, s: str, n: int, alphabet: Union[str, List[str]] = ALPHABET_DEFAULT):
+        self.s = s
+        self.n = n
+        self.alphabet = alphabet
+        self.alphabet_insert = frozenset(alphabet[:-1])
+        # insertions of the chars that are not in `s` share the same transitions
+        self._insert_other = sorted(self.alphabet_insert.difference(s))
+        self._chars = sorted(set(s))
+        # next occurrence of each char at or after a position
+        self._next = [{} for _ in range(len(s) + 1)]
+        for pos in range(len(s) - 1, -1, -1):
+            self._next[pos] = dict(self._next[pos + 1])
+            self._next[pos][s[pos]] = pos
+        self._transitions_memo = {}
+        self._count_memo = {}
+        self._suffixes_memo = {}
+
+    def size(self, min_length=0, max_length=None) -> int:
+        """
+        The exact number of unique strings with the length in
+        [min_length, max_length].
+        """
+        length = len(self.s)
+        total = 0
+        if self._length_allowed(length, min_length, max_length):
+            total += 1
+            for i in range(1, self.n + 1):
+                total += comb(length, i) * (len(self.alphabet) - 1) ** i
+        for i in range(1, min(self.n, length) + 1):
+            if self._length_allowed(length - i, min_length, max_length):
+                total += self._count_deletions(0, length - i)
+            if self._length_allowed(length + i, min_length, max_length):
+                total += self._count_insertions(self._insert_start, length + i)
+        return total
+
+    def generate(self, min_length=0, max_length=None) -> Iterator[str]:
+        """
+        Generate unique strings with the length in [min_length, max_length].
+        """
+        length = len(self.s)
+        if self._length_allowed(length, min_length, max_length):
+            yield self.s
+            for i in range(1, self.n + 1):
+                yield from self._substitutions(i)
+        for i in range(1, min(self.n, length) + 1):
+            if self._length_allowed(length - i, min_length, max_length):
+                yield from self._deletions(0, length - i)
+            if self._length_allowed(length + i, min_length, max_length):
+                yield from self._insertions(self._insert_start, length + i)
+
+    @staticmethod
+    def _length_allowed(length: int, min_length: int, max_length=None):
+        return length >= min_length and (max_length is None or length <= max_length)
+
+    def _substitutions(self, n_subs: int):
+        alphabet_last = self.alphabet[-1]
+        choices = []
+        for char in self.s:
+            if char in self.alphabet:
+                choices.append([c for c in self.alphabet if c != char])
+            else:
+                choices.append([c for c in self.alphabet if c != alphabet_last])
+        for positions in combinations(range(len(self.s)), n_subs):
+            cousin = list(self.s)
+            for replacements in product(*(choices[p] for p in positions)):
+                for p, r in zip(positions, replacements):
+                    cousin[p] = r
+                yield ''.join(cousin)
+
+    def _deletions(self, pos: int, n_keep: int, prefix=''):
+        # distinct subsequences of s[pos:] of length n_keep
+        if n_keep == 0:
+            yield prefix
+            return
+        for char, pos_next in self._next[pos].items():
+            if len(self.s) - pos_next >= n_keep:
+                yield from self._deletions(pos_next + 1, n_keep - 1, prefix + char)
+
+    def _count_deletions(self, pos: int, n_keep: int) -> int:
+        if pos == 0 and n_keep == len(self.s) - 1:
+            # a single deletion: one per run of equal chars
+            return sum(1 for p in range(len(self.s)) if p == 0 or self.s[p] != self.s[p - 1])
+        if n_keep == 0:
+            return 1
+        return sum(self._count_deletions(pos_next + 1, n_keep - 1)
+                   for pos_next in self._next[pos].values()
+                   if len(self.s) - pos_next >= n_keep)
+
+    # NFA state: (chars of s consumed, a char is inserted before s[consumed])
+    _insert_start = frozenset([(0, False)])
+
+    def _step_insert(self, states: FrozenSet[Tuple[int, bool]], char: str):
+        states_next = set()
+        for consumed, inserted in states:
+            if consumed < len(self.s):
+                if self.s[consumed] == char:
+                    states_next.add((consumed + 1, False))
+                if not inserted and char in self.alphabet_insert:
+                    states_next.add((consumed, True))
+        return frozenset(states_next)
+
+    def _transitions(self, states: FrozenSet[Tuple[int, bool]]) -> List[Tuple[List[str], FrozenSet]]:
+        # (chars, next states) of the subset automaton, grouped by non-empty next states
+        transitions = self._transitions_memo.get(states)
+        if transitions is None:
+            groups = {}
+            for char in self._chars:
+                groups.setdefault(self._step_insert(states, char), []).append(char)
+            if self._insert_other:
+                states_other = self._step_insert(states, self._insert_other[0])
+                groups.setdefault(states_other, []).extend(self._insert_other)
+            transitions = [(chars, states_next) for states_next, chars in groups.items() if states_next]
+            self._transitions_memo[states] = transitions
+        return transitions
+
+    def _count_insertions(self, states: FrozenSet[Tuple[int, bool]], steps: int) -> int:
+        if states == self._insert_start and steps == len(self.s) + 1:
+            # a single insertion of `char` before s[p] duplicates the insertion
+            # before s[p + 1] if and only if char == s[p]
+            duplicates = sum(1 for p in range(len(self.s) - 1) if self.s[p] in self.alphabet_insert)
+            return len(self.s) * len(self.alphabet_insert) - duplicates
+        key = (states, steps)
+        count = self._count_memo.get(key)
+        if count is None:
+            if steps == 0:
+                count = int(any(consumed == len(self.s) for consumed, inserted in states))
+            else:
+                count = sum(len(chars) * self._count_insertions(states_next, steps - 1)
+                            for chars, states_next in self._transitions(states))
+            self._count_memo[key] = count
+        return count
+
+    def _insertion_suffixes(self, states: FrozenSet[Tuple[int, bool]], steps: int) -> Tuple[str, ...]:
+        key = (states, steps)
+        suffixes = self._suffixes_memo.get(key)
+        if suffixes is None:
+            if steps == 0:
+                suffixes = ('',) if self._count_insertions(states, steps) else ()
+            else:
+                suffixes = tuple(char + suffix
+                                 for chars, states_next in self._transitions(states)
+                                 for suffix in self._insertion_suffixes(states_next, steps - 1)
+                                 for char in chars)
+            self._suffixes_memo[key] = suffixes
+        return suffixes
+
+    def _insertions(self, states: FrozenSet[Tuple[int, bool]], steps: int):
+        if self._count_insertions(states, steps) <= self.suffixes_memo_max:
+            yield from self._insertion_suffixes(states, steps)
+            return
+        for chars, states_next in self._transitions(states):
+            for suffix in self._insertions(states_next, steps - 1):
+                for char in chars:
+                    yield char + suffix
+
+
+def hamming_ball_unique(s: str, n: int, alphabet: Union[str, List[str]] = ALPHABET_DEFAULT,
+                        min_length=0, max_length=None) -> Iterator[str]:
+    """Generate unique strings of `hamming_ball()` with the length in
+    [min_length, max_length].
+    """
+    return HammingNeighbourhood(s, n, alphabet).generate(min_length=min_length, max_length=max_length)
+
+
+def hamming_ball_size(s: str, n: int, alphabet: Union[str, List[str]] = ALPHABET_DEFAULT,
+                      min_length=0, max_length=None) -> int:
+    """The exact number of unique strings of `hamming_ball()` with the length
+    in [min_length, max_length].
+    """
+    return HammingNeighbourhood(s, n, alphabet).size(min_length=min_length, max_length=max_length)
+
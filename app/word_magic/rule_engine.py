@@ -0,0 +1,432 @@
+"""
+In-process port of the hashcat rule engine (`inc_rp.cl`, used by `hashcat --stdout`).
+A function that does not apply (a position out of range, a result longer than
+RP_PASSWORD_SIZE) leaves the word unchanged. Rejection and memory functions are
+not supported by `hashcat -r`: the rules that contain them are skipped.
+"""
+
+import string
+from functools import lru_cache
+from itertools import zip_longest
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple, Union, Callable, Optional
+
+from app.domain import Rule
+from app.logger import logger
+
+RP_PASSWORD_SIZE = 256
+# hashcat applies the rules to a batch of words this many rules at a time on
+# a CPU OpenCL device; the number depends on the device
+HASHCAT_RULES_PER_PASS = 64
+POSITIONS = string.digits + string.ascii_uppercase
+
+CompiledRule = Tuple[Tuple[Callable, tuple], ...]
+
+
+def _toggle(char: int) -> int:
+    if 0x41 <= char <= 0x5a or 0x61 <= char <= 0x7a:
+        return char ^ 0x20
+    return char
+
+
+def _title(word: bytes, sep: int) -> bytes:
+    buf = bytearray(word.lower())
+    upper_next = True
+    for pos, char in enumerate(buf):
+        if upper_next and 0x61 <= char <= 0x7a:
+            buf[pos] = char ^ 0x20
+        upper_next = char == sep
+    return bytes(buf)
+
+
+def _noop(word):
+    return word
+
+
+def _lower(word):
+    return word.lower()
+
+
+def _upper(word):
+    return word.upper()
+
+
+def _capitalize(word):
+    return word[:1].upper() + word[1:].lower()
+
+
+def _invert_capitalize(word):
+    return word[:1].lower() + word[1:].upper()
+
+
+def _toggle_all(word):
+    return word.swapcase()
+
+
+def _toggle_at(word, pos):
+    if pos >= len(word):
+        return word
+    return word[:pos] + bytes((_toggle(word[pos]),)) + word[pos + 1:]
+
+
+def _reverse(word):
+    return word[::-1]
+
+
+def _duplicate(word):
+    if len(word) * 2 >= RP_PASSWORD_SIZE:
+        return word
+    return word * 2
+
+
+def _duplicate_times(word, times):
+    if len(word) * (times + 1) >= RP_PASSWORD_SIZE:
+        return word
+    return word * (times + 1)
+
+
+def _reflect(word):
+    if len(word) * 2 >= RP_PASSWORD_SIZE:
+        return word
+    return word + word[::-1]
+
+
+def _rotate_left(word):
+    return word[1:] + word[:1]
+
+
+def _rotate_right(word):
+    return word[-1:] + word[:-1]
+
+
+def _append(word, char):
+    if len(word) + 1 >= RP_PASSWORD_SIZE:
+        return word
+    return word + char
+
+
+def _prepend(word, char):
+    if len(word) + 1 >= RP_PASSWORD_SIZE:
+        return word
+    return char + word
+
+
+def _delete_first(word):
+    return word[1:]
+
+
+def _delete_last(word):
+    return word[:-1]
+
+
+def _delete_at(word, pos):
+    if pos >= len(word):
+        return word
+    return word[:pos] + word[pos + 1:]
+
+
+def _extract(word, pos, length):
+    if pos >= len(word) or pos + length > len(word):
+        return word
+    return word[pos: pos + length]
+
+
+def _omit(word, pos, length):
+    if pos >= len(word) or pos + length > len(word):
+        return word
+    return word[:pos] + word[pos + length:]
+
+
+def _insert(word, pos, char):
+    if pos > len(word) or len(word) + 1 >= RP_PASSWORD_SIZE:
+        return word
+    return word[:pos] + char + word[pos:]
+
+
+def _overwrite(word, pos, char):
+    if pos >= len(word):
+        return word
+    return word[:pos] + char + word[pos + 1:]
+
+
+def _truncate(word, pos):
+    if pos >= len(word):
+        return word
+    return word[:pos]
+
+
+def _replace(word, old, new):
+    return word.replace(old, new)
+
+
+def _purge(word, char):
+    return word.replace(char, b'')
+
+
+def _duplicate_first(word, times):
+    if len(word) == 0 or len(word) + times >= RP_PASSWORD_SIZE:
+        return word
+    return word[:1] * times + word
+
+
+def _duplicate_last(word, times):
+    if len(word) == 0 or len(word) + times >= RP_PASSWORD_SIZE:
+        return word
+    return word + word[-1:] * times
+
+
+def _duplicate_all(word):
+    if len(word) * 2 >= RP_PASSWORD_SIZE:
+        return word
+    return bytes(char for char in word for _ in range(2))
+
+
+def _swap_front(word):
+    if len(word) < 2:
+        return word
+    return word[1:2] + word[:1] + word[2:]
+
+
+def _swap_back(word):
+    if len(word) < 2:
+        return word
+    return word[:-2] + word[-1:] + word[-2:-1]
+
+
+def _swap_at(word, pos, pos2):
+    if pos >= len(word) or pos2 >= len(word):
+        return word
+    buf = bytearray(word)
+    buf[pos], buf[pos2] = buf[pos2], buf[pos]
+    return bytes(buf)
+
+
+def _set_char(word, pos, func):
+    if pos >= len(word):
+        return word
+    return word[:pos] + bytes((func(word[pos]) & 0xff,)) + word[pos + 1:]
+
+
+def _shift_left(word, pos):
+    return _set_char(word, pos, lambda char: char << 1)
+
+
+def _shift_right(word, pos):
+    return _set_char(word, pos, lambda char: char >> 1)
+
+
+def _increment(word, pos):
+    return _set_char(word, pos, lambda char: char + 1)
+
+
+def _decrement(word, pos):
+    return _set_char(word, pos, lambda char: char - 1)
+
+
+def _replace_next(word, pos):
+    if pos + 1 >= len(word):
+        return word
+    return word[:pos] + word[pos + 1: pos + 2] + word[pos + 1:]
+
+
+def _replace_prev(word, pos):
+    if pos == 0 or pos >= len(word):
+        return word
+    return word[:pos] + word[pos - 1: pos] + word[pos + 1:]
+
+
+def _duplicate_block_front(word, length):
+    if length > len(word) or len(word) + length >= RP_PASSWORD_SIZE:
+        return word
+    return word[:length] + word
+
+
+def _duplicate_block_back(word, length):
+    if length > len(word) or len(word) + length >= RP_PASSWORD_SIZE:
+        return word
+    return word + word[len(word) - length:]
+
+
+def _title_space(word):
+    return _title(word, sep=ord(' '))
+
+
+def _title_sep(word, char):
+    return _title(word, sep=char[0])
+
+
+def _toggle_after_sep(word, occurrence, char):
+    occurrences = 0
+    for pos, current in enumerate(word):
+        if current != char[0]:
+            continue
+        if occurrences == occurrence:
+            return _toggle_at(word, pos + 1)
+        occurrences += 1
+    return word
+
+
+# function name -> (implementation, parameter kinds: 'N' is a position, 'X' is a char)
+RULE_FUNCTIONS = {
+    ':': (_noop, ''),
+    'l': (_lower, ''),
+    'u': (_upper, ''),
+    'c': (_capitalize, ''),
+    'C': (_invert_capitalize, ''),
+    't': (_toggle_all, ''),
+    'T': (_toggle_at, 'N'),
+    'r': (_reverse, ''),
+    'd': (_duplicate, ''),
+    'p': (_duplicate_times, 'N'),
+    'f': (_reflect, ''),
+    '{': (_rotate_left, ''),
+    '}': (_rotate_right, ''),
+    '$': (_append, 'X'),
+    '^': (_prepend, 'X'),
+    '[': (_delete_first, ''),
+    ']': (_delete_last, ''),
+    'D': (_delete_at, 'N'),
+    'x': (_extract, 'NN'),
+    'O': (_omit, 'NN'),
+    'i': (_insert, 'NX'),
+    'o': (_overwrite, 'NX'),
+    "'": (_truncate, 'N'),
+    's': (_replace, 'XX'),
+    '@': (_purge, 'X'),
+    'z': (_duplicate_first, 'N'),
+    'Z': (_duplicate_last, 'N'),
+    'q': (_duplicate_all, ''),
+    'k': (_swap_front, ''),
+    'K': (_swap_back, ''),
+    '*': (_swap_at, 'NN'),
+    'L': (_shift_left, 'N'),
+    'R': (_shift_right, 'N'),
+    '+': (_increment, 'N'),
+    '-': (_decrement, 'N'),
+    '.': (_replace_next, 'N'),
+    ',': (_replace_prev, 'N'),
+    'y': (_duplicate_block_front, 'N'),
+    'Y': (_duplicate_block_back, 'N'),
+    'E': (_title_space, ''),
+    'e': (_title_sep, 'X'),
+    '3': (_toggle_after_sep, 'NX'),
+}
+
+
+def compile_rule(rule: Union[str, bytes]) -> CompiledRule:
+    """
+    Compile a single hashcat rule line.
+
+    :raises ValueError: on invalid or unsupported rule functions
+    """
+    if isinstance(rule, str):
+        rule = rule.encode('utf-8', errors='surrogateescape')
+    compiled = []
+    pos = 0
+    while pos < len(rule):
+        name = chr(rule[pos])
+        pos += 1
+        if name == ' ':
+            continue
+        if name not in RULE_FUNCTIONS:
+            raise ValueError(f"Unsupported rule function '{name}' in '{rule}'")
+        func, param_kinds = RULE_FUNCTIONS[name]
+        params = []
+        for kind in param_kinds:
+            if pos >= len(rule):
+                raise ValueError(f"Missing parameter of '{name}' in '{rule}'")
+            param = rule[pos: pos + 1]
+            pos += 1
+            if kind == 'N':
+                param = POSITIONS.find(param.decode('latin-1'))
+                if param == -1:
+                    raise ValueError(f"Invalid position of '{name}' in '{rule}'")
+            params.append(param)
+        compiled.append((func, tuple(params)))
+    return tuple(compiled)
+
+
+@lru_cache()
+def read_rules(rule_path: Union[str, Path]) -> Tuple[CompiledRule, ...]:
+    """
+    Read and compile a hashcat rule file. Invalid rules are skipped.
+    """
+    rules = []
+    with open(rule_path, 'rb') as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        if len(line) == 0 or line.startswith(b'#'):
+            continue
+        try:
+            rules.append(compile_rule(line))
+        except ValueError as error:
+            logger.warning(f"Skipping invalid or unsupported rule in {rule_path}: {error}")
+    return tuple(rules)
+
+
+def apply_rule(word: bytes, rule: CompiledRule) -> bytes:
+    for func, params in rule:
+        word = func(word, *params)
+    return word
+
+
+def apply_rules(words: Iterable[str], rule: Union[Rule, str, Path], rules_per_pass: int = None) -> Iterator[str]:
+    """
+    Lazily apply a rule file to each word, like `hashcat --stdout -r rule`.
+    The candidates of a word are yielded before the next word is read.
+
+    :param words: base words
+    :param rule: a Rule or a path to a hashcat rule file
+    :param rules_per_pass: apply the rules to all words this many rules at
+                           a time, in the order of `hashcat --stdout` with a
+                           single batch of words; the words are read in memory
+    """
+    if isinstance(rule, Rule):
+        rule = rule.path
+    rules = read_rules(Path(rule))
+    words = (word.encode('utf-8', errors='surrogateescape') for word in words)
+    words = (word for word in words if len(word) < RP_PASSWORD_SIZE)
+    if rules_per_pass is None:
+        passes = [rules]
+    else:
+        words = list(words)
+        passes = [rules[start: start + rules_per_pass] for start in range(0, len(rules), rules_per_pass)]
+    for rules_pass in passes:
+        for word in words:
+            for compiled in rules_pass:
+                yield apply_rule(word, compiled).decode('utf-8', errors='surrogateescape')
+
+
+def read_words(wordlist_path: Union[str, Path]) -> Iterator[str]:
+    """
+    Lazily read a wordlist, preserving the original bytes of non-utf8 words.
+    """
+    with open(wordlist_path, 'rb') as f:
+        for line in f:
+            yield line.rstrip(b'\r\n').decode('utf-8', errors='surrogateescape')
+
+
+def verify_hashcat_stdout(wordlist_path: Union[str, Path], rule: Rule,
+                          rules_per_pass=HASHCAT_RULES_PER_PASS) -> Optional[Tuple[int, str, str]]:
+    """
+    Check the engine against the reference `hashcat --stdout` output of a
+    small wordlist, which hashcat reads in a single batch of words. hashcat
+    applies the rules to the batch `rules_per_pass` rules at a time, the
+    number of its device. The outputs are compared in order.
+
+    :return: the position, hashcat and engine candidates of the first
+             mismatch or None
+    """
+    from app.attack.hashcat_cmd import HashcatCmdStdout, iter_hashcat_stdout
+    hashcat_stdout = HashcatCmdStdout()
+    hashcat_stdout.add_wordlists(wordlist_path)
+    hashcat_stdout.add_rule(rule)
+    reference = iter_hashcat_stdout(hashcat_stdout)
+    candidates = apply_rules(read_words(wordlist_path), rule, rules_per_pass=rules_per_pass)
+    for position, (expected, candidate) in enumerate(zip_longest(reference, candidates)):
+        if expected != candidate:
+            logger.warning(f"{wordlist_path} + {rule}: candidate #{position} is '{candidate}', "
+                           f"hashcat --stdout yields '{expected}'")
+            return position, expected, candidate
+    return None
+
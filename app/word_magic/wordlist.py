@@ -1,24 +1,18 @@
-import datetime
-import re
-import shutil
 from copy import deepcopy
 from functools import lru_cache
 from pathlib import Path
 from typing import Union
 
-from app import lock_app
-from app.attack.hashcat_cmd import HashcatCmdStdout
 from app.config import WORDLISTS_USER_DIR
 from app.domain import WordList, Rule, NONE_STR
 from app.logger import logger
-from app.utils import subprocess_call
-from app.utils.file_io import calculate_md5, read_last_benchmark
 from app.word_magic.digits.create_digits import read_mask
+from app.word_magic.download import download_manager, Download
+from app.word_magic.rule_engine import apply_rules, read_words
+from app.word_magic.wordlist_stats import wordlist_stats
 
 
 class WordListInfo:
-    fast_count = 700_000
-
     def __init__(self, path, rate=None, count=None, url=None, checksum=None):
         self.path = path
         self.rate = rate
@@ -28,8 +22,11 @@ class WordListInfo:
         self.update_count()
 
     def update_count(self):
-        if self.custom:
-            self.count = count_wordlist(self.path)
+        # the wordlists are scanned in background by scan_wordlists() and
+        # after a download; the counts are read from the sidecars
+        stats = wordlist_stats(self.path, scan=False)
+        if stats is not None:
+            self.count = stats.count_wpa
 
     @property
     def name(self):
@@ -51,22 +48,18 @@ class WordListInfo:
             return f"{self.name} [{extra}]"
         return self.name
 
+    def start_download(self) -> Download:
+        """
+        Start downloading the wordlist in background or join the in-flight download.
+        """
+        return download_manager.start(self.path, url=self.url, checksum=self.checksum)
+
     def download(self):
         if self.path is None or self.path.exists():
             return
         if self.url is None:
             return
-        gzip_file = self.url.split('/')[-1]
-        gzip_file = self.path.with_name(gzip_file)
-        logger.debug(f"Downloading {gzip_file}")
-        if calculate_md5(gzip_file) != self.checksum:
-            subprocess_call(['wget', '-q', self.url, '-O', gzip_file])
-        with lock_app:
-            subprocess_call(['gzip', '-d', gzip_file])
-        # the format of a gzip file is name.txt.gz
-        txt_path = gzip_file.parent / gzip_file.stem
-        shutil.move(txt_path, self.path)
-        logger.debug(f"Downloaded and extracted {self.path}")
+        self.start_download().wait()
 
 
 class WordListDefault:
@@ -112,12 +105,15 @@ class WordListDefault:
         return d.get(str(path))
 
 
-def download_wordlist(wordlist_path: Path):
+def download_wordlist(wordlist_path: Path) -> Union[Download, None]:
+    """
+    Start downloading a wordlist in background.
+    """
     wordlist = find_wordlist_by_path(wordlist_path)
     if wordlist is None:
-        # fast mode or does not exist
-        return
-    wordlist.download()
+        # fast mode
+        return None
+    return wordlist.start_download()
 
 
 @lru_cache()
@@ -129,46 +125,24 @@ def count_rules(rule: Rule):
     return len(rules)
 
 
-@lru_cache()
-def count_wordlist(wordlist_path):
-    st_size_mb = Path(wordlist_path).stat().st_size / (2 ** 20)
-    if st_size_mb < 150:
-        wordlist_path = str(wordlist_path)
-        out, err = subprocess_call(['wc', '-l', wordlist_path])
-        out = out.rstrip('\n')
-        counter = 0
-        if re.fullmatch(f"\d+ {wordlist_path}", out):
-            counter, path = out.split(' ')
-        return int(counter)
-    count_per_mb = 100510.62068189554  # from top109M
-    count_approx = int(st_size_mb * count_per_mb)
-    return count_approx
-
-
-def estimate_runtime_fmt(wordlist_path: Path, rule: Rule) -> str:
-    speed = int(read_last_benchmark().speed)
-    if speed == 0:
-        return "unknown"
-
-    n_words = 0
-    if wordlist_path == NONE_STR:
-        wordlist_path = None
-    if wordlist_path is not None:
-        wordlist = find_wordlist_by_path(wordlist_path)
-        if wordlist is None:
-            return "unknown"
-        n_words += wordlist.count
-
-    n_candidates = n_words * count_rules(rule)
-
-    # add extra words to account for the 'fast' run, which includes
-    # 160k digits8, 120k top1k+best64 and ESSID manipulation
-    # (300k hamming ball, 70k digits append mask)
-    n_candidates += WordListInfo.fast_count
-
-    runtime = int(n_candidates / speed)  # in seconds
-    runtime_ftm = str(datetime.timedelta(seconds=runtime))
-    return runtime_ftm
+def count_wordlist(wordlist_path, scan=True) -> Union[int, None]:
+    # the number of WPA-valid (8-63 bytes) candidates or None if unknown
+    stats = wordlist_stats(wordlist_path, scan=scan)
+    if stats is None:
+        return None
+    return stats.count_wpa
+
+
+def scan_wordlists():
+    """
+    Persist the exact counts of the default, fast and user wordlists that
+    have no stats yet for the runtime estimation.
+    """
+    paths = [wlist.path for wlist in WordListDefault.list()]
+    paths.extend((WordList.TOP1K_RULE_BEST64.path, WordList.DIGITS_8.path, WordList.KEYBOARD_WALK.path))
+    paths.extend(sorted(WORDLISTS_USER_DIR.iterdir()))
+    for path in paths:
+        wordlist_stats(path)
 
 
 def create_fast_wordlists():
@@ -182,14 +156,10 @@ def create_fast_wordlists():
         wlist_top1k = WordListInfo(path=WordList.TOP1K.path, url=top1k_url,
                                    checksum="070a10f5e7a23f12ec6fc8c8c0ccafe8")
         wlist_top1k.download()
-        hashcat_stdout = HashcatCmdStdout(outfile=WordList.TOP1K_RULE_BEST64.path)
-        hashcat_stdout.add_wordlists(WordList.TOP1K)
-        hashcat_stdout.add_rule(Rule.BEST_64)
-        subprocess_call(hashcat_stdout.build())
-        with open(WordList.TOP1K_RULE_BEST64.path) as f:
-            unique = set(f.readlines())
-        with open(WordList.TOP1K_RULE_BEST64.path, 'w') as f:
-            f.writelines(unique)
+        candidates = apply_rules(read_words(WordList.TOP1K.path), Rule.BEST_64)
+        unique = sorted(set(candidates))
+        with open(WordList.TOP1K_RULE_BEST64.path, 'w', errors='surrogateescape') as f:
+            f.writelines(f"{candidate}\n" for candidate in unique)
 
 
 def find_wordlist_by_path(wordlist_path) -> Union[WordListInfo, None]:
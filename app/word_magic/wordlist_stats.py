@@ -0,0 +1,118 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+from collections import namedtuple
+from pathlib import Path
+from typing import Union, Optional
+
+import numpy as np
+
+from app.config import WORDLISTS_STATS_DIR
+from app.logger import logger
+
+WPA_MIN_LENGTH, WPA_MAX_LENGTH = 8, 63
+HISTOGRAM_MAX_LENGTH = 256  # longer lines are counted in the last bin
+STATS_CHUNK_SIZE = 64 * 1024 * 1024
+
+# count: lines; count_wpa: lines of 8-63 bytes, the only ones WPA accepts;
+# histogram: the number of lines of each length in bytes
+WordListStats = namedtuple('WordListStats', ('count', 'count_wpa', 'histogram', 'md5'))
+
+_stats_lock = threading.Lock()
+_scan_locks = {}  # sidecar path -> the lock of its scan
+
+
+def _line_lengths(buffer: np.ndarray, newlines: np.ndarray, line_start: int) -> np.ndarray:
+    # lengths of the lines that end at `newlines`, excluding '\r\n'
+    starts = np.empty_like(newlines)
+    starts[0] = line_start
+    starts[1:] = newlines[:-1] + 1
+    lengths = newlines - starts
+    carriage_return = (lengths > 0) & (buffer[np.maximum(newlines - 1, 0)] == ord('\r'))
+    return lengths - carriage_return
+
+
+def scan_wordlist(wordlist_path: Union[str, Path]) -> WordListStats:
+    """
+    Scan a wordlist with mmap in chunks. The last line does not have to end
+    with a newline.
+    """
+    histogram = np.zeros(HISTOGRAM_MAX_LENGTH + 1, dtype=np.int64)
+    md5 = hashlib.md5()
+    with open(wordlist_path, 'rb') as f:
+        size = Path(wordlist_path).stat().st_size
+        if size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                buffer = np.frombuffer(mm, dtype=np.uint8)
+                # the offset where the current (unfinished) line starts
+                line_start = 0
+                for chunk_start in range(0, size, STATS_CHUNK_SIZE):
+                    chunk_end = min(chunk_start + STATS_CHUNK_SIZE, size)
+                    md5.update(mm[chunk_start: chunk_end])
+                    newlines = np.flatnonzero(buffer[chunk_start: chunk_end] == ord('\n')) + chunk_start
+                    if len(newlines) == 0:
+                        continue
+                    lengths = _line_lengths(buffer, newlines, line_start)
+                    histogram += np.bincount(np.minimum(lengths, HISTOGRAM_MAX_LENGTH),
+                                             minlength=len(histogram))
+                    line_start = newlines[-1] + 1
+                if line_start < size:
+                    last_length = size - line_start - (buffer[size - 1] == ord('\r'))
+                    histogram[min(last_length, HISTOGRAM_MAX_LENGTH)] += 1
+                del buffer
+    return WordListStats(count=int(histogram.sum()),
+                         count_wpa=int(histogram[WPA_MIN_LENGTH: WPA_MAX_LENGTH + 1].sum()),
+                         histogram=histogram.tolist(),
+                         md5=md5.hexdigest())
+
+
+def _sidecar_path(wordlist_path: Path) -> Path:
+    path_hash = hashlib.md5(str(wordlist_path.absolute()).encode()).hexdigest()
+    return WORDLISTS_STATS_DIR / f"{wordlist_path.name}.{path_hash[:8]}.json"
+
+
+def _read_sidecar(sidecar_path: Path, stat: os.stat_result) -> Optional[WordListStats]:
+    # the sidecar is replaced atomically and is read without a lock
+    try:
+        sidecar = json.loads(sidecar_path.read_text())
+    except FileNotFoundError:
+        return None
+    if sidecar['size'] == stat.st_size and sidecar['mtime_ns'] == stat.st_mtime_ns:
+        return WordListStats(**sidecar['stats'])
+    return None
+
+
+def wordlist_stats(wordlist_path: Union[str, Path], scan=True) -> Optional[WordListStats]:
+    """
+    Read the wordlist stats from the persisted sidecar, keyed on the file size
+    and mtime, or scan the wordlist and persist the stats. Concurrent calls
+    share the scan of a wordlist; the other wordlists are not blocked.
+
+    :param scan: scan the wordlist if the sidecar is missing or outdated;
+                 if False, return None instead
+    """
+    wordlist_path = Path(wordlist_path)
+    if not wordlist_path.exists():
+        return None
+    stat = wordlist_path.stat()
+    sidecar_path = _sidecar_path(wordlist_path)
+    stats = _read_sidecar(sidecar_path, stat)
+    if stats is not None or not scan:
+        return stats
+    with _stats_lock:
+        scan_lock = _scan_locks.setdefault(sidecar_path, threading.Lock())
+    with scan_lock:
+        # scanned by another thread meanwhile
+        stats = _read_sidecar(sidecar_path, stat)
+        if stats is not None:
+            return stats
+        stats = scan_wordlist(wordlist_path)
+        sidecar = dict(path=str(wordlist_path), size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                       stats=stats._asdict())
+        sidecar_tmp = sidecar_path.with_suffix('.tmp')
+        sidecar_tmp.write_text(json.dumps(sidecar))
+        sidecar_tmp.replace(sidecar_path)
+    logger.debug(f"Scanned {wordlist_path}: {stats.count} lines, {stats.count_wpa} WPA-valid")
+    return stats
@@ -0,0 +1,34 @@
+"""
+The time to generate the unique strings of a Hamming ball compared to
+deduplicating `hamming_ball()` with a set.
+
+    python -m tests.bench_hamming
+"""
+
+import tests.environment  # noqa: F401, must be imported before the app
+
+import time
+
+from app.word_magic.hamming import hamming_ball, hamming_ball_size, hamming_ball_unique
+
+
+def benchmark(words=('Spartansky', 'MaloinvazivTrile_2.4GHz', 'aaabbbccc'), radius=(1, 2)):
+    for word in words:
+        for n in radius:
+            start = time.time()
+            unique_old = set(hamming_ball(word, n=n))
+            elapsed_old = time.time() - start
+            start = time.time()
+            unique_new = list(hamming_ball_unique(word, n=n))
+            elapsed_new = time.time() - start
+            start = time.time()
+            size = hamming_ball_size(word, n=n)
+            elapsed_size = time.time() - start
+            assert len(unique_new) == len(set(unique_new)) == size
+            assert set(unique_new) == unique_old
+            print(f"'{word}', n={n}: {size} unique; hamming_ball+set {elapsed_old:.3f} sec, "
+                  f"hamming_ball_unique {elapsed_new:.3f} sec, hamming_ball_size {elapsed_size * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    benchmark()
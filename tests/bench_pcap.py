@@ -0,0 +1,36 @@
+"""
+The throughput of the in-process pcapng extractor on a large capture of
+encrypted frames with the fixture handshakes at the end.
+
+    python -m tests.bench_pcap [SIZE_MB]
+"""
+
+import tests.environment  # noqa: F401, must be imported before the app
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.attack.pcap import iter_22000_lines
+from tests.pcap_fixtures import encrypted_frame, fixture_frames, pcapng_epb, write_pcapng
+
+
+def benchmark(size_mb: int):
+    frames, expected = fixture_frames()
+    noise_block = pcapng_epb(encrypted_frame())
+    n_noise = size_mb * 2 ** 20 // len(noise_block) // 10000 * 10000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        capture = Path(tmpdir) / "large.pcapng"
+        write_pcapng(capture, frames, noise=(noise_block * 10000 for _ in range(n_noise // 10000)))
+        size = capture.stat().st_size
+        start = time.time()
+        lines = list(iter_22000_lines(capture))
+        elapsed = time.time() - start
+    assert set(lines) == expected
+    print(f"Extracted {len(lines)} hash lines of {size / 2 ** 20:.0f} MB ({n_noise} frames) "
+          f"in {elapsed:.2f} sec ({size / 2 ** 20 / elapsed:.0f} MB/sec)")
+
+
+if __name__ == '__main__':
+    benchmark(size_mb=int(sys.argv[1]) if len(sys.argv) > 1 else 1024)
@@ -0,0 +1,36 @@
+"""
+The time to index a large potfile and to look up the hashes of an upload.
+
+    python -m tests.bench_potfile [N_HASHES]
+"""
+
+import tests.environment  # noqa: F401, must be imported before the app
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.attack.potfile import PotfileIndex, hash_id_of_line
+
+
+def benchmark(n_hashes: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        potfile = Path(tmpdir) / "hashcat.potfile"
+        index = PotfileIndex(potfile=potfile, db_path=Path(tmpdir) / "potfile.db")
+        hash_lines = [f"WPA*02*{i:032x}*aabbccddeeff*112233445566*{'essid'.encode().hex()}*anonce*eapol*00"
+                      for i in range(n_hashes)]
+        with open(potfile, 'w') as f:
+            f.writelines(f"{hash_id_of_line(line)}:password{i}\n" for i, line in enumerate(hash_lines[::2]))
+        start = time.time()
+        n_lines = index.refresh()
+        print(f"Indexed {n_lines} lines in {time.time() - start:.2f} sec")
+        start = time.time()
+        cracked = index.lookup(hash_lines)
+        elapsed = time.time() - start
+    assert len(cracked) == len(hash_lines[::2])
+    print(f"Looked up {n_hashes} hashes: {elapsed / n_hashes * 1e6:.1f} us per hash")
+
+
+if __name__ == '__main__':
+    benchmark(n_hashes=int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
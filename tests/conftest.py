@@ -0,0 +1 @@
+import tests.environment  # noqa: F401, must be imported before the app
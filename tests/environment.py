@@ -0,0 +1,17 @@
+"""
+The environment of the app under test, set before the app is imported:
+a temporary home folder and a stub hashcat in PATH.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+STUBS_DIR = Path(__file__).parent / "stubs"
+
+os.environ['HOME'] = tempfile.mkdtemp(prefix="hashcat-wpa-server-tests-")
+os.environ['PATH'] = f"{STUBS_DIR}{os.pathsep}{os.environ['PATH']}"
+os.environ.setdefault('HASHCAT_ADMIN_USER', 'admin')
+os.environ.setdefault('HASHCAT_ADMIN_PASSWORD', 'admin')
+# the tests drive the job queue themselves
+os.environ['JOB_QUEUE_CONSUMER'] = '0'
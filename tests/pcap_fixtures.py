@@ -0,0 +1,135 @@
+"""
+Synthetic 802.11 captures with WPA handshakes of a known password and their
+expected 22000 lines.
+"""
+
+import hashlib
+import hmac
+import struct
+from pathlib import Path
+
+from app.attack.pcap import EAPOL_KEY, LLC_EAPOL, PMKID_KDE, PCAPNG_SHB, PCAPNG_IDB, PCAPNG_EPB, \
+    PCAPNG_BYTE_ORDER, LINKTYPE_RADIOTAP, _ZERO_NONCE
+
+PASSWORD = b"password123"
+RADIOTAP = b'\x00\x00\x08\x00\x00\x00\x00\x00'
+
+
+def pmk(password: bytes, essid: bytes) -> bytes:
+    return hashlib.pbkdf2_hmac('sha1', password, essid, 4096, 32)
+
+
+def kck(pmk_bytes: bytes, ap: bytes, sta: bytes, anonce: bytes, snonce: bytes) -> bytes:
+    data = min(ap, sta) + max(ap, sta) + min(anonce, snonce) + max(anonce, snonce)
+    return hmac.new(pmk_bytes, b"Pairwise key expansion\x00" + data + b'\x00', hashlib.sha1).digest()[:16]
+
+
+def verify_22000(line: str, password: bytes) -> bool:
+    # an independent check of a line: the MIC or PMKID of a known password
+    fields = line.split('*')
+    hash_bytes, ap, sta, essid = (bytes.fromhex(field) for field in fields[2:6])
+    pmk_bytes = pmk(password, essid)
+    if fields[1] == '01':
+        return hmac.new(pmk_bytes, b"PMK Name" + ap + sta, hashlib.sha1).digest()[:16] == hash_bytes
+    anonce, eapol = bytes.fromhex(fields[6]), bytes.fromhex(fields[7])
+    kck_bytes = kck(pmk_bytes, ap, sta, anonce, eapol[17:49])
+    return hmac.new(kck_bytes, eapol, hashlib.sha1).digest()[:16] == hash_bytes
+
+
+def beacon(ap: bytes, essid: bytes) -> bytes:
+    return RADIOTAP + b'\x80\x00\x00\x00' + b'\xff' * 6 + ap + ap + b'\x00\x00' + bytes(12) + \
+        bytes([0, len(essid)]) + essid + b'\x01\x01\x82'
+
+
+def eapol_key(key_info: int, replay_counter: int, nonce: bytes, key_data=b'') -> bytes:
+    body = struct.pack('>BHHQ32s16s8s8s16sH', 2, key_info, 16, replay_counter, nonce, bytes(16), bytes(8),
+                       bytes(8), bytes(16), len(key_data)) + key_data
+    return struct.pack('>BBH', 2, EAPOL_KEY, len(body)) + body
+
+
+def with_mic(eapol: bytes, kck_bytes: bytes) -> bytes:
+    mic = hmac.new(kck_bytes, eapol, hashlib.sha1).digest()[:16]
+    return eapol[:81] + mic + eapol[97:]
+
+
+def data_frame(ap: bytes, sta: bytes, from_ap: bool, payload: bytes, qos=False, protected=False) -> bytes:
+    flags = (0x02 if from_ap else 0x01) | (0x40 if protected else 0)
+    addresses = sta + ap + ap if from_ap else ap + sta + ap
+    header = bytes([0x88 if qos else 0x08, flags]) + b'\x00\x00' + addresses + b'\x00\x00'
+    if qos:
+        header += b'\x00\x00'
+    return RADIOTAP + header + payload
+
+
+def handshake(ap: bytes, sta: bytes, essid: bytes, password: bytes, messages=(1, 2, 3, 4), qos=False):
+    """
+    :return: the frames of a 4-way handshake and its expected 22000 lines
+    """
+    anonce, snonce = hashlib.sha256(ap).digest(), hashlib.sha256(sta).digest()
+    pmk_bytes = pmk(password, essid)
+    kck_bytes = kck(pmk_bytes, ap, sta, anonce, snonce)
+    pmkid = hmac.new(pmk_bytes, b"PMK Name" + ap + sta, hashlib.sha1).digest()[:16]
+    m1 = eapol_key(0x008a, 1, anonce, key_data=PMKID_KDE + pmkid)
+    m2_zeroed = eapol_key(0x010a, 1, snonce, key_data=b'\x30\x14' + bytes(20))
+    m3 = with_mic(eapol_key(0x13ca, 2, anonce, key_data=bytes(56)), kck_bytes)
+    m4 = with_mic(eapol_key(0x030a, 2, _ZERO_NONCE), kck_bytes)
+    eapols = {1: m1, 2: with_mic(m2_zeroed, kck_bytes), 3: m3, 4: m4}
+    frames = [data_frame(ap, sta, from_ap=message in (1, 3), payload=LLC_EAPOL + eapols[message], qos=qos)
+              for message in messages]
+    m2_mic = eapols[2][81:97].hex()
+    prefix = f"{ap.hex()}*{sta.hex()}*{essid.hex()}"
+    expected = set()
+    if 1 in messages:
+        expected.add(f"WPA*01*{pmkid.hex()}*{prefix}***")
+    if 1 in messages and 2 in messages:
+        expected.add(f"WPA*02*{m2_mic}*{prefix}*{anonce.hex()}*{m2_zeroed.hex()}*00")
+    elif 2 in messages and 3 in messages:
+        expected.add(f"WPA*02*{m2_mic}*{prefix}*{anonce.hex()}*{m2_zeroed.hex()}*02")
+    return frames, expected
+
+
+def encrypted_frame() -> bytes:
+    return data_frame(bytes.fromhex("aabbccddeeff"), bytes.fromhex("112233445566"), from_ap=True,
+                      payload=bytes(1400), protected=True)
+
+
+def fixture_frames():
+    """
+    :return: the radiotap frames of three handshakes and their expected 22000 lines
+    """
+    ap1, ap2, ap3 = bytes.fromhex("aabbccddeeff"), bytes.fromhex("a0b0c0d0e0f0"), bytes.fromhex("0a0b0c0d0e0f")
+    sta1, sta2 = bytes.fromhex("112233445566"), bytes.fromhex("665544332211")
+    frames1, expected1 = handshake(ap1, sta1, b"PetitCafe", PASSWORD)
+    # no M1: the M2+M3 pair; QoS data frames
+    frames2, expected2 = handshake(ap2, sta2, b"Home", PASSWORD, messages=(2, 3, 4), qos=True)
+    # the beacon after the handshake
+    frames3, expected3 = handshake(ap3, sta1, b"Office", PASSWORD, messages=(1, 2))
+    frames = [beacon(ap1, b"PetitCafe"), encrypted_frame(), *frames1, beacon(ap2, b"Home"), *frames2, *frames3,
+              beacon(ap3, b"Office")]
+    return frames, expected1 | expected2 | expected3
+
+
+def pcapng_block(block_type: int, body: bytes) -> bytes:
+    body += bytes(-len(body) % 4)
+    return struct.pack('<II', block_type, len(body) + 12) + body + struct.pack('<I', len(body) + 12)
+
+
+def pcapng_epb(frame: bytes) -> bytes:
+    return pcapng_block(PCAPNG_EPB, struct.pack('<IIIII', 0, 0, 0, len(frame), len(frame)) + frame)
+
+
+def write_pcapng(path: Path, frames, noise=(), linktype=LINKTYPE_RADIOTAP):
+    with open(path, 'wb') as f:
+        f.write(pcapng_block(PCAPNG_SHB, struct.pack('<IHHq', PCAPNG_BYTE_ORDER, 1, 0, -1)))
+        f.write(pcapng_block(PCAPNG_IDB, struct.pack('<HHI', linktype, 0, 0xffff)))
+        for noise_block in noise:
+            f.write(noise_block)
+        for frame in frames:
+            f.write(pcapng_epb(frame))
+
+
+def write_pcap(path: Path, frames, linktype=LINKTYPE_RADIOTAP):
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 0xffff, linktype))
+        for frame in frames:
+            f.write(struct.pack('<IIII', 0, 0, len(frame), len(frame)) + frame)
@@ -0,0 +1,116 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+from app.attack import base_attack
+from app.attack.base_attack import BaseAttack, stages_of_keys, batch_essids
+from app.attack.potfile import potfile_index
+from app.domain import WordList
+from app.word_magic import essid as essid_module
+from tests.pcap_fixtures import handshake, verify_22000
+
+
+def test_read_keys(tmp_path):
+    file_22000 = tmp_path / "capture.22000"
+    file_22000.touch()
+    attack = BaseAttack(file_22000, verbose=False)
+    assert attack.read_keys() == set()
+    attack.key_file.write_text(f"{'1' * 32}:aabbccddeeff:112233445566:Home:pass:word\n"
+                               f"{'2' * 32}:aabbccddeeff:665544332211:$HEX[486f6d653a]:password\n")
+    assert attack.read_keys() == {"pass:word", "password"}
+
+
+def test_stages_of_keys():
+    calls = []
+
+    def factory(timer_name, candidates):
+        def candidates_factory():
+            calls.append(timer_name)
+            return iter(candidates)
+
+        return timer_name, candidates_factory
+
+    stages = [factory("run_top1k", ["password", "qwerty"]),
+              factory("run_digits8", ["12345678", "password"]),
+              factory("run_essid_attack", ["Home2017"]),
+              factory("run_names", ["Olena"])]
+    found_by = stages_of_keys({"password", "12345678", "Home2017", "unknown"}, stages)
+    assert found_by == {"password": "run_top1k", "12345678": "run_digits8", "Home2017": "run_essid_attack",
+                        "unknown": None}
+    # the candidates of each stage are generated once for all keys
+    assert calls == ["run_top1k", "run_digits8", "run_essid_attack", "run_names"]
+    calls.clear()
+    assert stages_of_keys({"qwerty"}, stages) == {"qwerty": "run_top1k"}
+    assert calls == ["run_top1k"]
+
+
+def test_run_pmk_table(tmp_path, monkeypatch):
+    essid = "Home:5G\n"
+    mic_1, mic_2, ap, sta = '1' * 32, '2' * 32, "aabbccddeeff", "112233445566"
+    pmk_1, pmk_2 = 'a' * 64, 'b' * 64
+    table = SimpleNamespace(essid=essid, iter_pmks_hex=lambda: iter((pmk_1, pmk_2)),
+                            password={pmk_1: "pass:word"}.get)
+
+    def run_with_stdin(hashcat_cmd, candidates, lock=None):
+        # hashcat writes the ESSIDs with a ':' in the $HEX[] notation
+        essid_hex = f"$HEX[{essid.encode().hex()}]"
+        Path(hashcat_cmd.outfile).write_text(f"{mic_1}:{ap}:{sta}:{essid_hex}:{pmk_1}\n"
+                                             f"{mic_2}:{ap}:{sta}:{essid_hex}:{pmk_2}\n")
+
+    monkeypatch.setattr(base_attack, 'run_with_stdin', run_with_stdin)
+    monkeypatch.setattr(BaseAttack, 'pmk_table', lambda self, wordlist: table)
+    file_22000 = tmp_path / "capture.22000"
+    line_1, line_2 = (f"WPA*02*{mic}*{ap}*{sta}*{essid.encode().hex()}*{'a' * 64}*{'b' * 198}*00"
+                      for mic in (mic_1, mic_2))
+    file_22000.write_text(f"{line_1}\n{line_2}\n")
+    attack = BaseAttack(file_22000, verbose=False)
+    assert attack.run_pmk_table(WordList.TOP1K_RULE_BEST64)
+    # the PMK missing in the table is skipped
+    assert attack.read_keys() == {"pass:word"}
+    assert potfile_index.lookup([line_1, line_2]) == {line_1: "pass:word"}
+
+
+def test_batch_essids():
+    essids = [("a", 10), ("b", 20), ("large", 10 ** 6), ("c", 30), ("d", 40), ("e", 50)]
+    assert batch_essids(essids, max_candidates=100, max_size=8) == [["a", "b"], ["large"], ["c", "d"], ["e"]]
+    assert batch_essids(essids, max_candidates=10 ** 7, max_size=4) == [["a", "b", "large", "c"], ["d", "e"]]
+    assert batch_essids([]) == []
+
+
+def test_essid_attack_batches(tmp_path, monkeypatch):
+    # two ESSIDs with few candidates share a run, the large one runs alone
+    passwords = {"BatchSmall1": "small1-password", "BatchSmall2": "small2-password",
+                 "BatchLarge": "large-password"}
+    counts = {"BatchSmall1": 10, "BatchSmall2": 10, "BatchLarge": 10 ** 6}
+    lines = []
+    for index, (essid, password) in enumerate(passwords.items()):
+        frames, essid_lines = handshake(bytes([0xa0, 0, 0, 0, 0, index]), bytes.fromhex("112233445566"),
+                                        essid.encode(), password.encode())
+        lines.extend(sorted(essid_lines))
+    file_22000 = tmp_path / "capture.22000"
+    file_22000.write_text('\n'.join(lines) + '\n')
+    # only the candidates of a small ESSID include the password of the large one
+    candidates = {"BatchSmall1": ["small1-password", "large-password"], "BatchSmall2": ["small2-password"],
+                  "BatchLarge": ["wrong-password"]}
+    runs, cracked = [], set()
+
+    def run_with_stdin(hashcat_cmd, candidates, lock=None):
+        # checks each candidate against each hash of the run like hashcat
+        run_lines = Path(hashcat_cmd.hcap_file).read_text().splitlines()
+        runs.append({bytes.fromhex(line.split('*')[5]).decode() for line in run_lines})
+        for candidate in candidates:
+            for line in run_lines:
+                if verify_22000(line, candidate.encode()):
+                    cracked.add((candidate, bytes.fromhex(line.split('*')[5]).decode()))
+
+    monkeypatch.setattr(essid_module, 'run_with_stdin', run_with_stdin)
+    monkeypatch.setattr(essid_module, 'essid_candidates', lambda essid, fast: iter(candidates[essid]))
+    monkeypatch.setattr(base_attack, 'count_essid_candidates', lambda essid, fast: counts[essid])
+    attack = BaseAttack(file_22000, verbose=False)
+    attack.run_essid_attack()
+    assert runs == [{"BatchSmall1", "BatchSmall2"}, {"BatchLarge"}]
+    # the candidates of the small ESSIDs are not hashed against the large one
+    assert cracked == {("small1-password", "BatchSmall1"), ("small2-password", "BatchSmall2")}
+    # the tried ESSIDs are not attacked again
+    runs.clear()
+    attack.run_essid_attack()
+    assert runs == []
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from app.word_magic import candidates_cache as cache_module
+from app.word_magic.candidates_cache import CandidatesCache
+
+CANDIDATES = [f"password{i}" for i in range(1000)]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CandidatesCache(cache_dir=tmp_path, max_bytes=2 ** 30)
+
+
+class Generator:
+    def __init__(self, candidates=CANDIDATES):
+        self.candidates = candidates
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return iter(self.candidates)
+
+
+def test_key(cache, monkeypatch):
+    key = cache.key("PetitCafe", fast=True)
+    assert key == cache.key("PetitCafe", fast=True)
+    assert len({key, cache.key("PetitCafe", fast=False), cache.key("Home", fast=True)}) == 3
+    # the candidates of a changed rule file or generation are not reused
+    monkeypatch.setattr(cache_module, 'file_checksum', lambda path: "changed")
+    assert cache.key("PetitCafe", fast=True) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(cache_module, 'CANDIDATES_VERSION', cache_module.CANDIDATES_VERSION + 1)
+    assert cache.key("PetitCafe", fast=True) != key
+
+
+def test_write_through_and_count(cache):
+    generate = Generator()
+    assert cache.count("PetitCafe", fast=True) is None
+    assert list(cache.essid_candidates("PetitCafe", fast=True, generate=generate)) == CANDIDATES
+    assert cache.count("PetitCafe", fast=True) == len(CANDIDATES)
+    assert list(cache.essid_candidates("PetitCafe", fast=True, generate=generate)) == CANDIDATES
+    assert generate.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_partially_read_entry_is_not_published(cache):
+    candidates = cache.essid_candidates("PetitCafe", fast=True, generate=Generator())
+    assert next(candidates) == CANDIDATES[0]
+    candidates.close()
+    assert cache.count("PetitCafe", fast=True) is None
+    assert list(cache.cache_dir.iterdir()) == []
+
+
+def test_entry_evicted_before_reading(cache):
+    generate = Generator()
+    list(cache.essid_candidates("PetitCafe", fast=True, generate=generate))
+    candidates = cache.essid_candidates("PetitCafe", fast=True, generate=generate)
+    # evicted by another process after the lookup
+    cache.path(cache.key("PetitCafe", fast=True)).unlink()
+    assert list(candidates) == CANDIDATES
+    assert generate.calls == 2
+    # the entry is written again
+    assert cache.path(cache.key("PetitCafe", fast=True)).exists()
+    assert cache.count("PetitCafe", fast=True) == len(CANDIDATES)
+
+
+def test_lru_eviction(cache):
+    essids = ["first", "second", "third"]
+    for essid in essids:
+        list(cache.essid_candidates(essid, fast=True, generate=Generator()))
+    paths = {essid: cache.path(cache.key(essid, fast=True)) for essid in essids}
+    for age, essid in enumerate(reversed(essids)):
+        os.utime(paths[essid], (1000 - age, 1000 - age))
+    # reading an entry makes it the most recently used
+    list(cache.essid_candidates("first", fast=True, generate=Generator()))
+    cache.max_bytes = paths["first"].stat().st_size + paths["third"].stat().st_size
+    cache.evict()
+    assert not paths["second"].exists()
+    assert cache.count("second", fast=True) is None
+    assert paths["first"].exists() and paths["third"].exists()
+    assert cache.count("first", fast=True) == len(CANDIDATES)
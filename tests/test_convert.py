@@ -0,0 +1,67 @@
+from pathlib import Path
+
+import pytest
+
+from app.attack import convert
+from app.attack.convert import convert_to_22000, split_by_essid
+from app.attack.pcap import pcap_to_22000
+from app.utils import group_22000_by_essid
+from tests.pcap_fixtures import fixture_frames, write_pcap, write_pcapng
+
+HCX_LINE = f"WPA*01*{'1' * 32}*aabbccddeeff*112233445566*{b'PetitCafe'.hex()}***"
+
+
+def test_split_by_essid(tmp_path):
+    capture_path = tmp_path / "capture.pcapng"
+    frames, expected = fixture_frames()
+    write_pcapng(capture_path, frames)
+    file_22000 = tmp_path / "capture.22000"
+    assert pcap_to_22000(capture_path, file_22000) == len(expected)
+    lines = file_22000.read_text().splitlines()
+    # duplicates: the same PMKID and the same EAPOL of a different message pair
+    duplicates = [line if line.startswith("WPA*01") else line[:-2] + "82" for line in lines]
+    file_22000.write_text('\n'.join(lines + duplicates) + '\n')
+
+    essid_lines = group_22000_by_essid(file_22000)
+    assert sorted(bytes.fromhex(essid) for essid in essid_lines) == [b"Home", b"Office", b"PetitCafe"]
+    assert set().union(*essid_lines.values()) == expected
+
+    files_essid = split_by_essid(file_22000, to_folder=tmp_path / "split")
+    assert {file_essid.stem: [hash_22000.line for hash_22000 in hashes]
+            for file_essid, hashes in files_essid.items()} == essid_lines
+    for file_essid in files_essid:
+        assert file_essid.read_text().splitlines() == essid_lines[file_essid.stem]
+
+
+@pytest.fixture
+def hcxpcapngtool(monkeypatch):
+    # a stub hcxpcapngtool that finds a handshake the native extractor misses
+    calls = []
+
+    def subprocess_call(args):
+        calls.append(args)
+        Path(args[2]).write_text(f"{HCX_LINE}\n")
+        return '', ''
+
+    monkeypatch.setattr(convert, 'subprocess_call', subprocess_call)
+    monkeypatch.setattr(convert.shutil, 'which', lambda name: f"/usr/bin/{name}")
+    return calls
+
+
+def test_hcxpcapngtool_lines_are_merged(tmp_path, hcxpcapngtool):
+    capture_path = tmp_path / "capture.pcapng"
+    frames, expected = fixture_frames()
+    write_pcapng(capture_path, frames)
+    file_22000 = convert_to_22000(capture_path)
+    assert len(hcxpcapngtool) == 1
+    assert set(file_22000.read_text().splitlines()) == expected | {HCX_LINE}
+    # the hcxpcapngtool output is removed
+    assert set(tmp_path.iterdir()) == {capture_path, file_22000}
+
+
+def test_native_only_without_hcxpcapngtool(tmp_path, monkeypatch):
+    monkeypatch.setattr(convert.shutil, 'which', lambda name: None)
+    capture_path = tmp_path / "capture.pcap"
+    frames, expected = fixture_frames()
+    write_pcap(capture_path, frames)
+    assert set(convert_to_22000(capture_path).read_text().splitlines()) == expected
@@ -0,0 +1,68 @@
+import functools
+import gzip
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+from app.word_magic.download import DownloadManager
+from app.word_magic.wordlist_stats import wordlist_stats
+
+WORDS = ''.join(f"password{i}\n" for i in range(100_000)).encode()
+
+
+@pytest.fixture
+def served(tmp_path):
+    # a local HTTP server of a gzipped wordlist
+    served_dir = tmp_path / "served"
+    served_dir.mkdir()
+    gzip_path = served_dir / "wordlist.txt.gz"
+    gzip_path.write_bytes(gzip.compress(WORDS))
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=served_dir)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/{gzip_path.name}", hashlib.md5(gzip_path.read_bytes()).hexdigest()
+    server.shutdown()
+    server.server_close()
+
+
+def test_shared_download(tmp_path, served):
+    url, checksum = served
+    manager = DownloadManager()
+    path = tmp_path / "wordlist.txt"
+    downloads = [manager.start(path, url=url, checksum=checksum) for _ in range(8)]
+    assert all(download is downloads[0] for download in downloads)
+    assert downloads[0].wait(timeout=60)
+    assert downloads[0].error is None
+    assert downloads[0].progress == 100
+    assert path.read_bytes() == WORDS
+    # the stats are persisted for the runtime estimation
+    assert wordlist_stats(path, scan=False).count_wpa == 100_000
+    # the finished download is forgotten
+    assert manager.get(path) is None
+    download = manager.start(path, url=url, checksum=checksum)
+    assert download.finished and download.error is None
+    assert manager.get(path) is None
+
+
+def test_checksum_mismatch(tmp_path, served):
+    url, checksum = served
+    manager = DownloadManager()
+    path = tmp_path / "corrupted.txt"
+    download = manager.start(path, url=url, checksum="0" * 32)
+    assert download.wait(timeout=60)
+    assert isinstance(download.error, ValueError)
+    assert not path.exists()
+    assert not list(tmp_path.glob("*.part"))
+    # the failed download reports its error until it is restarted
+    assert manager.get(path) is download
+    download = manager.start(path, url=url, checksum=checksum)
+    assert download.wait(timeout=60) and download.error is None
+    assert path.read_bytes() == WORDS
+
+
+def test_missing_url(tmp_path):
+    download = DownloadManager().start(tmp_path / "missing.txt")
+    assert download.finished
+    assert isinstance(download.error, FileNotFoundError)
@@ -0,0 +1,83 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.attack import essid_tried as essid_tried_module
+from app.attack.essid_tried import EssidTried
+
+PAIRS = [f"aabbccddee{index:02x}:{f'essid{index}'.encode().hex()}" for index in range(20)]
+
+
+@pytest.fixture
+def legacy_path(tmp_path):
+    legacy_path = tmp_path / "essid_tried"
+    legacy_path.write_text('\n'.join(PAIRS[:10]) + '\n')
+    return legacy_path
+
+
+@pytest.fixture
+def imports(monkeypatch):
+    imports = []
+    monkeypatch.setattr(essid_tried_module.logger, 'info', imports.append)
+    return imports
+
+
+def test_legacy_import_once(tmp_path, legacy_path, imports):
+    essid_tried = EssidTried(db_path=tmp_path / "essid_tried.db", legacy_path=legacy_path)
+    # the legacy pairs are tried in the long mode
+    assert essid_tried.tried(PAIRS) == set(PAIRS[:10])
+    assert essid_tried.tried(PAIRS, fast=True) == set(PAIRS[:10])
+    assert len(imports) == 1
+    # the legacy file is not imported again
+    essid_tried.add(PAIRS[:1], stage="other")
+    legacy_path.write_text('\n'.join(PAIRS) + '\n')
+    essid_tried = EssidTried(db_path=tmp_path / "essid_tried.db", legacy_path=legacy_path)
+    assert essid_tried.tried(PAIRS) == set(PAIRS[:10])
+    assert len(imports) == 1
+
+
+def test_legacy_import_concurrent(tmp_path, legacy_path, imports):
+    n_workers = 8
+    barrier = threading.Barrier(n_workers)
+
+    def open_store(_):
+        barrier.wait()
+        return EssidTried(db_path=tmp_path / "essid_tried.db", legacy_path=legacy_path)
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        stores = list(executor.map(open_store, range(n_workers)))
+    assert len(imports) == 1
+    assert stores[-1].tried(PAIRS) == set(PAIRS[:10])
+
+
+def test_fast_mode(tmp_path):
+    essid_tried = EssidTried(db_path=tmp_path / "essid_tried.db", legacy_path=tmp_path / "missing")
+    essid_tried.add(PAIRS[:1], fast=True)
+    assert essid_tried.is_tried(PAIRS[0], fast=True)
+    # the long mode is a superset of the fast mode
+    assert not essid_tried.is_tried(PAIRS[0])
+    essid_tried.add(PAIRS[:1])
+    assert essid_tried.is_tried(PAIRS[0])
+    assert not essid_tried.is_tried(PAIRS[0], stage="other", fast=True)
+
+
+def test_concurrent_writers(tmp_path):
+    db_path = tmp_path / "essid_tried.db"
+    writers = [EssidTried(db_path=db_path, legacy_path=tmp_path / "missing") for _ in range(2)]
+    pairs = [f"{index:012x}:{f'essid{index}'.encode().hex()}" for index in range(1000)]
+    barrier = threading.Barrier(len(writers))
+
+    def write(writer_id: int):
+        writer = writers[writer_id]
+        barrier.wait()
+        starts = range(0, len(pairs), 10)
+        # the writers add the same pairs in the opposite order
+        for start in (reversed(starts) if writer_id else starts):
+            writer.add(pairs[start: start + 10], fast=bool(writer_id))
+            assert writer.tried(pairs[start: start + 10], fast=True) == set(pairs[start: start + 10])
+
+    with ThreadPoolExecutor(max_workers=len(writers)) as executor:
+        list(executor.map(write, range(len(writers))))
+    essid_tried = EssidTried(db_path=db_path, legacy_path=tmp_path / "missing")
+    assert essid_tried.tried(pairs) == essid_tried.tried(pairs, fast=True) == set(pairs)
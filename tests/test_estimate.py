@@ -0,0 +1,114 @@
+import io
+from http import HTTPStatus
+from types import SimpleNamespace
+
+import pytest
+
+from app import app, db
+from app.domain import Rule
+from app.login import User
+from app.uploader import UploadedTask
+from app.word_magic import essid, estimate
+from app.word_magic.candidates_cache import CandidatesCache
+from app.word_magic.estimate import count_essid_candidates, count_essids_candidates, \
+    count_main_wordlist_candidates
+from app.word_magic.wordlist import count_rules
+from app.word_magic.wordlist_stats import wordlist_stats
+
+ESSIDS = ["PetitCafe", "MyRabbit", "Tanya007"]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = CandidatesCache(cache_dir=tmp_path, max_bytes=2 ** 30)
+    monkeypatch.setattr(essid, 'candidates_cache', cache)
+    monkeypatch.setattr(estimate, 'candidates_cache', cache)
+    return cache
+
+
+def test_essid_count_is_cached(cache):
+    assert cache.count("PetitCafe", fast=True) is None
+    count = count_essid_candidates("PetitCafe", fast=True)
+    assert count == len(list(essid.essid_candidates("PetitCafe", fast=True)))
+    assert cache.count("PetitCafe", fast=True) == count
+    assert (cache.hits, cache.misses) == (1, 1)
+    # the estimate reads the stored count
+    assert count_essid_candidates("PetitCafe", fast=True) == count
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_essids_count_is_bounded(cache):
+    counts = [count_essid_candidates(name, fast=True) for name in ESSIDS[:2]]
+    assert count_essids_candidates(ESSIDS[:2], fast=True, max_generated=0) == sum(counts)
+    # the uncached ESSID is not generated and counts as the mean of the others
+    assert count_essids_candidates(ESSIDS, fast=True, max_generated=0) == sum(counts) + sum(counts) // 2
+    assert cache.count(ESSIDS[2], fast=True) is None
+    assert count_essids_candidates(ESSIDS, fast=True, max_generated=1) == \
+        sum(counts) + cache.count(ESSIDS[2], fast=True)
+    assert count_essids_candidates(["Unknown"], fast=True, max_generated=0) == 0
+
+
+def test_main_wordlist_count(tmp_path, monkeypatch):
+    wordlist_path = tmp_path / "wordlist.txt"
+    wordlist_path.write_text("password\nshort\n12345678\n")
+    # a built-in wordlist with the hard-coded total count
+    wordlist = SimpleNamespace(path=wordlist_path, count=3)
+    monkeypatch.setattr(estimate, 'find_wordlist_by_path', lambda path: wordlist)
+    # the wordlist is not scanned in the estimate
+    assert count_main_wordlist_candidates(wordlist_path) == 3
+    assert wordlist_stats(wordlist_path, scan=False) is None
+    wordlist_stats(wordlist_path)
+    assert count_main_wordlist_candidates(wordlist_path) == 2
+    assert count_main_wordlist_candidates(wordlist_path, rule=Rule.BEST_64) == 2 * count_rules(Rule.BEST_64)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', False)
+    client = app.test_client()
+    client.post('/login', data=dict(username='guest', password='guest'))
+    return client
+
+
+def hash_line(essid: bytes) -> str:
+    return f"WPA*01*{'1' * 32}*aabbccddeeff*112233445566*{essid.hex()}***"
+
+
+def test_estimate_22000(client, cache):
+    # a non-UTF-8 ESSID
+    lines = [hash_line(b"PetitCafe"), hash_line(b"Caf\xe9"), hash_line(b"PetitCafe")]
+    capture = io.BytesIO('\n'.join(lines).encode())
+    response = client.post('/estimate_runtime', data=dict(wordlist="None", rule="None",
+                                                         capture=(capture, "capture.22000")))
+    assert response.status_code == HTTPStatus.OK
+    assert response.json['essids'] == 2
+    assert cache.count("Caf\ufffd", fast=False) is not None
+    capture = io.BytesIO(b"not a 22000 file")
+    response = client.post('/estimate_runtime', data=dict(capture=(capture, "capture.22000")))
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_estimate_is_not_converting(client):
+    capture = io.BytesIO(b"\xd4\xc3\xb2\xa1")
+    response = client.post('/estimate_runtime', data=dict(capture=(capture, "capture.pcap")))
+    assert response.status_code == HTTPStatus.OK
+    assert response.json['essids'] is None
+
+
+def test_estimate_task(client, cache):
+    with app.app_context():
+        user = User.query.filter_by(username='guest').first()
+        task = UploadedTask(user_id=user.id, filename="estimate_test", essid="PetitCafe")
+        db.session.add(task)
+        db.session.commit()
+        task_id = task.id
+    try:
+        response = client.post('/estimate_runtime', data=dict(task_id=task_id))
+        assert response.status_code == HTTPStatus.OK
+        assert response.json['essids'] == 1
+        response = client.post('/estimate_runtime', data=dict(task_id=task_id + 1000))
+        assert response.status_code == HTTPStatus.NOT_FOUND
+    finally:
+        with app.app_context():
+            UploadedTask.query.filter_by(id=task_id).delete()
+            db.session.commit()
@@ -0,0 +1,43 @@
+from functools import lru_cache
+
+import pytest
+
+from app.word_magic.hamming import HammingNeighbourhood, hamming_ball, hamming_ball_size, hamming_ball_unique
+
+# repeated chars, chars out of the alphabet, a single char
+WORDS = ["Spartansky", "aaabbbccc", "Wi-Fi_2.4", "abab", "z"]
+# the length bounds of WPA passwords and bounds that cut the ball
+LENGTH_BOUNDS = [(0, None), (8, 63), (4, 4), (10, 11)]
+
+
+@lru_cache()
+def hamming_ball_set(word: str, n: int) -> frozenset:
+    # the reference: all strings of the ball, deduplicated with a set
+    return frozenset(hamming_ball(word, n=n))
+
+
+@pytest.mark.parametrize("word", WORDS)
+@pytest.mark.parametrize("n", [1, 2])
+@pytest.mark.parametrize("min_length,max_length", LENGTH_BOUNDS)
+def test_hamming_ball_unique(word, n, min_length, max_length):
+    expected = {cousin for cousin in hamming_ball_set(word, n)
+                if len(cousin) >= min_length and (max_length is None or len(cousin) <= max_length)}
+    unique = list(hamming_ball_unique(word, n=n, min_length=min_length, max_length=max_length))
+    assert len(unique) == len(set(unique))
+    assert set(unique) == expected
+    assert hamming_ball_size(word, n=n, min_length=min_length, max_length=max_length) == len(expected)
+
+
+@pytest.mark.parametrize("alphabet", ["abc", ["a", "b", "-"]])
+def test_hamming_ball_alphabet(alphabet):
+    expected = set(hamming_ball("abca-", n=2, alphabet=alphabet))
+    unique = list(hamming_ball_unique("abca-", n=2, alphabet=alphabet))
+    assert len(unique) == len(set(unique)) == hamming_ball_size("abca-", n=2, alphabet=alphabet)
+    assert set(unique) == expected
+
+
+def test_insertions_not_memoized(monkeypatch):
+    monkeypatch.setattr(HammingNeighbourhood, 'suffixes_memo_max', 10)
+    unique = list(hamming_ball_unique("Spartansky", n=2, min_length=12))
+    assert len(unique) == len(set(unique))
+    assert set(unique) == {cousin for cousin in hamming_ball_set("Spartansky", 2) if len(cousin) >= 12}
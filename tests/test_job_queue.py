@@ -0,0 +1,83 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from app import app, db
+from app.attack import scheduler
+from app.attack.job_queue import JobQueue, JobState, JobKind, Job
+from app.attack.worker import HashcatWorker
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue()
+    # the jobs queued by the app start up
+    queue.cancel_all()
+    yield queue
+    with app.app_context():
+        Job.query.delete()
+        db.session.commit()
+
+
+def _load_test_consumer(kind: str, crash_after: int = None):
+    # claim and finish the jobs until the queue is drained
+    queue = JobQueue(lease=1)
+    with app.app_context():
+        # do not share the connections of the parent process
+        db.engine.dispose()
+    claimed = finished = 0
+    while True:
+        claim = queue.claim(kinds=(kind,))
+        if claim is None:
+            if queue.stats(kind=kind).get(JobState.RUNNING, 0) == 0:
+                return claimed, finished
+            # wait for the leases of the crashed consumer to expire
+            time.sleep(0.2)
+            continue
+        claimed += 1
+        if crash_after is not None and claimed > crash_after:
+            # a crashed consumer leaves its last claim behind
+            return claimed, finished
+        queue.heartbeat([claim])
+        finished += queue.finish(claim)
+
+
+def test_concurrent_consumers_finish_each_job_once(queue):
+    kind = "load_test"
+    n_jobs, n_consumers = 1000, 8
+    for i in range(n_jobs):
+        queue.enqueue(kind=kind, priority=i % 3, unique=False)
+    with ProcessPoolExecutor(max_workers=n_consumers) as executor:
+        # the first consumer crashes and its job is claimed again after the lease
+        futures = [executor.submit(_load_test_consumer, kind, crash_after=10 if i == 0 else None)
+                   for i in range(n_consumers)]
+        results = [future.result() for future in futures]
+    finished = sum(finished for claimed, finished in results)
+    assert finished == n_jobs
+    assert queue.stats(kind=kind) == {JobState.DONE: n_jobs}
+
+
+def test_claim_in_priority_order(queue):
+    low = queue.enqueue(kind="priority_test", priority=0, unique=False)
+    high = queue.enqueue(kind="priority_test", priority=2, unique=False)
+    assert queue.claim(kinds=("priority_test",)).id == high
+    assert queue.claim(kinds=("priority_test",)).id == low
+    assert queue.claim(kinds=("priority_test",)) is None
+
+
+def test_worker_claims_without_discovered_devices(queue, monkeypatch):
+    # `hashcat -I` lists no devices: the jobs run on the default devices slot
+    monkeypatch.setenv('HASHCAT_STUB_DEVICES', '')
+    scheduler.hashcat_devices.cache_clear()
+    worker = HashcatWorker(app, consume=False)
+    try:
+        assert worker.scheduler.devices == ()
+        # the task does not exist: the claimed job is cancelled right away
+        job_id = queue.enqueue(kind=JobKind.CRACK, task_id=10 ** 6)
+        worker._claim_jobs()
+        with app.app_context():
+            assert db.session.get(Job, job_id).state == JobState.CANCELLED
+    finally:
+        worker.scheduler.shutdown()
+        scheduler.hashcat_devices.cache_clear()
@@ -0,0 +1,108 @@
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from app.attack.convert import _convert_native
+from app.attack.pcap import iter_22000_lines, pcap_to_22000, LINKTYPE_AVS, PCAPNG_SHB, PCAPNG_IDB, PCAPNG_EPB, \
+    PCAPNG_PB, PCAPNG_SPB, PCAPNG_BYTE_ORDER
+from app.domain import InvalidFileError
+from tests.pcap_fixtures import PASSWORD, RADIOTAP, fixture_frames, verify_22000, write_pcap, write_pcapng, \
+    pcapng_block
+
+WRITERS = pytest.mark.parametrize("writer,name", [(write_pcapng, "fixture.pcapng"), (write_pcap, "fixture.pcap")])
+
+
+@WRITERS
+def test_extract_fixture_lines(tmp_path, writer, name):
+    frames, expected = fixture_frames()
+    capture = tmp_path / name
+    writer(capture, frames)
+    lines = list(iter_22000_lines(capture))
+    assert len(lines) == len(expected)
+    assert set(lines) == expected
+    assert all(verify_22000(line, PASSWORD) for line in lines)
+    assert not any(verify_22000(line, b"wrong-password") for line in lines)
+
+
+@WRITERS
+@pytest.mark.skipif(shutil.which("hcxpcapngtool") is None, reason="hcxpcapngtool is not installed")
+def test_match_hcxpcapngtool(tmp_path, writer, name):
+    frames, expected = fixture_frames()
+    capture = tmp_path / name
+    writer(capture, frames)
+    reference = tmp_path / f"{name}.22000"
+    subprocess.run(["hcxpcapngtool", "-o", str(reference), str(capture)], capture_output=True)
+    reference_lines = reference.read_text().splitlines() if reference.exists() else []
+
+    def strip(hash_lines):
+        # hcxpcapngtool sets the nonce-error-correction bits of the message pair
+        return {'*'.join(line.split('*')[:8]) for line in hash_lines}
+
+    assert strip(iter_22000_lines(capture)) == strip(reference_lines)
+
+
+def test_avs_link_type(tmp_path):
+    frames, expected = fixture_frames()
+    avs_header = struct.pack('>II', 0x80211001, 64) + bytes(56)
+    capture = tmp_path / "avs.pcapng"
+    write_pcapng(capture, [avs_header + frame[len(RADIOTAP):] for frame in frames], linktype=LINKTYPE_AVS)
+    assert set(iter_22000_lines(capture)) == expected
+
+
+def test_unsupported_link_type_is_left_to_hcxpcapngtool(tmp_path):
+    frames, expected = fixture_frames()
+    capture = tmp_path / "ethernet.pcapng"
+    write_pcapng(capture, frames, linktype=1)
+    with pytest.raises(InvalidFileError):
+        list(iter_22000_lines(capture))
+    assert _convert_native(capture) == []
+
+
+@pytest.mark.parametrize("block_type", [PCAPNG_IDB, PCAPNG_EPB, PCAPNG_PB, PCAPNG_SPB])
+def test_malformed_block(tmp_path, block_type):
+    # a block without the room for its fixed fields
+    capture = tmp_path / "malformed.pcapng"
+    capture.write_bytes(pcapng_block(PCAPNG_SHB, struct.pack('<IHHq', PCAPNG_BYTE_ORDER, 1, 0, -1)) +
+                        pcapng_block(PCAPNG_IDB, struct.pack('<HHI', 127, 0, 0xffff)) +
+                        struct.pack('<III', block_type, 12, 12))
+    with pytest.raises(InvalidFileError):
+        list(iter_22000_lines(capture))
+    assert _convert_native(capture) == []
+
+
+def test_truncated_capture(tmp_path):
+    frames, expected = fixture_frames()
+    capture = tmp_path / "truncated.pcapng"
+    write_pcapng(capture, frames)
+    data = capture.read_bytes()
+    # the last beacon is cut off: the lines of its AP are never emitted
+    capture.write_bytes(data[:-10])
+    file_22000 = tmp_path / "truncated.22000"
+    count = pcap_to_22000(capture, file_22000)
+    lines = set(file_22000.read_text().splitlines())
+    assert count == len(lines)
+    assert lines == {line for line in expected if f"*{b'Office'.hex()}*" not in line}
+
+
+def test_not_a_capture(tmp_path):
+    capture = tmp_path / "empty.pcapng"
+    capture.touch()
+    with pytest.raises(InvalidFileError):
+        list(iter_22000_lines(capture))
+    capture.write_bytes(b"not a capture")
+    with pytest.raises(InvalidFileError):
+        list(iter_22000_lines(capture))
+
+
+def test_pcapng_epb_of_unknown_interface_is_skipped(tmp_path):
+    frames, expected = fixture_frames()
+    capture = tmp_path / "interfaces.pcapng"
+    write_pcapng(capture, frames)
+    data = capture.read_bytes()
+    # an EPB of the interface 1 while only the interface 0 is described
+    frame = frames[0]
+    epb = pcapng_block(PCAPNG_EPB, struct.pack('<IIIII', 1, 0, 0, len(frame), len(frame)) + frame)
+    capture.write_bytes(data + epb)
+    assert set(iter_22000_lines(capture)) == expected
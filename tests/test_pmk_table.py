@@ -0,0 +1,42 @@
+import concurrent.futures
+import os
+
+import pytest
+
+from app.attack import pmk_table
+from app.attack.pmk_table import PmkTable, pmk, PMK_SIZE
+
+N_WORDS = 50
+
+
+@pytest.fixture
+def table(tmp_path):
+    wordlist_path = tmp_path / "words.txt"
+    wordlist_path.write_text(''.join(f"password{i}\n" for i in range(N_WORDS)) + "short\n")
+    return PmkTable("PetitCafe", wordlist_path, tables_dir=tmp_path / "pmk")
+
+
+def test_precompute(table, monkeypatch):
+    # more chunks than the chunks in flight
+    monkeypatch.setattr(pmk_table, 'PMK_CHUNK_SIZE', 3)
+    assert not table.is_valid()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        table.precompute(pool)
+    assert table.is_valid()
+    pmks = list(table.iter_pmks_hex())
+    assert len(pmks) == N_WORDS
+    assert pmks[7] == pmk(b"password7", b"PetitCafe").hex()
+    assert table.password(pmks[7]) == "password7"
+    assert table.password("00" * PMK_SIZE) is None
+
+
+def test_outdated_table(table):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        table.precompute(pool)
+    # the same size, a different word
+    text = table.wordlist_path.read_text()
+    table.wordlist_path.write_text(text.replace("password1\n", "password#\n"))
+    stat = table.wordlist_path.stat()
+    os.utime(table.wordlist_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert table.wordlist_path.stat().st_size == len(text)
+    assert not table.is_valid()
@@ -0,0 +1,96 @@
+import pytest
+
+from app import app, db
+from app.attack import ingest
+from app.attack.hash_registry import HashLine
+from app.attack.ingest import ingest_capture
+from app.attack.potfile import PotfileIndex, hash_id_of_line
+from app.domain import TaskInfoStatus
+from app.login import User
+from app.uploader import UploadedTask
+
+PMKID_LINE = f"WPA*01*{'1' * 32}*aabbccddeeff*112233445566*{b'PetitCafe'.hex()}***"
+EAPOL_LINE = f"WPA*02*{'2' * 32}*aabbccddee00*112233445566*{b'Home'.hex()}*{'3' * 64}*{'4' * 242}*02"
+
+
+@pytest.fixture
+def index(tmp_path):
+    return PotfileIndex(potfile=tmp_path / "hashcat.potfile", db_path=tmp_path / "potfile.db")
+
+
+def test_lookup(index):
+    assert index.lookup([PMKID_LINE, EAPOL_LINE]) == {}
+    index.append(hash_id_of_line(PMKID_LINE), "password123")
+    assert index.lookup([PMKID_LINE, EAPOL_LINE]) == {PMKID_LINE: "password123"}
+    # hashcat writes the EAPOL hashes with a key that has a ':'
+    index.append(hash_id_of_line(EAPOL_LINE).upper(), "pass:word")
+    assert index.lookup([PMKID_LINE, EAPOL_LINE]) == {PMKID_LINE: "password123", EAPOL_LINE: "pass:word"}
+    assert index.found_key([PMKID_LINE, EAPOL_LINE]) == "Home:pass:word, PetitCafe:password123"
+    assert index.found_key([f"WPA*01*{'5' * 32}*aabbccddeeff*112233445566*{b'Other'.hex()}***"]) is None
+
+
+def test_refresh_is_incremental(index):
+    index.append(hash_id_of_line(PMKID_LINE), "password123")
+    assert index.refresh() == 1
+    assert index.refresh() == 0
+    # a line that is still being written is indexed once it is complete
+    with open(index.potfile, 'a') as f:
+        f.write(f"{hash_id_of_line(EAPOL_LINE)}:pass")
+    assert index.refresh() == 0
+    assert index.lookup([EAPOL_LINE]) == {}
+    with open(index.potfile, 'a') as f:
+        f.write("word123\n")
+    assert index.refresh() == 1
+    assert index.lookup([PMKID_LINE, EAPOL_LINE]) == {PMKID_LINE: "password123", EAPOL_LINE: "password123"}
+    assert [line for position, line in index.iter_lines()] == [f"{hash_id_of_line(PMKID_LINE)}:password123",
+                                                                f"{hash_id_of_line(EAPOL_LINE)}:password123"]
+    assert index.last_position(after=0, limit=1) == 1
+    assert index.last_position(after=2) is None
+
+
+def test_refresh_rewritten_potfile(index):
+    index.append(hash_id_of_line(PMKID_LINE), "password123")
+    index.append(hash_id_of_line(EAPOL_LINE), "password123")
+    assert len(index.lookup([PMKID_LINE, EAPOL_LINE])) == 2
+    # a truncated or rotated potfile is indexed from scratch
+    index.potfile.write_text(f"{hash_id_of_line(EAPOL_LINE)}:rotated\n")
+    assert index.lookup([PMKID_LINE, EAPOL_LINE]) == {EAPOL_LINE: "rotated"}
+    index.potfile.unlink()
+    assert index.refresh() == 0
+    index.potfile.write_text('')
+    assert index.lookup([PMKID_LINE, EAPOL_LINE]) == {}
+
+
+@pytest.fixture
+def ingesting_task(tmp_path):
+    capture = tmp_path / "capture.22000"
+    capture.write_text(f"{PMKID_LINE}\n{EAPOL_LINE}\n")
+    with app.app_context():
+        user = User.query.filter_by(username='guest').first()
+        task = UploadedTask(user_id=user.id, filename=capture.name, capture=str(capture), checksum="0" * 32,
+                            status=TaskInfoStatus.INGESTING)
+        db.session.add(task)
+        db.session.commit()
+        task_id = task.id
+    yield task_id
+    with app.app_context():
+        task_ids = [task.id for task in UploadedTask.query.filter_by(capture=str(capture))]
+        HashLine.query.filter(HashLine.task_id.in_(task_ids)).delete()
+        UploadedTask.query.filter(UploadedTask.id.in_(task_ids)).delete()
+        db.session.commit()
+
+
+def test_ingest_cracked_essid(index, ingesting_task, monkeypatch):
+    monkeypatch.setattr(ingest, 'potfile_index', index)
+    index.append(hash_id_of_line(PMKID_LINE), "password123")
+    task_ids = ingest_capture(ingesting_task)
+    with app.app_context():
+        task = UploadedTask.query.filter_by(capture=UploadedTask.query.get(ingesting_task).capture,
+                                            essid="PetitCafe").one()
+        # the ESSID cracked in an earlier upload is not attacked again
+        assert task.completed and task.status == TaskInfoStatus.COMPLETED
+        assert task.found_key == "PetitCafe:password123"
+        assert task.duplicates == 1
+        tasks = [UploadedTask.query.get(task_id) for task_id in task_ids]
+        assert [task.essid for task in tasks] == ["Home"]
+        assert tasks[0].status == TaskInfoStatus.SCHEDULED
@@ -0,0 +1,120 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import pytest
+
+from app import app, db, views
+from app.attack.job_queue import JobQueue, Job
+from app.attack.progress import progress_registry
+from app.login import User
+from app.uploader import UploadedTask
+
+
+@pytest.fixture
+def tasks():
+    n_tasks = 50
+    queue = JobQueue()
+    queue.cancel_all()
+    with app.app_context():
+        user = User.query.filter_by(username='guest').first()
+        tasks = [UploadedTask(user_id=user.id, filename="progress_test") for _ in range(n_tasks)]
+        db.session.add_all(tasks)
+        db.session.commit()
+        task_ids = [task.id for task in tasks]
+    for task_id in task_ids:
+        queue.enqueue(task_id=task_id)
+    yield queue, task_ids
+    with app.app_context():
+        Job.query.delete()
+        UploadedTask.query.filter(UploadedTask.id.in_(task_ids)).delete()
+        db.session.commit()
+
+
+@pytest.fixture
+def new_client():
+    client = app.test_client()
+    client.post('/login', data=dict(username='guest', password='guest'))
+    session_cookie = client.get_cookie('session').value
+
+    def new_client():
+        client = app.test_client()
+        client.set_cookie('session', session_cookie)
+        return client
+
+    return new_client
+
+
+@pytest.fixture(autouse=True)
+def csrf_disabled(monkeypatch):
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', False)
+
+
+def test_progress_conditional_requests(tasks, new_client):
+    queue, task_ids = tasks
+    n_clients, n_requests = 1000, 5
+    response = new_client().get('/progress')
+    assert response.status_code == HTTPStatus.OK
+    assert {task['task_id'] for task in response.json['tasks']} == set(task_ids)
+    etag = response.get_etag()[0]
+
+    def poll(client_id):
+        client = new_client()
+        return [client.get('/progress', headers={'If-None-Match': f'"{etag}"'}).status_code
+                for _ in range(n_requests)]
+
+    with ThreadPoolExecutor(max_workers=64) as executor:
+        statuses = {status for statuses in executor.map(poll, range(n_clients)) for status in statuses}
+    assert statuses == {HTTPStatus.NOT_MODIFIED}
+
+    claim = queue.claim()
+    response = new_client().get('/progress', query_string=dict(since=etag),
+                                headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == HTTPStatus.OK
+    assert [task['task_id'] for task in response.json['tasks']] == [claim.task_id]
+
+
+def _listen(client, connected: threading.Barrier):
+    # read the initial snapshot, then wait for the delta
+    response = client.get('/progress/stream', buffered=False)
+    events = (chunk for chunk in response.response if not chunk.startswith(b':'))
+    next(events)
+    connected.wait()
+    delta = next(events)
+    response.close()
+    return delta
+
+
+def test_progress_stream_pushes_changes(tasks, new_client, monkeypatch):
+    queue, task_ids = tasks
+    n_clients = 8
+    monkeypatch.setattr(progress_registry, '_streams', threading.BoundedSemaphore(n_clients))
+    connected = threading.Barrier(n_clients + 1)
+    with ThreadPoolExecutor(max_workers=n_clients) as executor:
+        futures = [executor.submit(_listen, new_client(), connected) for _ in range(n_clients)]
+        connected.wait()
+        # all the streams are open: the other clients poll
+        assert new_client().get('/progress/stream').status_code == HTTPStatus.NO_CONTENT
+        claim = queue.claim()
+        deltas = [future.result(timeout=10) for future in futures]
+    assert all(f'"task_id": {claim.task_id}'.encode() in delta for delta in deltas)
+    # the closed streams are released
+    response = new_client().get('/progress/stream', buffered=False)
+    assert response.status_code == HTTPStatus.OK
+    response.close()
+
+
+def test_progress_stream_ends_after_timeout(tasks, new_client, monkeypatch):
+    monkeypatch.setattr(views, 'PROGRESS_STREAM_TIMEOUT', 0.5)
+    monkeypatch.setattr(views, 'PROGRESS_KEEP_ALIVE', 0.1)
+    monkeypatch.setattr(progress_registry, '_streams', threading.BoundedSemaphore(1))
+    start = time.monotonic()
+    response = new_client().get('/progress/stream')
+    assert response.status_code == HTTPStatus.OK
+    assert time.monotonic() - start < 5
+    assert response.get_data().startswith(b"id: ")
+    # the server closes the ended stream
+    response.close()
+    assert progress_registry.open_stream()
+    progress_registry.close_stream()
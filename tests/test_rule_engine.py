@@ -0,0 +1,86 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from app.domain import Rule
+from app.word_magic.rule_engine import apply_rule, apply_rules, compile_rule, read_rules, read_words, \
+    verify_hashcat_stdout, HASHCAT_RULES_PER_PASS, RULE_FUNCTIONS
+from tests.environment import STUBS_DIR
+
+DATA_DIR = Path(__file__).parent / "data"
+WORDS = DATA_DIR / "words.txt"
+
+
+def _decode(text: str) -> bytes:
+    if text.startswith('$HEX[') and text.endswith(']'):
+        return bytes.fromhex(text[5:-1])
+    return text.encode('utf-8')
+
+
+def _rule_functions():
+    with open(DATA_DIR / "rule_functions.tsv", encoding='utf-8') as f:
+        for line in f.read().splitlines():
+            if line and not line.startswith('#'):
+                yield line.split('\t')
+
+
+RULE_EXAMPLES = list(_rule_functions())
+
+
+@pytest.mark.parametrize("rule,word,expected", RULE_EXAMPLES, ids=[rule for rule, *_ in RULE_EXAMPLES])
+def test_rule_function(rule, word, expected):
+    assert apply_rule(word.encode('utf-8'), compile_rule(rule)) == _decode(expected)
+
+
+def test_rule_functions_covered():
+    documented = {rule[0] for rule, word, expected in RULE_EXAMPLES}
+    assert documented == set(RULE_FUNCTIONS)
+
+
+@pytest.mark.parametrize("rule", list(Rule))
+def test_rule_file_functions(rule):
+    # all rules of the shipped rule files are supported
+    with open(rule.path, 'rb') as f:
+        n_rules = sum(1 for line in f.read().splitlines() if line and not line.startswith(b'#'))
+    assert len(read_rules(rule.path)) == n_rules
+
+
+# `hashcat --stdout -r <rule> words.txt` of hashcat v7.0.0 on a CPU OpenCL
+# device (pocl)
+HASHCAT_STDOUT = {
+    Rule.BEST_64: DATA_DIR / "hashcat_stdout_best64.txt",
+    Rule.ESSID: DATA_DIR / "hashcat_stdout_essid.txt",
+}
+
+
+@pytest.mark.parametrize("rule", list(Rule))
+def test_apply_rules_hashcat_order(rule):
+    expected = HASHCAT_STDOUT[rule].read_bytes().split(b'\n')[:-1]
+    candidates = apply_rules(read_words(WORDS), rule, rules_per_pass=HASHCAT_RULES_PER_PASS)
+    assert [candidate.encode('utf-8', errors='surrogateescape') for candidate in candidates] == expected
+
+
+def test_apply_rules_lazy():
+    # without passes, the candidates of a word are yielded before the next word is read
+    read = []
+
+    def words():
+        for word in read_words(WORDS):
+            read.append(word)
+            yield word
+
+    candidates = apply_rules(words(), Rule.BEST_64)
+    next(candidates)
+    assert len(read) == 1
+
+
+def _real_hashcat() -> bool:
+    hashcat = shutil.which('hashcat')
+    return hashcat is not None and Path(hashcat).parent != STUBS_DIR
+
+
+@pytest.mark.skipif(not _real_hashcat(), reason="hashcat is not installed")
+@pytest.mark.parametrize("rule", list(Rule))
+def test_hashcat_stdout(rule):
+    assert verify_hashcat_stdout(WORDS, rule) is None
@@ -0,0 +1,190 @@
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from app.attack import scheduler
+from app.attack.scheduler import DeviceScheduler, parse_hashcat_devices
+
+HASHCAT_INFO = """hashcat (v6.2.6) starting in backend information mode
+
+CUDA Info:
+==========
+
+Backend Device ID #1 (Alias: #3)
+  Name...........: GPU-0
+Backend Device ID #2 (Alias: #4)
+  Name...........: GPU-1
+
+OpenCL Info:
+============
+
+OpenCL Platform ID #1
+  Backend Device ID #3 (Alias: #1)
+    Name...........: GPU-0
+  Backend Device ID #4 (Alias: #2)
+    Name...........: GPU-1
+  Backend Device ID #5
+    Name...........: GPU-2
+"""
+
+
+@pytest.fixture
+def stub_devices(monkeypatch):
+    # the devices listed by the stub `hashcat -I`
+    def stub_devices(devices: str):
+        monkeypatch.setenv('HASHCAT_STUB_DEVICES', devices)
+        scheduler.hashcat_devices.cache_clear()
+
+    yield stub_devices
+    scheduler.hashcat_devices.cache_clear()
+
+
+@pytest.fixture
+def new_scheduler():
+    schedulers = []
+
+    def new_scheduler(**kwargs):
+        schedulers.append(DeviceScheduler(**kwargs))
+        return schedulers[-1]
+
+    yield new_scheduler
+    for device_scheduler in schedulers:
+        device_scheduler.shutdown()
+
+
+class Recorder:
+    """
+    Jobs that wait for their events and record the order they start in.
+    """
+
+    def __init__(self):
+        self.started = []
+        self.events = {}
+
+    def job(self, name, devices):
+        self.started.append(name)
+        event = self.events.get(name)
+        if event is not None:
+            assert event.wait(timeout=10)
+        return devices
+
+    def blocking(self, name) -> threading.Event:
+        self.events[name] = threading.Event()
+        return self.events[name]
+
+
+def wait_started(recorder: Recorder, *names):
+    deadline = time.monotonic() + 5
+    while not set(names).issubset(recorder.started):
+        assert time.monotonic() < deadline, recorder.started
+        time.sleep(0.01)
+
+
+def test_parse_hashcat_devices():
+    # a device of both CUDA and OpenCL backends is listed once
+    assert parse_hashcat_devices(HASHCAT_INFO) == (1, 2, 5)
+    assert parse_hashcat_devices("") == ()
+
+
+def test_hashcat_devices(stub_devices):
+    stub_devices('1,2,5')
+    assert scheduler.hashcat_devices() == (1, 2, 5)
+    stub_devices('')
+    assert scheduler.hashcat_devices() == ()
+
+
+def test_hashcat_not_installed(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    scheduler.hashcat_devices.cache_clear()
+    try:
+        assert scheduler.hashcat_devices() == ()
+    finally:
+        scheduler.hashcat_devices.cache_clear()
+
+
+def test_devices_discovered_lazily(new_scheduler, monkeypatch):
+    calls = []
+
+    def hashcat_devices():
+        calls.append(None)
+        return 1, 2
+
+    monkeypatch.setattr(scheduler, 'hashcat_devices', hashcat_devices)
+    device_scheduler = new_scheduler()
+    assert calls == []
+    assert device_scheduler.submit(lambda devices: devices).result(timeout=5) == (1,)
+    assert device_scheduler.devices == (1, 2)
+    assert len(calls) == 1
+
+
+def test_placement(stub_devices, new_scheduler):
+    stub_devices('1,2,5')
+    device_scheduler = new_scheduler(large_job_size=100)
+    assert device_scheduler.devices == (1, 2, 5)
+
+    def job(duration, devices):
+        time.sleep(duration)
+        return devices
+
+    large = [device_scheduler.submit(job, 0.5, size=10 ** 9), device_scheduler.submit(job, 0.5, size=10 ** 8)]
+    small = [device_scheduler.submit(job, 0.1, size=0) for _ in range(4)]
+    benchmark = device_scheduler.submit(job, 0.1, exclusive=True)
+    # queued jobs of the same wordlist are merged
+    coalesced = [device_scheduler.submit_coalesced(lambda items, devices: [(tuple(items), devices)] * len(items),
+                                                   item=f"task-{i}", key="Top29M+best64", size=10 ** 8)
+                 for i in range(3)]
+    concurrent.futures.wait(large + small + [benchmark] + coalesced, timeout=10)
+    # a device is always left for the small jobs
+    assert all(len(future.result()) < 3 for future in large)
+    assert all(len(future.result()) == 1 for future in small)
+    assert benchmark.result() == (1, 2, 5)
+    items, devices = coalesced[0].result()
+    assert items == ("task-0", "task-1", "task-2")
+    assert all(future.result() == coalesced[0].result() for future in coalesced)
+
+
+def test_default_devices_slot(stub_devices, new_scheduler):
+    stub_devices('')
+    device_scheduler = new_scheduler(large_job_size=100)
+    assert device_scheduler.slots == (None,)
+    futures = [device_scheduler.submit(lambda devices: devices, size=size) for size in (0, 10 ** 9)]
+    assert [future.result(timeout=5) for future in futures] == [(), ()]
+
+
+def test_large_job_is_not_starved(stub_devices, new_scheduler):
+    stub_devices('1,2')
+    device_scheduler = new_scheduler(large_job_size=100)
+    recorder = Recorder()
+    small_1, small_2 = recorder.blocking("small-1"), recorder.blocking("small-2")
+    device_scheduler.submit(recorder.job, "small-1")
+    device_scheduler.submit(recorder.job, "small-2")
+    wait_started(recorder, "small-1", "small-2")
+    large = device_scheduler.submit(recorder.job, "large", size=10 ** 9)
+    # the small jobs keep coming
+    later = [device_scheduler.submit(recorder.job, f"small-{i}") for i in range(3, 6)]
+    small_1.set()
+    time.sleep(0.3)
+    # the freed device is reserved for the large job
+    assert recorder.started == ["small-1", "small-2"]
+    small_2.set()
+    concurrent.futures.wait([large] + later, timeout=5)
+    assert recorder.started[2] == "large"
+    assert len(large.result()) == 1
+
+
+def test_small_jobs_beside_large_job(stub_devices, new_scheduler):
+    stub_devices('1,2')
+    device_scheduler = new_scheduler(large_job_size=100)
+    recorder = Recorder()
+    large_1 = recorder.blocking("large-1")
+    device_scheduler.submit(recorder.job, "large-1", size=10 ** 9)
+    wait_started(recorder, "large-1")
+    device_scheduler.submit(recorder.job, "large-2", size=10 ** 9)
+    # the spare device of a running large job is left for the small jobs
+    small = device_scheduler.submit(recorder.job, "small")
+    assert small.result(timeout=5) in ((1,), (2,))
+    assert "large-2" not in recorder.started
+    large_1.set()
+    wait_started(recorder, "large-2")
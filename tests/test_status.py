@@ -0,0 +1,78 @@
+import pytest
+
+from app import app, db, uploader
+from app.attack.status import parse_status_line
+from app.login import User
+from app.uploader import StatusSample, UploadedTask, record_status, status_samples
+
+STATUS_LINE = ("STATUS\t3\tSPEED\t1203456\t1000\t1189000\t1000\tEXEC_RUNTIME\t95.312000\t96.001000\t"
+               "CURKU\t1515520\tPROGRESS\t3031040\t14344384\tRECHASH\t0\t2\tRECSALT\t0\t1\t"
+               "TEMP\t71\t83\tREJECTED\t1024\tUTIL\t99\t97\t")
+
+
+def status_line(progress_done: int, progress_total: int = 100) -> str:
+    return f"STATUS\t3\tSPEED\t1000\t1000\tCURKU\t{progress_done}\tPROGRESS\t{progress_done}\t{progress_total}\t"
+
+
+def test_parse_status_line():
+    status = parse_status_line(STATUS_LINE, devices=(2, 3))
+    assert status.status_name == "Running"
+    assert status.speed == 1203456 + 1189000
+    assert [device.device_id for device in status.devices] == [2, 3]
+    assert status.devices[0].exec_runtime == 95.312
+    assert status.devices[1].temperature == 83 and status.devices[1].utilization == 97
+    assert round(status.progress, 2) == 21.13
+    assert status.restore_point == 1515520
+    assert (status.recovered_hashes, status.total_hashes) == (0, 2)
+    assert status.rejected == 1024
+
+
+def test_parse_status_line_defaults():
+    status = parse_status_line(status_line(0, progress_total=0))
+    # the devices are numbered from 1
+    assert [device.device_id for device in status.devices] == [1]
+    assert status.devices[0].temperature is None
+    assert status.progress == 0.
+    assert parse_status_line("STATUS\t42\tPROGRESS\t0\t0\t").status_name == "Unknown (42)"
+
+
+def test_parse_not_status_line():
+    assert parse_status_line("Session..........: hashcat") is None
+
+
+@pytest.mark.parametrize("line", ["STATUS\t3\tPROGRESS\t1\t", "STATUS\t3\t4\tPROGRESS\t1\t2\t",
+                                  "STATUS\t3\tPROGRESS\t1\tx2\t"])
+def test_parse_invalid_status_line(line):
+    with pytest.raises(ValueError):
+        parse_status_line(line)
+
+
+@pytest.fixture
+def task_id():
+    with app.app_context():
+        user = User.query.filter_by(username='guest').first()
+        task = UploadedTask(user_id=user.id, filename="status_test")
+        db.session.add(task)
+        db.session.commit()
+        task_id = task.id
+    yield task_id
+    with app.app_context():
+        StatusSample.query.filter_by(task_id=task_id).delete()
+        UploadedTask.query.filter_by(id=task_id).delete()
+        db.session.commit()
+
+
+def test_record_status_thinning(task_id, monkeypatch):
+    samples_max = 5
+    monkeypatch.setattr(uploader, 'STATUS_SAMPLES_MAX', samples_max)
+    for progress_done in range(1, 21):
+        record_status(task_id, parse_status_line(status_line(progress_done)), stage="main_wordlist")
+        with app.app_context():
+            samples = status_samples(task_id)
+        progress = [sample['progress'] for sample in samples]
+        assert len(samples) <= samples_max
+        # the first and the latest samples are kept, in order
+        assert progress[0] == 1. and progress[-1] == progress_done
+        assert progress == sorted(progress)
+    assert {sample['stage'] for sample in samples} == {"main_wordlist"}
+    assert samples[-1]['restore_point'] == 20
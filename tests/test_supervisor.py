@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from app.attack import supervisor
+from app.attack.supervisor import supervise
+from app.domain import ProgressLock
+
+HASHCAT_ARGS = ['hashcat', '-m', '22000', 'capture.22000']
+
+
+@pytest.fixture
+def stub_log(tmp_path, monkeypatch):
+    log_path = tmp_path / "hashcat.log"
+    monkeypatch.setenv('HASHCAT_STUB_LOG', str(log_path))
+    monkeypatch.setenv('HASHCAT_STUB_SLEEP', '60')
+    monkeypatch.setattr(supervisor, 'HASHCAT_STOP_GRACE', 0.5)
+    monkeypatch.setattr(supervisor, 'SUPERVISOR_POLL', 0.05)
+
+    def stub_log():
+        # the args and the received signals
+        return log_path.read_text().splitlines()
+
+    return stub_log
+
+
+def cancel_later(lock: ProgressLock, delay=0.5) -> threading.Timer:
+    timer = threading.Timer(delay, lock.cancel)
+    timer.start()
+    return timer
+
+
+def test_cancel(stub_log):
+    lock = ProgressLock(task_id=0)
+    cancel_later(lock)
+    start = time.monotonic()
+    with pytest.raises(InterruptedError):
+        supervise(HASHCAT_ARGS, lock=lock)
+    assert time.monotonic() - start < 2
+    # hashcat quits on SIGINT and saves its restore point
+    assert stub_log() == [' '.join(HASHCAT_ARGS[1:]), 'SIGINT']
+
+
+def test_cancel_escalates_signals(stub_log, monkeypatch):
+    monkeypatch.setenv('HASHCAT_STUB_SIGNALS', 'ignore')
+    lock = ProgressLock(task_id=0)
+    cancel_later(lock)
+    start = time.monotonic()
+    with pytest.raises(InterruptedError):
+        supervise(HASHCAT_ARGS, lock=lock)
+    elapsed = time.monotonic() - start
+    # SIGINT, SIGTERM after the grace period, SIGKILL after another one
+    assert 0.5 + 2 * supervisor.HASHCAT_STOP_GRACE <= elapsed < 5
+    assert stub_log() == [' '.join(HASHCAT_ARGS[1:]), 'SIGINT', 'SIGTERM']
+
+
+def test_deadline(stub_log):
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        supervise(HASHCAT_ARGS, deadline=time.monotonic() + 0.5)
+    assert time.monotonic() - start < 2
+    assert stub_log()[-1] == 'SIGINT'
+
+
+def test_status_lines(stub_log, monkeypatch):
+    monkeypatch.setenv('HASHCAT_STUB_SLEEP', '0.3')
+    lines = []
+    stdout, stderr = supervise(HASHCAT_ARGS, on_line=lines.append)
+    assert lines
+    assert all(line.startswith("STATUS\t") and line.endswith('\n') for line in lines)
+    assert ''.join(lines) == stdout
+    assert stderr == ''
+
+
+def test_stdin_candidates():
+    candidates = [f"password{i}" for i in range(10 ** 5)]
+    # the stub `hashcat --stdout` prints the candidates of its stdin
+    stdout, stderr = supervise(['hashcat', '--stdout'], candidates=iter(candidates))
+    assert stdout.splitlines() == candidates
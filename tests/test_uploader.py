@@ -0,0 +1,56 @@
+import sqlalchemy
+
+from app import app, db
+from app.domain import TaskInfoStatus
+from app.uploader import UploadedTask, add_missing_columns
+
+# the uploads table before the tasks were resumable
+BASELINE_UPLOADS = """
+CREATE TABLE uploads (
+    id INTEGER NOT NULL,
+    user_id INTEGER,
+    filename VARCHAR(128),
+    wordlist VARCHAR(128),
+    rule VARCHAR(128),
+    hashcat_args VARCHAR(1024),
+    uploaded_time DATETIME,
+    duration DATETIME,
+    status VARCHAR(256),
+    found_key VARCHAR(256),
+    completed BOOLEAN,
+    essid VARCHAR(64),
+    bssid VARCHAR(64),
+    PRIMARY KEY (id)
+)
+"""
+
+
+def test_add_missing_columns(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(BASELINE_UPLOADS))
+        conn.execute(sqlalchemy.text("INSERT INTO uploads (id, filename, duration, status, completed) "
+                                     "VALUES (1, 'capture.pcapng', '1970-01-01 00:00:00', 'Completed', 1)"))
+    add_missing_columns(engine)
+    columns = {column['name'] for column in sqlalchemy.inspect(engine).get_columns('uploads')}
+    assert columns == set(UploadedTask.__table__.columns.keys())
+    indexes = {index['name'] for index in sqlalchemy.inspect(engine).get_indexes('uploads')}
+    assert {index.name for index in UploadedTask.__table__.indexes} <= indexes
+    with sqlalchemy.orm.Session(engine) as session:
+        task = session.get(UploadedTask, 1)
+        assert (task.status, task.file_22000, task.duplicates) == (TaskInfoStatus.COMPLETED, None, 0)
+        session.add(UploadedTask(filename="new.pcapng", checksum="0" * 32, stage="main_wordlist"))
+        session.commit()
+    # idempotent
+    add_missing_columns(engine)
+
+
+def test_add_missing_columns_noop():
+    with app.app_context():
+        inspector = sqlalchemy.inspect(db.engine)
+        columns_before = {table: [column['name'] for column in inspector.get_columns(table)]
+                          for table in inspector.get_table_names()}
+        add_missing_columns()
+        inspector = sqlalchemy.inspect(db.engine)
+        assert {table: [column['name'] for column in inspector.get_columns(table)]
+                for table in inspector.get_table_names()} == columns_before
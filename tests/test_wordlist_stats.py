@@ -0,0 +1,66 @@
+import hashlib
+import threading
+
+from app.word_magic import wordlist_stats as stats_module
+from app.word_magic.wordlist_stats import scan_wordlist, wordlist_stats
+
+
+def test_scan_wordlist(tmp_path):
+    lines = [b'password', b'short', b'', b'x' * 70, b'windows\r', b'12345678\r', b'last']
+    wordlist_path = tmp_path / "wordlist.txt"
+    wordlist_path.write_bytes(b'\n'.join(lines))
+    stats = scan_wordlist(wordlist_path)
+    # the last line has no newline
+    assert stats.count == len(lines) and stats.count_wpa == 2, stats
+    assert stats.histogram[8] == 2 and stats.histogram[70] == 1
+    assert stats.md5 == hashlib.md5(b'\n'.join(lines)).hexdigest()
+
+
+def test_scan_chunks(tmp_path, monkeypatch):
+    # lines across the chunk boundaries
+    monkeypatch.setattr(stats_module, 'STATS_CHUNK_SIZE', 7)
+    wordlist_path = tmp_path / "wordlist.txt"
+    wordlist_path.write_bytes(b"password1\nshort\npassword2\n")
+    stats = scan_wordlist(wordlist_path)
+    assert (stats.count, stats.count_wpa) == (3, 2)
+
+
+def test_sidecar(tmp_path):
+    wordlist_path = tmp_path / "wordlist.txt"
+    wordlist_path.write_text("password\n")
+    assert wordlist_stats(wordlist_path, scan=False) is None
+    assert wordlist_stats(wordlist_path).count_wpa == 1
+    assert wordlist_stats(wordlist_path, scan=False).count_wpa == 1
+    # the outdated sidecar is ignored
+    wordlist_path.write_text("password\npassword\n")
+    assert wordlist_stats(wordlist_path, scan=False) is None
+    assert wordlist_stats(wordlist_path).count_wpa == 2
+    assert wordlist_stats(tmp_path / "missing.txt") is None
+
+
+def test_scan_does_not_block_other_wordlists(tmp_path, monkeypatch):
+    slow_path, fast_path = tmp_path / "slow.txt", tmp_path / "fast.txt"
+    slow_path.write_text("password\n")
+    fast_path.write_text("password\n")
+    scanning, release = threading.Event(), threading.Event()
+    scanned = []
+
+    def scan_slowly(path):
+        scanned.append(path)
+        if path == slow_path:
+            scanning.set()
+            assert release.wait(timeout=10)
+        return scan_wordlist(path)
+
+    monkeypatch.setattr(stats_module, 'scan_wordlist', scan_slowly)
+    threads = [threading.Thread(target=wordlist_stats, args=(slow_path,)) for _ in range(2)]
+    threads[0].start()
+    assert scanning.wait(timeout=10)
+    threads[1].start()
+    assert wordlist_stats(fast_path).count_wpa == 1
+    release.set()
+    for thread in threads:
+        thread.join(timeout=10)
+    # the concurrent calls share the scan
+    assert scanned == [slow_path, fast_path]
+    assert wordlist_stats(slow_path, scan=False).count_wpa == 1
@@ -0,0 +1,115 @@
+import concurrent.futures
+import os
+import subprocess
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from app import app, db
+from app.attack import scheduler
+from app.attack.potfile import hash_id_of_key_line, hash_id_of_line
+from app.attack.worker import HashcatWorker, _distribute_keys
+from app.domain import ProgressLock, ProgressLockGroup, TaskInfoStatus
+from app.login import User
+from app.uploader import UploadedTask
+
+AP, STA_1, STA_2 = "aabbccddeeff", "112233445566", "665544332211"
+MIC_1, MIC_2 = "1" * 32, "2" * 32
+
+
+def hash_line(mic: str, sta: str, essid: bytes) -> str:
+    return f"WPA*02*{mic}*{AP}*{sta}*{essid.hex()}*{'a' * 64}*{'b' * 198}*00"
+
+
+def test_hash_id_of_key_line():
+    line = hash_line(MIC_1, STA_1, b"Petit:Cafe\n")
+    # hashcat writes the ESSIDs with a ':' or unprintable in the $HEX[] notation
+    key_line = f"{MIC_1}:{AP}:{STA_1}:$HEX[{b'Petit:Cafe'.hex()}0a]:pass:word"
+    assert hash_id_of_key_line(key_line) == hash_id_of_line(line)
+    assert hash_id_of_key_line(f"{MIC_2}:{AP}:{STA_2}:Home:password") == \
+        hash_id_of_line(hash_line(MIC_2, STA_2, b"Home"))
+
+
+def test_distribute_keys(tmp_path):
+    # the tasks share the AP but not the handshakes
+    attacks = []
+    for task_id, line in enumerate((hash_line(MIC_1, STA_1, b"Home"), hash_line(MIC_2, STA_2, b"Home"))):
+        file_22000 = tmp_path / f"{task_id}.22000"
+        file_22000.write_text(f"{line}\n")
+        attacks.append(SimpleNamespace(lock=ProgressLock(task_id=task_id), file_22000=file_22000,
+                                       key_file=file_22000.with_suffix('.key')))
+    key_line = f"{MIC_2}:{AP}:{STA_2}:Home:password"
+    _distribute_keys([key_line], attacks)
+    assert not attacks[0].key_file.exists()
+    assert attacks[1].key_file.read_text() == f"{key_line}\n"
+
+
+def test_cancelled_lock_is_detached_from_group():
+    locks = [ProgressLock(task_id=task_id) for task_id in range(3)]
+    group = ProgressLockGroup(locks)
+    locks[0].cancel()
+    with group:
+        group.set_status("Running")
+        group.progress = 50
+    assert group.locks == tuple(locks[1:])
+    assert (locks[0].status, locks[0].progress) == (TaskInfoStatus.CANCELLED, 0)
+    assert not group.cancelled
+    for lock in locks[1:]:
+        lock.cancel()
+    assert group.cancelled
+
+
+def test_import_without_hashcat(tmp_path):
+    # the devices are not discovered when the app is imported
+    env = dict(os.environ, PATH=str(tmp_path), HOME=str(tmp_path))
+    completed = subprocess.run([sys.executable, '-c', 'import app'], env=env, cwd=Path(__file__).parents[1],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+    assert completed.returncode == 0, completed.stderr
+    assert "Traceback" not in completed.stderr
+
+
+def test_del_partially_initialized_worker():
+    HashcatWorker.__new__(HashcatWorker).__del__()
+
+
+@pytest.fixture
+def worker():
+    scheduler.hashcat_devices.cache_clear()
+    worker = HashcatWorker(app, consume=False)
+    yield worker
+    worker.scheduler.shutdown()
+
+
+@pytest.fixture
+def task_id():
+    with app.app_context():
+        user = User.query.filter_by(username='guest').first()
+        task = UploadedTask(user_id=user.id, filename="worker_test")
+        db.session.add(task)
+        db.session.commit()
+        task_id = task.id
+    yield task_id
+    with app.app_context():
+        UploadedTask.query.filter_by(id=task_id).delete()
+        db.session.commit()
+
+
+def test_cancel_running_task(worker, task_id):
+    # a task of a coalesced run that goes on for the other tasks
+    future = concurrent.futures.Future()
+    assert future.set_running_or_notify_cancel()
+    lock = ProgressLock(task_id=task_id)
+    lock.future = future
+    worker.locks[id(future)] = lock
+    future.add_done_callback(worker.callback_attack)
+    assert worker.cancel(task_id)
+    with app.app_context():
+        task = db.session.get(UploadedTask, task_id)
+        assert (task.status, task.completed) == (TaskInfoStatus.CANCELLED, True)
+    # the run finishes later and leaves the task as it is
+    future.set_result(None)
+    with app.app_context():
+        assert db.session.get(UploadedTask, task_id).status == TaskInfoStatus.CANCELLED
+    assert id(future) not in worker.locks